@@ -0,0 +1,161 @@
+"""Benchmark the memory and latency of polling a large cluster's nodes.
+
+Compares materializing boto3 `ec2.Instance` resources (the previous
+behaviour of `non_terminated_nodes`) with the provider's NodeRecords built
+from the raw DescribeInstances pages. No AWS account is needed: responses
+are served from memory, copied for every call as if parsed off the wire.
+
+    python benchmarks/aws_node_records.py --nodes 5000
+"""
+import argparse
+import copy
+import time
+import tracemalloc
+
+import boto3
+from botocore.awsrequest import AWSResponse
+
+from clusterman.autoscaler._private.aws.node_provider import AWSNodeProvider
+
+PAGE_SIZE = 1000
+
+
+def make_pages(num_nodes):
+    """DescribeInstances pages for `num_nodes` running instances, with about
+    as much detail per instance as EC2 returns."""
+    instances = []
+    for i in range(num_nodes):
+        ip = "10.{}.{}.{}".format(i // 65536, i // 256 % 256, i % 256)
+        instances.append({
+            "InstanceId": "i-{:017x}".format(i),
+            "ImageId": "ami-0123456789abcdef0",
+            "InstanceType": "m5.large",
+            "KeyName": "cls-key",
+            "LaunchTime": "2024-01-01T00:00:00Z",
+            "Placement": {
+                "AvailabilityZone": "us-west-2a",
+                "Tenancy": "default"
+            },
+            "PrivateDnsName": "ip-{}.us-west-2.compute.internal".format(
+                ip.replace(".", "-")),
+            "PrivateIpAddress": ip,
+            "PublicIpAddress": "54.{}.{}.{}".format(i // 65536,
+                                                    i // 256 % 256, i % 256),
+            "State": {
+                "Code": 16,
+                "Name": "running"
+            },
+            "SubnetId": "subnet-0123456789abcdef0",
+            "VpcId": "vpc-0123456789abcdef0",
+            "SecurityGroups": [{
+                "GroupName": "cls-sg",
+                "GroupId": "sg-0123456789abcdef0"
+            }],
+            "BlockDeviceMappings": [{
+                "DeviceName": "/dev/sda1",
+                "Ebs": {
+                    "VolumeId": "vol-{:017x}".format(i),
+                    "Status": "attached",
+                    "DeleteOnTermination": True
+                }
+            }],
+            "Tags": [{
+                "Key": "cls-cluster-name",
+                "Value": "bench"
+            }, {
+                "Key": "cls-node-type",
+                "Value": "worker"
+            }, {
+                "Key": "cls-node-status",
+                "Value": "up-to-date"
+            }, {
+                "Key": "Name",
+                "Value": "cls-bench-worker"
+            }],
+        })
+    pages = []
+    for start in range(0, num_nodes, PAGE_SIZE):
+        page = {
+            "Reservations": [{
+                "ReservationId": "r-{:017x}".format(start),
+                "OwnerId": "123456789012",
+                "Instances": instances[start:start + PAGE_SIZE]
+            }]
+        }
+        if start + PAGE_SIZE < num_nodes:
+            page["NextToken"] = str(start + PAGE_SIZE)
+        pages.append(page)
+    return pages
+
+
+def stubbed_ec2(pages):
+    ec2 = boto3.resource(
+        "ec2",
+        region_name="us-west-2",
+        aws_access_key_id="bench",
+        aws_secret_access_key="bench")
+    remaining = list(pages)
+
+    def describe_instances(**kwargs):
+        # Returning a response from before-call skips the HTTP request.
+        return (AWSResponse(None, 200, {}, None),
+                copy.deepcopy(remaining.pop(0)))
+
+    ec2.meta.client.meta.events.register(
+        "before-call.ec2.DescribeInstances", describe_instances)
+    return ec2
+
+
+def poll_resources(ec2):
+    filters = [{
+        "Name": "instance-state-name",
+        "Values": ["pending", "running"]
+    }, {
+        "Name": "tag:cls-cluster-name",
+        "Values": ["bench"]
+    }]
+    nodes = list(ec2.instances.filter(Filters=filters))
+    tag_cache = {
+        node.id: {x["Key"]: x["Value"]
+                  for x in node.tags}
+        for node in nodes
+    }
+    return {node.id: node for node in nodes}, tag_cache
+
+
+def poll_records(provider):
+    provider.non_terminated_nodes({})
+    return provider.cached_nodes, provider.tag_cache
+
+
+def measure(name, poll, target):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = poll(target)
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("{:<10} {:8.3f}s  retained {:8.1f} MiB  peak {:8.1f} MiB".format(
+        name, elapsed, retained / 2**20, peak / 2**20))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nodes", type=int, default=5000)
+    args = parser.parse_args()
+
+    pages = make_pages(args.nodes)
+    print("{} nodes".format(args.nodes))
+    nodes, _ = measure("resources", poll_resources, stubbed_ec2(pages))
+    assert len(nodes) == args.nodes
+    del nodes
+
+    provider = AWSNodeProvider({"region": "us-west-2"}, "bench")
+    provider.ec2 = stubbed_ec2(pages)
+    nodes, tags = measure("records", poll_records, provider)
+    assert len(nodes) == args.nodes and len(tags) == args.nodes
+
+
+if __name__ == "__main__":
+    main()
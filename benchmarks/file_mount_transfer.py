@@ -0,0 +1,100 @@
+"""Benchmark rsync against tar streaming for file mounts of many small files.
+
+Builds a synthetic tree locally and uploads it to a scratch directory on a
+reachable host with each transfer, starting from an empty directory every
+time. Requires ssh access to the host and rsync, tar (and zstd) on both
+ends.
+
+    python benchmarks/file_mount_transfer.py --host 10.0.0.12 \\
+        --ssh-user ubuntu --ssh-private-key ~/.ssh/cluster.pem
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import clusterman.autoscaler._private.subprocess_output_util as cmd_output_util
+from clusterman.autoscaler._private.command_runner import SSHCommandRunner, set_rsync_silent, set_using_login_shells
+
+REMOTE_DIR = "~/cls-transfer-bench"
+
+
+class StaticIPProvider:
+    """Just enough of a NodeProvider to point a command runner at a host."""
+
+    def __init__(self, ip):
+        self.ip = ip
+
+    def external_ip(self, node_id):
+        return self.ip
+
+    internal_ip = external_ip
+
+    def is_terminated(self, node_id):
+        return False
+
+
+def make_tree(root, num_files, file_size, files_per_dir=100):
+    for i in range(num_files):
+        dirpath = os.path.join(root, "pkg{}".format(i // files_per_dir))
+        os.makedirs(dirpath, exist_ok=True)
+        with open(os.path.join(dirpath, "mod{}.py".format(i)), "wb") as f:
+            # Source-like content: compressible, not all identical.
+            line = "value_{} = {!r}\n".format(i, "x" * 40).encode("utf-8")
+            f.write((line * (file_size // len(line) + 1))[:file_size])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", required=True)
+    parser.add_argument("--ssh-user", default="ubuntu")
+    parser.add_argument("--ssh-private-key")
+    parser.add_argument(
+        "--internal",
+        action="store_true",
+        help="Treat the host as reachable over the internal network.")
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--file-size", type=int, default=4096)
+    args = parser.parse_args()
+
+    set_using_login_shells(False)
+    cmd_output_util.set_allow_interactive(False)
+    set_rsync_silent(True)
+    auth = {"ssh_user": args.ssh_user}
+    if args.ssh_private_key:
+        auth["ssh_private_key"] = args.ssh_private_key
+    runner = SSHCommandRunner("bench: ", "bench", StaticIPProvider(args.host),
+                              auth, "bench", subprocess, args.internal)
+
+    workdir = tempfile.mkdtemp(prefix="cls-transfer-bench-")
+    try:
+        make_tree(workdir, args.files, args.file_size)
+        total_mb = args.files * args.file_size / 2**20
+        print("{} files, {:.1f} MiB".format(args.files, total_mb))
+
+        transfers = [
+            ("rsync -avz", lambda: runner.run_rsync_up(
+                workdir + "/", REMOTE_DIR + "/")),
+        ]
+        for compression in ["none", "gzip", "zstd"]:
+            transfers.append(("tar ({})".format(compression),
+                              lambda c=compression: runner.run_tar_up(
+                                  workdir + "/", REMOTE_DIR + "/",
+                                  {"compression": c})))
+
+        for name, transfer in transfers:
+            runner.run("rm -rf {0} && mkdir -p {0}".format(REMOTE_DIR))
+            start = time.perf_counter()
+            transfer()
+            elapsed = time.perf_counter() - start
+            print("{:<14} {:8.2f}s {:8.1f} files/s".format(
+                name, elapsed, args.files / elapsed))
+        runner.run("rm -rf {}".format(REMOTE_DIR))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
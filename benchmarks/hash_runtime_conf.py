@@ -0,0 +1,99 @@
+"""Benchmark `hash_runtime_conf` on a large synthetic file mount.
+
+Builds a tree of random files and times hashing it with a cold file hash
+cache, a warm one (as seen by a fresh CLI invocation), and after touching a
+fraction of the files.
+
+    python benchmarks/hash_runtime_conf.py --files 20000 --file-size 65536
+    python benchmarks/hash_runtime_conf.py --algorithm blake2b --threads 1
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from clusterman.autoscaler._private import util
+from clusterman.autoscaler._private.file_hash_cache import FileHashCache
+
+
+def make_tree(root, num_files, file_size, files_per_dir=500):
+    for i in range(num_files):
+        dirpath = os.path.join(root, "d{}".format(i // files_per_dir))
+        os.makedirs(dirpath, exist_ok=True)
+        with open(os.path.join(dirpath, "f{}".format(i)), "wb") as f:
+            f.write(os.urandom(file_size))
+    # Backdate everything so that no file is inside the racy mtime window.
+    past = time.time() - 60
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            os.utime(os.path.join(dirpath, name), (past, past))
+
+
+def timed_hash(file_mounts, cache_path, algorithm):
+    # Simulate a fresh process: no in-memory state survives between runs.
+    util._hash_cache.clear()
+    util._file_hash_cache = FileHashCache(cache_path)
+    start = time.perf_counter()
+    hashes = util.hash_runtime_conf(
+        file_mounts,
+        None, {},
+        generate_file_mounts_contents_hash=True,
+        hash_algorithm=algorithm)
+    return time.perf_counter() - start, hashes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--file-size", type=int, default=64 * 1024)
+    parser.add_argument(
+        "--touch-fraction",
+        type=float,
+        default=0.01,
+        help="Fraction of files modified before the last run.")
+    parser.add_argument(
+        "--algorithm", choices=["sha1", "blake2b"], default="sha1")
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=util.constants.FILE_HASH_THREADS,
+        help="Threads used to hash files (1 hashes serially).")
+    args = parser.parse_args()
+    util.constants.FILE_HASH_THREADS = args.threads
+
+    workdir = tempfile.mkdtemp(prefix="cls-hash-bench-")
+    try:
+        tree = os.path.join(workdir, "tree")
+        cache_path = os.path.join(workdir, "cache.json")
+        make_tree(tree, args.files, args.file_size)
+        file_mounts = {"/remote/tree": tree}
+        total_mb = args.files * args.file_size / 2**20
+        print("{} files, {:.0f} MiB".format(args.files, total_mb))
+
+        cold, cold_hashes = timed_hash(file_mounts, None, args.algorithm)
+        print("no cache:      {:8.3f}s".format(cold))
+        populate, _ = timed_hash(file_mounts, cache_path, args.algorithm)
+        print("cold cache:    {:8.3f}s".format(populate))
+        warm, warm_hashes = timed_hash(file_mounts, cache_path, args.algorithm)
+        print("warm cache:    {:8.3f}s ({:.1f}x)".format(warm, cold / warm))
+        assert warm_hashes == cold_hashes
+
+        touched = int(args.files * args.touch_fraction)
+        past = time.time() - 30
+        for i in range(touched):
+            path = os.path.join(tree, "d{}".format(i // 500), "f{}".format(i))
+            with open(path, "wb") as f:
+                f.write(os.urandom(args.file_size))
+            os.utime(path, (past, past))
+        partial, partial_hashes = timed_hash(file_mounts, cache_path, args.algorithm)
+        print("{} modified:  {:8.3f}s".format(touched, partial))
+        assert partial_hashes[1] != cold_hashes[1]
+        fresh, fresh_hashes = timed_hash(file_mounts, None, args.algorithm)
+        assert fresh_hashes == partial_hashes
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import clusterman.autoscaler._private.subprocess_output_util as cmd_output_util
+from clusterman.autoscaler._private.cli_logger import cf, cli_logger
+from clusterman.autoscaler._private.command_runner import (
+    AUTOSCALER_NODE_START_WAIT_S,
+    ProcessRunnerError,
+    SSHCommandRunner,
+    SSHOptions,
+    is_rsync_silent
+)
+from clusterman.autoscaler._private.constants import AUTOSCALER_MAX_CONCURRENT_UPDATERS
+from clusterman.autoscaler._private.event_system import CreateClusterEvent, global_event_system
+from clusterman.autoscaler._private.log_timer import LogTimer
+from clusterman.autoscaler._private.updater import READY_CHECK_INTERVAL, NodeUpdater, sync_throughput
+from clusterman.autoscaler.tags import (
+    STATUS_SETTING_UP,
+    STATUS_SYNCING_FILES,
+    STATUS_UP_TO_DATE,
+    STATUS_UPDATE_FAILED,
+    STATUS_WAITING_FOR_SSH,
+    TAG_FILE_MOUNTS_CONTENTS,
+    TAG_NODE_STATUS,
+    TAG_RUNTIME_CONFIG
+)
+
+logger = logging.getLogger(__name__)
+
+IP_CHECK_INTERVAL = 10
+# Provider calls (tag updates, IP lookups) are blocking, so they run on a
+# small thread pool instead of the event loop.
+MAX_PROVIDER_CALL_THREADS = 64
+# Transfers that can't run as native subprocesses (tar pipelines, manifest
+# comparison, relays) block a thread for as long as they run, so they get
+# their own pool and can't starve provider calls.
+MAX_TRANSFER_THREADS = 256
+# ssh only bounds connecting, a readiness probe that hangs after that is
+# killed after this many seconds.
+READY_CHECK_TIMEOUT_S = 30
+# Before Python 3.8, event loops can only reap subprocesses from the main
+# thread, and the scheduler runs its loop in a background thread.
+ASYNC_ENGINE_SUPPORTED = sys.version_info >= (3, 8)
+
+
+class AsyncNodeUpdater(NodeUpdater):
+    """A NodeUpdater whose phases run as a coroutine on an event loop.
+
+    ssh and rsync are spawned with `asyncio.create_subprocess_exec` and
+    retries use `asyncio.sleep`, so a single thread can drive many nodes.
+    The phases and node status tags are the same as for `NodeUpdater`.
+
+    Only plain SSH command runners are driven natively. Other command
+    runners (e.g. docker) fall back to the blocking `run` in an executor.
+
+    Takes the same arguments as `NodeUpdater`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        NodeUpdater.__init__(self, *args, **kwargs)
+        self.exitcode = -1
+
+    async def run_async(self, executor=None, transfer_executor=None):
+        loop = asyncio.get_event_loop()
+        self._executor = executor
+        self._transfer_executor = transfer_executor
+        if type(self.cmd_runner) is not SSHCommandRunner:
+            await loop.run_in_executor(transfer_executor, self.run)
+            return
+        self.check_output_settings()
+
+        try:
+            with LogTimer(self.log_prefix +
+                          "Applied config {}".format(self.runtime_hash)):
+                await self.do_update_async()
+        except Exception as e:
+            await self._call(self.provider.set_node_tags, self.node_id,
+                             {TAG_NODE_STATUS: STATUS_UPDATE_FAILED})
+            cli_logger.error("{}New status: {}", self.log_prefix,
+                             cf.bold(STATUS_UPDATE_FAILED))
+            if isinstance(e, ProcessRunnerError):
+                cli_logger.error("{}Command `{}` failed with exit code {}.",
+                                 self.log_prefix, cf.bold(e.command), e.code)
+            else:
+                cli_logger.error("{}{}", self.log_prefix, str(e))
+            return
+
+        tags_to_set = {
+            TAG_NODE_STATUS: STATUS_UP_TO_DATE,
+            TAG_RUNTIME_CONFIG: self.runtime_hash,
+        }
+        if self.file_mounts_contents_hash is not None:
+            tags_to_set[
+                TAG_FILE_MOUNTS_CONTENTS] = self.file_mounts_contents_hash
+
+        await self._call(self.provider.set_node_tags, self.node_id,
+                         tags_to_set)
+        cli_logger.labeled_value(self.log_prefix + "New status",
+                                 STATUS_UP_TO_DATE)
+
+        self.exitcode = 0
+
+    async def _call(self, fn, *args, **kwargs):
+        """Run a blocking (provider) call without blocking the loop."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor,
+                                          partial(fn, *args, **kwargs))
+
+    async def _transfer(self, fn, *args, **kwargs):
+        """Run a blocking transfer without blocking the loop or the
+        provider calls."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._transfer_executor,
+                                          partial(fn, *args, **kwargs))
+
+    async def _set_status(self, status):
+        await self._call(self.provider.set_node_tags, self.node_id,
+                         {TAG_NODE_STATUS: status})
+        cli_logger.labeled_value(self.log_prefix + "New status", status)
+
+    async def _exec(self, cmd, timeout=None, silent=False, with_output=False):
+        """Run a command, raising ProcessRunnerError if it fails."""
+        stdout = None
+        log_file = None
+        if with_output:
+            stdout = asyncio.subprocess.PIPE
+        elif silent and cli_logger.verbosity < 1:
+            stdout = asyncio.subprocess.DEVNULL
+        elif cmd_output_util.is_output_redirected():
+            log_file = open(
+                os.path.join(tempfile.gettempdir(), "cls-up-{}-{}.txt".format(
+                    cmd[0], time.time())),
+                mode="w")
+            stdout = log_file
+        stderr = stdout if stdout is not asyncio.subprocess.PIPE else None
+
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=stdout,
+                stderr=stderr)
+            try:
+                output, _ = await asyncio.wait_for(
+                    proc.communicate(), timeout=timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                raise ProcessRunnerError(
+                    "Command timed out",
+                    "ssh_command_failed",
+                    command=" ".join(cmd),
+                    special_case="ssh_timeout") from None
+        finally:
+            if log_file is not None:
+                log_file.close()
+
+        if proc.returncode != 0:
+            raise ProcessRunnerError(
+                "Command failed",
+                "ssh_command_failed",
+                code=proc.returncode,
+                command=" ".join(cmd))
+        return output
+
+    async def _run_remote(self,
+                          cmd,
+                          timeout=120,
+                          ssh_options_override_ssh_key="",
+                          silent=False,
+                          process_timeout=None):
+        """Run `cmd` on the node. `timeout` is the ssh connect timeout, the
+        command is killed if it takes more than `process_timeout` seconds
+        in total."""
+        if ssh_options_override_ssh_key:
+            ssh_options = SSHOptions(ssh_options_override_ssh_key)
+        else:
+            ssh_options = self.cmd_runner.ssh_options
+        final_cmd = self.cmd_runner._ssh_command(
+            cmd, ssh_options, timeout=timeout)
+        cli_logger.verbose("{}Running `{}`", self.log_prefix, cf.bold(cmd))
+        return await self._exec(
+            final_cmd, timeout=process_timeout, silent=silent)
+
+    async def _wait_for_ip(self, deadline):
+        runner = self.cmd_runner
+        while time.time() < deadline:
+            ip = await self._call(runner._get_node_ip)
+            if ip is not None:
+                runner.ssh_ip = ip
+                try:
+                    os.makedirs(
+                        runner.ssh_control_path, mode=0o700, exist_ok=True)
+                except OSError as e:
+                    cli_logger.warning("{}", str(e))
+                cli_logger.labeled_value(self.log_prefix + "Fetched IP", ip)
+                return
+            if await self._call(self.provider.is_terminated, self.node_id):
+                break
+            await asyncio.sleep(IP_CHECK_INTERVAL)
+        raise RuntimeError("Unable to find IP of node")
+
+    async def wait_ready_async(self, deadline):
+        if self.cmd_runner.ssh_ip is None:
+            await self._wait_for_ip(deadline)
+
+        while time.time() < deadline and not await self._call(
+                self.provider.is_terminated, self.node_id):
+            try:
+                await self._run_remote(
+                    "uptime",
+                    timeout=5,
+                    silent=True,
+                    process_timeout=READY_CHECK_TIMEOUT_S)
+                cli_logger.success("{}SSH is available.", self.log_prefix)
+                return
+            except ProcessRunnerError:
+                cli_logger.verbose(
+                    "{}SSH still not available, retrying in {} seconds.",
+                    self.log_prefix, cf.bold(str(READY_CHECK_INTERVAL)))
+                await asyncio.sleep(READY_CHECK_INTERVAL)
+
+        raise RuntimeError("Unable to connect to node")
+
+    async def sync_file_mounts_async(self):
+        async def do_sync(remote_path, local_path,
+                          allow_non_existing_paths=False):
+            if allow_non_existing_paths and not os.path.exists(local_path):
+                return
+            assert os.path.exists(local_path), local_path
+
+            if os.path.isdir(local_path):
+                if not local_path.endswith("/"):
+                    local_path += "/"
+                if not remote_path.endswith("/"):
+                    remote_path += "/"
+
+            with LogTimer(self.log_prefix +
+                          "Synced {} to {}".format(local_path, remote_path)):
+                await self._run_remote(
+                    "mkdir -p {}".format(os.path.dirname(remote_path)),
+                    silent=True)
+                start = time.time()
+                sent = await self._sync_file_mount_async(
+                    local_path, remote_path)
+                throughput = await self._transfer(
+                    sync_throughput, local_path, sent, time.time() - start)
+                cli_logger.verbose(
+                    "{}{} from {}",
+                    self.log_prefix,
+                    cf.bold(remote_path),
+                    cf.bold(local_path),
+                    _tags=dict(throughput=throughput))
+
+        for remote_path, local_path in self.file_mounts.items():
+            await do_sync(remote_path, local_path)
+        for path in self.cluster_synced_files:
+            await do_sync(path, path, allow_non_existing_paths=True)
+
+    async def _sync_file_mount_async(self, local_path, remote_path):
+        """Like `sync_file_mount`, returns the paths sent."""
+        if (self.rsync_options.get("incremental_file_mounts")
+                or self.file_mount_options(remote_path).get(
+                    "transfer", "rsync") != "rsync"):
+            # Comparing manifests takes a few round trips and tar transfers
+            # run a pipeline, run them off the loop like the relays.
+            return await self._transfer(self.sync_file_mount,
+                                        self.file_mount_sync_cmd(),
+                                        local_path, remote_path)
+        if self.file_mount_broadcaster is not None:
+            # Relaying waits on other nodes, so it runs off the loop.
+            await self._transfer(self.file_mount_broadcaster.sync, self,
+                                 local_path, remote_path)
+            return None
+        # Building the command may check the node's rsync for zstd support.
+        command = await self._transfer(
+            self.cmd_runner._rsync_command,
+            local_path,
+            self.cmd_runner._remote_path(remote_path),
+            options=self.transfer_options(remote_path))
+        await self._exec(command, silent=is_rsync_silent())
+        return None
+
+    async def do_update_async(self):
+        await self._set_status(STATUS_WAITING_FOR_SSH)
+
+        deadline = time.time() + AUTOSCALER_NODE_START_WAIT_S
+        await self.wait_ready_async(deadline)
+        global_event_system.execute_callback(
+            CreateClusterEvent.ssh_control_acquired)
+
+        node_tags = await self._call(self.provider.node_tags, self.node_id)
+        logger.debug("Node tags: {}".format(str(node_tags)))
+
+        # Same decisions as `do_update`, including re-initializing the command
+        # runner of resumed nodes.
+        needs_sync, needs_setup = await self._call(self.plan_update,
+                                                   node_tags)
+        if not needs_sync:
+            cli_logger.print(
+                "{}Configuration already up to date, "
+                "skipping file mounts, initalization and setup commands.",
+                self.log_prefix)
+            return
+
+        await self._set_status(STATUS_SYNCING_FILES)
+        await self.sync_file_mounts_async()
+
+        if not needs_setup:
+            return
+
+        await self._set_status(STATUS_SETTING_UP)
+        with LogTimer(
+                self.log_prefix + "Initialization commands",
+                show_status=True):
+            for cmd in self.initialization_commands:
+                global_event_system.execute_callback(
+                    CreateClusterEvent.run_initialization_cmd,
+                    {"command": cmd})
+                await self._run_remote(
+                    cmd,
+                    ssh_options_override_ssh_key=self.auth_config.get(
+                        "ssh_private_key"))
+        await self._call(
+            self.cmd_runner.run_init,
+            as_head=self.is_head_node,
+            file_mounts=self.file_mounts,
+            sync_run_yet=True)
+        with LogTimer(self.log_prefix + "Setup commands", show_status=True):
+            for cmd in self.setup_commands:
+                global_event_system.execute_callback(
+                    CreateClusterEvent.run_setup_cmd, {"command": cmd})
+                await self._run_remote(cmd)
+
+
+class AsyncNodeUpdaterScheduler:
+    """Runs AsyncNodeUpdaters on an event loop owned by a background thread.
+
+    Has the same interface as `NodeUpdaterScheduler`, but the concurrency
+    limit bounds coroutines rather than threads, so it can be set much
+    higher. Updaters are started in submission order.
+
+    Arguments:
+        max_concurrency: Maximum number of updaters running at once.
+    """
+
+    def __init__(self, max_concurrency=AUTOSCALER_MAX_CONCURRENT_UPDATERS):
+        if not ASYNC_ENGINE_SUPPORTED:
+            cli_logger.abort(
+                "The asyncio updater engine requires Python 3.8 or newer.")
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._cond = threading.Condition()
+        self._queued = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=min(self.max_concurrency, MAX_PROVIDER_CALL_THREADS))
+        self._transfer_executor = ThreadPoolExecutor(
+            max_workers=min(self.max_concurrency, MAX_TRANSFER_THREADS))
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._semaphore = asyncio.run_coroutine_threadsafe(
+            self._make_semaphore(), self._loop).result()
+
+    async def _make_semaphore(self):
+        return asyncio.Semaphore(self.max_concurrency)
+
+    @property
+    def queue_depth(self):
+        """Number of updaters waiting for a free slot."""
+        with self._cond:
+            return self._queued
+
+    @property
+    def in_flight(self):
+        """Number of updaters currently running."""
+        with self._cond:
+            return self._in_flight
+
+    @property
+    def completed(self):
+        """Number of updaters that finished, successfully or not."""
+        with self._cond:
+            return self._completed
+
+    def submit(self, updater):
+        with self._cond:
+            self._queued += 1
+        asyncio.run_coroutine_threadsafe(self._run(updater), self._loop)
+
+    async def _run(self, updater):
+        async with self._semaphore:
+            with self._cond:
+                self._queued -= 1
+                self._in_flight += 1
+            try:
+                await updater.run_async(self._executor,
+                                        self._transfer_executor)
+            except Exception:
+                logger.exception("{}Updater failed.".format(
+                    updater.log_prefix))
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._completed += 1
+                    self._cond.notify_all()
+
+    def wait(self, timeout=None):
+        """Wait until all submitted updaters have finished.
+
+        Returns whether the scheduler is idle once `timeout` has elapsed.
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._queued == 0 and self._in_flight == 0, timeout)
+
+    def close(self):
+        """Wait for all updaters to finish and stop the event loop."""
+        self.wait()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._executor.shutdown()
+        self._transfer_executor.shutdown()
@@ -0,0 +1,124 @@
+"""Thread-safe boto3 clients and resources shared across the process.
+
+boto3 clients are thread-safe but resources and sessions are not. Each
+ClientManager owns one client, shared by all threads so they share its
+pool of HTTP connections, and gives every thread its own resource on top of
+that client.
+"""
+import threading
+from functools import lru_cache
+
+import boto3
+from botocore.config import Config
+
+from clusterman.autoscaler._private.aws.rate_limiter import get_rate_limiter
+from clusterman.autoscaler._private.constants import (
+    AUTOSCALER_MAX_CONCURRENT_LAUNCHES,
+    AWS_MAX_POOL_CONNECTIONS,
+    AWS_POOL_CONNECTIONS_HEADROOM,
+    AWS_RATE_LIMIT,
+    BOTO_MAX_RETRIES
+)
+
+# Number of threads of this process making AWS calls at the same time.
+_max_concurrency = AUTOSCALER_MAX_CONCURRENT_LAUNCHES
+
+
+def set_max_concurrency(concurrency):
+    """Sizes the connection pools of clients made from now on for
+    `concurrency` threads making AWS calls at the same time."""
+    global _max_concurrency
+    _max_concurrency = max(1, int(concurrency))
+
+
+def get_max_pool_connections():
+    """Returns the HTTP connections to keep open per client."""
+    if AWS_MAX_POOL_CONNECTIONS > 0:
+        return AWS_MAX_POOL_CONNECTIONS
+    return _max_concurrency + AWS_POOL_CONNECTIONS_HEADROOM
+
+
+class ClientManager:
+    """Shared client and per-thread resources of a service in a region.
+
+    Arguments:
+        service: Name of the AWS service, e.g. "ec2".
+        region: AWS region.
+        max_retries: Max attempts of each request.
+        aws_credentials: Keyword arguments of `boto3.session.Session`.
+        max_pool_connections: HTTP connections kept open by the client.
+    """
+
+    def __init__(self,
+                 service,
+                 region,
+                 max_retries,
+                 aws_credentials=None,
+                 max_pool_connections=None):
+        self.service = service
+        self._config = Config(
+            retries={"max_attempts": max_retries},
+            max_pool_connections=(max_pool_connections
+                                  or get_max_pool_connections()))
+        self._session = boto3.session.Session(
+            region_name=region, **(aws_credentials or {}))
+        self._session_lock = threading.Lock()
+        self._local = threading.local()
+        self.client = self._session.client(service, config=self._config)
+        if service == "ec2" and AWS_RATE_LIMIT:
+            get_rate_limiter(region).attach(self.client)
+
+    def resource(self):
+        """Returns the resource of the calling thread."""
+        resource = getattr(self._local, "resource", None)
+        if resource is None:
+            with self._session_lock:
+                resource = self._session.resource(
+                    self.service, config=self._config)
+            # Send the resource's requests through the shared client, so that
+            # they reuse its connections and rate limiting.
+            resource.meta.client = self.client
+            self._local.resource = resource
+        return resource
+
+
+class ThreadLocalResource:
+    """Stands in for a boto3 resource, delegating to the resource of the
+    calling thread."""
+
+    def __init__(self, manager):
+        self._manager = manager
+
+    def __getattr__(self, name):
+        return getattr(self._manager.resource(), name)
+
+
+def _freeze(aws_credentials):
+    return tuple(sorted((aws_credentials or {}).items()))
+
+
+@lru_cache()
+def _get_client_manager(service, region, max_retries, frozen_credentials,
+                        max_pool_connections):
+    return ClientManager(service, region, max_retries,
+                         dict(frozen_credentials), max_pool_connections)
+
+
+def get_client_manager(service,
+                       region,
+                       max_retries=BOTO_MAX_RETRIES,
+                       aws_credentials=None):
+    """Returns the process-wide ClientManager for these arguments, with a
+    connection pool sized for the current max concurrency."""
+    return _get_client_manager(service, region, max_retries,
+                               _freeze(aws_credentials),
+                               get_max_pool_connections())
+
+
+def get_resource(service,
+                 region,
+                 max_retries=BOTO_MAX_RETRIES,
+                 aws_credentials=None):
+    """Returns a thread-safe stand-in for a boto3 resource of `service`."""
+    return ThreadLocalResource(
+        get_client_manager(service, region, max_retries, aws_credentials))
@@ -9,11 +9,10 @@ from typing import Any, Dict, List
 
 import boto3
 import botocore
-from botocore.config import Config
 
+from clusterman.autoscaler._private.aws.clients import get_resource
 from clusterman.autoscaler._private.aws.utils import LazyDefaultDict, handle_boto_error
 from clusterman.autoscaler._private.cli_logger import cf, cli_logger
-from clusterman.autoscaler._private.constants import BOTO_MAX_RETRIES
 from clusterman.autoscaler._private.event_system import CreateClusterEvent, global_event_system
 from clusterman.autoscaler._private.providers import _PROVIDER_PRETTY_NAMES
 from clusterman.autoscaler.tags import NODE_KIND_WORKER
@@ -701,15 +700,4 @@ def _client(name, config):
 def _resource(name, config):
     region = config["provider"]["region"]
     aws_credentials = config["provider"].get("aws_credentials", {})
-    return _resource_cache(name, region, **aws_credentials)
-
-
-@lru_cache()
-def _resource_cache(name, region, **kwargs):
-    boto_config = Config(retries={"max_attempts": BOTO_MAX_RETRIES})
-    return boto3.resource(
-        name,
-        region,
-        config=boto_config,
-        **kwargs,
-    )
+    return get_resource(name, region, aws_credentials=aws_credentials)
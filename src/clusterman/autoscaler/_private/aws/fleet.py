@@ -0,0 +1,127 @@
+"""Launching instances with instant-mode EC2 Fleets.
+
+A single CreateFleet call can spread a request over several subnets (and
+instance types), and returns whatever capacity EC2 found right away instead
+of failing the whole request. Fleets only take launch templates, so the
+RunInstances parameters of a node config are turned into a temporary
+launch template for each launch.
+"""
+import base64
+import uuid
+
+# RunInstances parameters that have no launch template equivalent, or that
+# are set per fleet override.
+NON_TEMPLATE_KEYS = {
+    "MinCount", "MaxCount", "SubnetId", "ClientToken", "DryRun",
+    "AdditionalInfo", "InstanceMarketOptions"
+}
+
+
+# Spot options of RunInstances and their EC2 Fleet SpotOptions equivalent.
+# MaxPrice is set per override instead.
+FLEET_SPOT_OPTIONS = {
+    "InstanceInterruptionBehavior": "InstanceInterruptionBehavior",
+}
+
+
+def launch_template_data(conf):
+    """Returns the launch template data equivalent to the RunInstances
+    parameters `conf`."""
+    data = {k: v for k, v in conf.items() if k not in NON_TEMPLATE_KEYS}
+    if "UserData" in data:
+        # boto3 base64-encodes UserData for RunInstances, but launch
+        # templates take it encoded already.
+        user_data = data["UserData"]
+        if isinstance(user_data, str):
+            user_data = user_data.encode("utf-8")
+        data["UserData"] = base64.b64encode(user_data).decode("ascii")
+    return data
+
+
+def is_spot(conf):
+    return conf.get("InstanceMarketOptions", {}).get("MarketType") == "spot"
+
+
+def fleet_spot_options(conf):
+    """Returns the fleet SpotOptions and the per override MaxPrice (or None)
+    equivalent to the InstanceMarketOptions of `conf`.
+
+    Raises ValueError for spot options that fleets do not support.
+    """
+    spot_options = dict(
+        conf.get("InstanceMarketOptions", {}).get("SpotOptions", {}))
+    max_price = spot_options.pop("MaxPrice", None)
+    # Instant fleets only make one-time requests.
+    if spot_options.pop("SpotInstanceType", "one-time") != "one-time":
+        raise ValueError("EC2 Fleet only launches one-time spot instances")
+    unsupported = set(spot_options) - set(FLEET_SPOT_OPTIONS)
+    if unsupported:
+        raise ValueError("EC2 Fleet does not support the spot options " +
+                         ", ".join(sorted(unsupported)))
+    fleet_options = {"AllocationStrategy": "capacity-optimized-prioritized"}
+    for key, value in spot_options.items():
+        fleet_options[FLEET_SPOT_OPTIONS[key]] = value
+    return fleet_options, max_price
+
+
+def create_fleet(client, conf, subnet_ids, instance_types, count,
+                 name_prefix):
+    """Launch `count` instances with the RunInstances parameters `conf` in
+    any of `subnet_ids` and `instance_types`, with one instant fleet.
+
+    Returns a list of (instance ID, subnet ID, instance type) of the launched
+    instances, and the errors EC2 reported for the overrides it could not
+    launch (as in the CreateFleet response). Fewer than `count` instances
+    may be launched.
+
+    Raises ValueError if `conf` cannot be launched with a fleet.
+    """
+    spot_options, max_price = fleet_spot_options(conf)
+    overrides = []
+    for subnet_id in subnet_ids:
+        # Earlier instance types are preferred.
+        for priority, instance_type in enumerate(instance_types):
+            override = {
+                "SubnetId": subnet_id,
+                "InstanceType": instance_type,
+                "Priority": float(priority),
+            }
+            if max_price is not None:
+                override["MaxPrice"] = max_price
+            overrides.append(override)
+    template_name = "{}-{}".format(name_prefix, uuid.uuid4().hex[:12])
+    template = client.create_launch_template(
+        LaunchTemplateName=template_name,
+        LaunchTemplateData=launch_template_data(conf))
+    template_id = template["LaunchTemplate"]["LaunchTemplateId"]
+    capacity_type = "spot" if is_spot(conf) else "on-demand"
+    try:
+        response = client.create_fleet(
+            Type="instant",
+            LaunchTemplateConfigs=[{
+                "LaunchTemplateSpecification": {
+                    "LaunchTemplateId": template_id,
+                    "Version": "$Latest",
+                },
+                "Overrides": overrides,
+            }],
+            TargetCapacitySpecification={
+                "TotalTargetCapacity": count,
+                "DefaultTargetCapacityType": capacity_type,
+            },
+            SpotOptions=spot_options,
+            OnDemandOptions={"AllocationStrategy": "prioritized"},
+        )
+    finally:
+        # Instant fleets do not use the template after they return.
+        client.delete_launch_template(LaunchTemplateId=template_id)
+
+    launched = []
+    for group in response.get("Instances", []):
+        overrides = group.get("LaunchTemplateAndOverrides",
+                              {}).get("Overrides", {})
+        for instance_id in group["InstanceIds"]:
+            launched.append((instance_id, overrides.get("SubnetId"),
+                             group.get("InstanceType",
+                                       overrides.get("InstanceType"))))
+    return launched, response.get("Errors", [])
@@ -0,0 +1,170 @@
+"""Retry policies for failed EC2 instance launches.
+
+The AWS provider asks its policy which subnet to launch an instance type in,
+and after every failed `create_instances` call whether to retry and how long
+to wait first.
+A custom policy can be set with the `launch_retry_policy` provider option,
+the dotted path of a LaunchRetryPolicy subclass.
+"""
+import random
+import threading
+import time
+
+from clusterman.autoscaler._private.aws.rate_limiter import THROTTLING_ERROR_CODES
+from clusterman.autoscaler._private.constants import BOTO_CREATE_MAX_RETRIES
+
+# Kinds of launch errors.
+# The subnet (or its AZ) cannot take the instances: try another one now.
+SUBNET = "subnet"
+# EC2 throttled the request: retry after backing off.
+THROTTLED = "throttled"
+# EC2 failed internally: retry after backing off.
+TRANSIENT = "transient"
+# Anything else (invalid config, limits, permissions): retrying won't help.
+FATAL = "fatal"
+
+SUBNET_ERROR_CODES = {
+    "InsufficientInstanceCapacity",
+    "InsufficientHostCapacity",
+    "InsufficientReservedInstanceCapacity",
+    "InsufficientCapacityOnHost",
+    "InsufficientFreeAddressesInSubnet",
+    "InvalidSubnetID.NotFound",
+    "Unsupported",
+}
+# Subnet errors that are specific to the instance type: the subnet may
+# still be able to launch other types.
+INSTANCE_TYPE_ERROR_CODES = {
+    "InsufficientInstanceCapacity",
+    "InsufficientHostCapacity",
+    "InsufficientReservedInstanceCapacity",
+    "InsufficientCapacityOnHost",
+    "Unsupported",
+}
+TRANSIENT_ERROR_CODES = {
+    "InternalError",
+    "InternalFailure",
+    "ServiceUnavailable",
+    "Unavailable",
+    "RequestTimeout",
+}
+
+
+def error_code(exc):
+    """Returns the error code of a botocore ClientError, if any."""
+    return getattr(exc, "response", {}).get("Error", {}).get("Code")
+
+
+class LaunchRetryPolicy:
+    """Default policy for retrying instance launches.
+
+    Subnets are tried round-robin, healthiest first. Subnet errors (e.g.
+    InsufficientInstanceCapacity) are retried right away in the next subnet,
+    and the failed subnet is skipped for `subnet_cooldown_s` (only for the
+    instance type that failed, for capacity errors). So is a subnet that
+    launched fewer instances than requested. Throttling and internal
+    errors are retried after a full-jitter exponential backoff. Other errors
+    are not retried.
+
+    Arguments:
+        provider_config: The provider section of the cluster config.
+        subnet_health: SubnetHealth to record launch outcomes in and rank
+            subnets by, if any.
+    """
+
+    max_attempts = BOTO_CREATE_MAX_RETRIES
+    base_delay_s = 1
+    max_delay_s = 20
+    subnet_cooldown_s = 300
+
+    def __init__(self, provider_config, subnet_health=None):
+        self.provider_config = provider_config
+        self.subnet_health = subnet_health
+        self._lock = threading.Lock()
+        # (Subnet ID, instance type or None for all types) -> when it may be
+        # used again (time.monotonic()).
+        self._skipped_subnets = {}
+
+    def classify(self, exc):
+        """Returns the kind of a launch error: SUBNET, THROTTLED, TRANSIENT
+        or FATAL."""
+        code = error_code(exc)
+        if code in SUBNET_ERROR_CODES:
+            return SUBNET
+        if code in THROTTLING_ERROR_CODES:
+            return THROTTLED
+        if code in TRANSIENT_ERROR_CODES:
+            return TRANSIENT
+        return FATAL
+
+    def _skipped_until(self, subnet_id, instance_type):
+        return max(
+            self._skipped_subnets.get((subnet_id, None), 0),
+            self._skipped_subnets.get((subnet_id, instance_type), 0))
+
+    def available_subnets(self, subnet_ids, instance_type=None):
+        """Returns the subnets of `subnet_ids` that are not skipped for
+        `instance_type`."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                subnet_id for subnet_id in subnet_ids
+                if self._skipped_until(subnet_id, instance_type) <= now
+            ]
+
+    def choose_subnet(self, subnet_ids, index, instance_type=None):
+        """Returns the subnet to launch `instance_type` in, trying
+        `subnet_ids` round-robin from `index` (healthiest first) and skipping
+        subnets that recently failed.
+
+        If every subnet is skipped, returns the one available again first.
+        """
+        now = time.monotonic()
+        if self.subnet_health is not None:
+            candidates = self.subnet_health.rank(subnet_ids, index)
+        else:
+            candidates = [
+                subnet_ids[(index + i) % len(subnet_ids)]
+                for i in range(len(subnet_ids))
+            ]
+        with self._lock:
+            for subnet_id in candidates:
+                if self._skipped_until(subnet_id, instance_type) <= now:
+                    return subnet_id
+            return min(
+                candidates,
+                key=lambda s: self._skipped_until(s, instance_type))
+
+    def on_success(self, subnet_id, requested, launched, instance_type=None):
+        """Called after `launched` of `requested` instances of
+        `instance_type` were launched in `subnet_id`."""
+        if launched < requested:
+            # The subnet ran out of capacity for this instance type.
+            with self._lock:
+                self._skipped_subnets[(subnet_id, instance_type)] = (
+                    time.monotonic() + self.subnet_cooldown_s)
+        if self.subnet_health is not None:
+            self.subnet_health.record_launch(subnet_id, launched / requested)
+
+    def on_failure(self, attempt, subnet_id, exc, instance_type=None):
+        """Called after a failed launch attempt (counting from 1) of
+        `instance_type` in `subnet_id`.
+
+        Returns how many seconds to wait before the next attempt, or None to
+        give up.
+        """
+        kind = self.classify(exc)
+        if kind == SUBNET:
+            if error_code(exc) not in INSTANCE_TYPE_ERROR_CODES:
+                instance_type = None
+            with self._lock:
+                self._skipped_subnets[(subnet_id, instance_type)] = (
+                    time.monotonic() + self.subnet_cooldown_s)
+            if self.subnet_health is not None:
+                self.subnet_health.record_launch(subnet_id, False)
+        if kind == FATAL or attempt >= self.max_attempts:
+            return None
+        if kind == SUBNET:
+            return 0
+        return random.uniform(
+            0, min(self.max_delay_s, self.base_delay_s * 2**(attempt - 1)))
@@ -1,20 +1,34 @@
+import atexit
 import copy
 import logging
 import random
 import threading
 import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List
 
 import boto3
 import botocore
 from botocore.config import Config
 
+from clusterman.autoscaler._private.aws.clients import get_resource
 from clusterman.autoscaler._private.aws.config import bootstrap_aws
+from clusterman.autoscaler._private.aws.fleet import create_fleet
+from clusterman.autoscaler._private.aws.launch_retry import SUBNET, SUBNET_ERROR_CODES, LaunchRetryPolicy
+from clusterman.autoscaler._private.aws.subnet_health import SubnetHealth
 from clusterman.autoscaler._private.aws.utils import boto_exception_handler
 from clusterman.autoscaler._private.cli_logger import cf, cli_logger
-from clusterman.autoscaler._private.constants import BOTO_CREATE_MAX_RETRIES, BOTO_MAX_RETRIES
+from clusterman.autoscaler._private.constants import (
+    AUTOSCALER_MAX_CONCURRENT_LAUNCHES,
+    AUTOSCALER_MAX_LAUNCH_BATCH,
+    AWS_INVENTORY_MAX_STALENESS_S,
+    AWS_NODE_CACHE_GRACE_S,
+    AWS_SUBNET_HEALTH,
+    BOTO_MAX_RETRIES
+)
 from clusterman.autoscaler._private.log_timer import LogTimer
+from clusterman.autoscaler._private.providers import _load_class
 from clusterman.autoscaler.node_provider import NodeProvider
 from clusterman.autoscaler.tags import (
     TAG_CLUSTER_NAME,
@@ -26,7 +40,15 @@ from clusterman.autoscaler.tags import (
 
 logger = logging.getLogger(__name__)
 
+# How long tag updates are collected before they are written together.
 TAG_BATCH_DELAY = 1
+# Max resources per CreateTags call.
+CREATE_TAGS_BATCH_SIZE = 1000
+# How long point refreshes of specific nodes are collected before they are
+# described together.
+POINT_REFRESH_DELAY = 0.2
+# Max instance IDs per DescribeInstances call of a point refresh.
+POINT_REFRESH_BATCH_SIZE = 200
 
 
 def to_aws_format(tags):
@@ -48,11 +70,13 @@ def from_aws_format(tags):
 
 
 def make_ec2_client(region, max_retries, aws_credentials=None):
-    """Make client, retrying requests up to `max_retries`."""
-    config = Config(retries={"max_attempts": max_retries})
-    aws_credentials = aws_credentials or {}
-    return boto3.resource(
-        "ec2", region_name=region, config=config, **aws_credentials)
+    """Make client, retrying requests up to `max_retries`.
+
+    The returned resource can be used from any thread. Its requests go through
+    a client shared by the whole process, reusing its HTTP connections.
+    """
+    return get_resource(
+        "ec2", region, max_retries=max_retries, aws_credentials=aws_credentials)
 
 
 def list_ec2_instances(region: str, aws_credentials: Dict[str, Any] = None
@@ -87,6 +111,59 @@ def list_ec2_instances(region: str, aws_credentials: Dict[str, Any] = None
     return final_instance_types
 
 
+def _instance_types(node_config):
+    """Returns the instance types of a node config in order of preference:
+    its InstanceType followed by its InstanceTypes."""
+    instance_types = []
+    if "InstanceType" in node_config:
+        instance_types.append(node_config["InstanceType"])
+    for instance_type in node_config.get("InstanceTypes", []):
+        if instance_type not in instance_types:
+            instance_types.append(instance_type)
+    return instance_types
+
+
+class NodeRecord:
+    """The parts of an EC2 instance description the provider uses.
+
+    Much smaller and cheaper to build than a boto3 `ec2.Instance` resource,
+    which keeps the whole description around.
+    """
+
+    __slots__ = ("id", "state_name", "public_ip_address", "private_ip_address",
+                 "spot_instance_request_id", "tags")
+
+    def __init__(self, id, state_name, public_ip_address, private_ip_address,
+                 spot_instance_request_id, tags):
+        self.id = id
+        self.state_name = state_name
+        self.public_ip_address = public_ip_address
+        self.private_ip_address = private_ip_address
+        self.spot_instance_request_id = spot_instance_request_id
+        # Tags in AWS format, i.e. using "Name" for the node name.
+        self.tags = tags
+
+    @classmethod
+    def from_description(cls, instance):
+        """Build a record from an instance of a DescribeInstances response."""
+        return cls(
+            instance["InstanceId"], instance["State"]["Name"],
+            instance.get("PublicIpAddress"), instance.get("PrivateIpAddress"),
+            instance.get("SpotInstanceRequestId"),
+            {tag["Key"]: tag["Value"]
+             for tag in instance.get("Tags", [])})
+
+
+class _InflightCall:
+    """A call in progress that concurrent callers wait on instead of
+    repeating it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
 class AWSNodeProvider(NodeProvider):
     def __init__(self, provider_config, cluster_name):
         NodeProvider.__init__(self, provider_config, cluster_name)
@@ -105,23 +182,59 @@ class AWSNodeProvider(NodeProvider):
 
         # Try availability zones round-robin, starting from random offset
         self.subnet_idx = random.randint(0, 100)
+        self._subnet_idx_lock = threading.Lock()
+        # Launch outcomes and times to running of subnets, and the subnet
+        # and launch time of nodes that have not been seen running yet.
+        self.subnet_health = (SubnetHealth() if AWS_SUBNET_HEALTH else
+                              SubnetHealth(path=None))
+        self._launched_at = {}
+        # "run_instances" launches batches of nodes in one subnet at a time,
+        # "fleet" launches all of them with a single instant EC2 Fleet.
+        self.launch_backend = provider_config.get("launch_backend",
+                                                  "run_instances")
+        # Decides which subnet to launch in and how to retry failed launches.
+        policy_cls = LaunchRetryPolicy
+        if "launch_retry_policy" in provider_config:
+            policy_cls = _load_class(provider_config["launch_retry_policy"])
+        self.launch_retry_policy = policy_cls(
+            provider_config, subnet_health=self.subnet_health)
 
         # Tags that we believe to actually be on EC2.
         self.tag_cache = {}
         # Tags that we will soon upload.
         self.tag_cache_pending = defaultdict(dict)
-        # Number of threads waiting for a batched tag update.
-        self.batch_thread_count = 0
-        self.batch_update_done = threading.Event()
-        self.batch_update_done.set()
-        self.ready_for_new_batch = threading.Event()
-        self.ready_for_new_batch.set()
+        # Tags being written to EC2, which descriptions may not include yet.
+        self._tags_in_flight = {}
         self.tag_cache_lock = threading.Lock()
-        self.count_lock = threading.Lock()
+        # Tag updates are written by a background thread (see
+        # `_tag_writer`). Updates are numbered as they are queued, so that
+        # `flush_node_tags` can wait for the ones queued before it.
+        self._tags_changed = threading.Condition(self.tag_cache_lock)
+        self._tag_writer_thread = None
+        self._tag_updates_queued = 0
+        self._tag_updates_written = 0
+        self._tag_flush_requested = threading.Event()
+        self._tag_write_error = None
 
         # Cache of node objects from the last nodes() call. This avoids
-        # excessive DescribeInstances requests.
+        # excessive DescribeInstances requests. It is replaced rather than
+        # modified in place (under `tag_cache_lock`), so lookups need no lock.
         self.cached_nodes = {}
+        # When each cached node was last seen pending or running, used to
+        # evict nodes that are gone from `cached_nodes` and `tag_cache`.
+        self._last_seen = {}
+        # Refreshes of the whole inventory (see `_refresh_inventory`) are
+        # skipped if the last one is more recent than this many seconds.
+        self.inventory_max_staleness_s = provider_config.get(
+            "inventory_max_staleness_s", AWS_INVENTORY_MAX_STALENESS_S)
+        self._inventory_lock = threading.Lock()
+        self._inventory_refreshed_at = float("-inf")
+        self._inventory_refresh = None
+        # Node IDs waiting for the next batched point refresh (see
+        # `_refresh_nodes`) and the call that will describe them.
+        self._point_refresh_lock = threading.Lock()
+        self._point_refresh_ids = set()
+        self._point_refresh = None
 
     def non_terminated_nodes(self, tag_filters):
         # Note that these filters are acceptable because they are set on
@@ -143,30 +256,198 @@ class AWSNodeProvider(NodeProvider):
                 "Values": [v],
             })
 
+        refreshed_at = time.monotonic()
         with boto_exception_handler(
                 "Failed to fetch running instances from AWS."):
-            nodes = list(self.ec2.instances.filter(Filters=filters))
+            nodes = self._describe_instances(Filters=filters)
 
-        # Populate the tag cache with initial information if necessary
-        for node in nodes:
-            if node.id in self.tag_cache:
-                continue
+        self._update_caches(nodes, from_aws_format(tag_filters))
+        if not tag_filters:
+            with self._inventory_lock:
+                self._inventory_refreshed_at = max(
+                    self._inventory_refreshed_at, refreshed_at)
+        return [node.id for node in nodes]
 
-            self.tag_cache[node.id] = from_aws_format(
-                {x["Key"]: x["Value"]
-                 for x in node.tags})
+    def stopped_nodes(self, tag_filters):
+        if not self.cache_stopped_nodes:
+            return []
+        return [node.id for node in self._stopped_nodes(tag_filters)]
 
-        self.cached_nodes = {node.id: node for node in nodes}
-        return [node.id for node in nodes]
+    def _stopped_nodes(self, tag_filters):
+        """Returns a NodeRecord for every stopped or stopping node of the
+        cluster with `tag_filters`, and caches their tags."""
+        filters = [
+            {
+                "Name": "instance-state-name",
+                "Values": ["stopped", "stopping"],
+            },
+            {
+                "Name": "tag:{}".format(TAG_CLUSTER_NAME),
+                "Values": [self.cluster_name],
+            },
+        ]
+        for k, v in to_aws_format(dict(tag_filters)).items():
+            filters.append({
+                "Name": "tag:{}".format(k),
+                "Values": [v],
+            })
+
+        with boto_exception_handler(
+                "Failed to fetch stopped instances from AWS."):
+            nodes = self._describe_instances(Filters=filters)
+        self._cache_tags(nodes)
+        return nodes
+
+    def _cache_tags(self, nodes):
+        """Cache the tags of `nodes`, which are not pending or running."""
+        now = time.monotonic()
+        with self.tag_cache_lock:
+            for node in nodes:
+                self.tag_cache[node.id] = from_aws_format(dict(node.tags))
+                self._last_seen[node.id] = now
+
+    def start_nodes(self, node_ids, tags):
+        with boto_exception_handler(
+                "Failed to fetch stopped instances from AWS."):
+            nodes = self._describe_instances(InstanceIds=list(node_ids))
+        self._cache_tags(nodes)
+        self._start_nodes(nodes, tags)
+
+    def _start_nodes(self, nodes, tags):
+        """Start the stopped or stopping `nodes` (NodeRecords) and set
+        `tags` on them."""
+        node_ids = [n.id for n in nodes]
+        # One waiter polls all the stopping instances at once.
+        stopping_ids = [n.id for n in nodes if n.state_name == "stopping"]
+        if stopping_ids:
+            with cli_logger.group("Waiting for instances {} to stop",
+                                  cli_logger.render_list(stopping_ids)):
+                self.ec2.meta.client.get_waiter("instance_stopped").wait(
+                    InstanceIds=stopping_ids)
+
+        self.ec2.meta.client.start_instances(InstanceIds=node_ids)
+        self._queue_node_tags(node_ids, tags)
+        # Node kind tags must be on EC2 for listings to find them.
+        self.flush_node_tags()
+
+    def stop_nodes(self, node_ids):
+        if not node_ids:
+            return
+        node_ids = list(node_ids)
+        cli_logger.print("Stopping instances {}",
+                         cli_logger.render_list(node_ids))
+        self.ec2.meta.client.stop_instances(InstanceIds=node_ids)
+        with cli_logger.group("Waiting for instances {} to stop",
+                              cli_logger.render_list(node_ids)):
+            self.ec2.meta.client.get_waiter("instance_stopped").wait(
+                InstanceIds=node_ids)
+
+    def _update_caches(self, nodes, listed_tags=None):
+        """Merge freshly described `nodes` into the node and tag caches.
+
+        If `listed_tags` is given, `nodes` are all pending and running nodes
+        with these tags. Cached nodes with these tags that are missing from
+        `nodes` are no longer pending or running: their cached state is
+        dropped, and their tags too once they have been missing for
+        AWS_NODE_CACHE_GRACE_S (so that callers still holding their IDs can
+        look them up in the meantime).
+        """
+        now = time.monotonic()
+        started = []
+        with self.tag_cache_lock:
+            cached_nodes = dict(self.cached_nodes)
+            for node in nodes:
+                cached_nodes[node.id] = node
+                if node.id in self._launched_at and node.state_name != "pending":
+                    subnet_id, launched_at = self._launched_at.pop(node.id)
+                    if node.state_name == "running":
+                        started.append((subnet_id, now - launched_at))
+                # Populate the tag cache with initial information if necessary
+                if node.id not in self.tag_cache:
+                    self.tag_cache[node.id] = dict(
+                        from_aws_format(dict(node.tags)),
+                        **self._tags_in_flight.get(node.id, {}))
+                if node.state_name in ["pending", "running"]:
+                    self._last_seen[node.id] = now
+                else:
+                    self._last_seen.setdefault(node.id, now)
+
+            if listed_tags is not None:
+                listed = {node.id for node in nodes}
+                for node_id, tags in list(self.tag_cache.items()):
+                    if node_id in listed or any(
+                            tags.get(k) != v for k, v in listed_tags.items()):
+                        continue
+                    node = cached_nodes.get(node_id)
+                    if node is not None and node.state_name in [
+                            "pending", "running"
+                    ]:
+                        del cached_nodes[node_id]
+                    if (now - self._last_seen.get(node_id, now) >
+                            AWS_NODE_CACHE_GRACE_S
+                            and node_id not in self.tag_cache_pending):
+                        del self.tag_cache[node_id]
+                        cached_nodes.pop(node_id, None)
+                        self._last_seen.pop(node_id, None)
+                        self._launched_at.pop(node_id, None)
+            self.cached_nodes = cached_nodes
+
+        for subnet_id, time_to_running in started:
+            self.subnet_health.record_time_to_running(subnet_id,
+                                                      time_to_running)
+        if started:
+            self.subnet_health.save()
+
+    def _describe_instances(self, **kwargs):
+        """Returns a NodeRecord for every instance DescribeInstances finds
+        with `kwargs`, following all pages of results."""
+        paginator = self.ec2.meta.client.get_paginator("describe_instances")
+        return [
+            NodeRecord.from_description(instance)
+            for page in paginator.paginate(**kwargs)
+            for reservation in page["Reservations"]
+            for instance in reservation["Instances"]
+        ]
+
+    def _refresh_inventory(self):
+        """Refresh `cached_nodes` with all nodes of the cluster.
+
+        Does nothing if the cache was refreshed in the last
+        `inventory_max_staleness_s` seconds. Concurrent callers share a single
+        in-flight DescribeInstances call instead of each making their own.
+        """
+        with self._inventory_lock:
+            if (time.monotonic() - self._inventory_refreshed_at <
+                    self.inventory_max_staleness_s):
+                return
+            refresh = self._inventory_refresh
+            is_leader = refresh is None
+            if is_leader:
+                refresh = self._inventory_refresh = _InflightCall()
+
+        if not is_leader:
+            refresh.done.wait()
+            if refresh.error is not None:
+                raise refresh.error
+            return
+
+        try:
+            self.non_terminated_nodes({})
+        except Exception as e:
+            refresh.error = e
+            raise
+        finally:
+            with self._inventory_lock:
+                self._inventory_refresh = None
+            refresh.done.set()
 
     def is_running(self, node_id):
         node = self._get_cached_node(node_id)
-        return node.state["Name"] == "running"
+        return node.state_name == "running"
 
     def is_terminated(self, node_id):
         node = self._get_cached_node(node_id)
-        state = node.state["Name"]
-        return state not in ["running", "pending"]
+        return node.state_name not in ["running", "pending"]
 
     def node_tags(self, node_id):
         with self.tag_cache_lock:
@@ -191,56 +472,95 @@ class AWSNodeProvider(NodeProvider):
         return node.private_ip_address
 
     def set_node_tags(self, node_id, tags):
-        is_batching_thread = False
+        """Queue a tag update and return without waiting for it to be
+        written. `node_tags` reflects it right away, use `flush_node_tags`
+        to wait until it is visible on EC2."""
+        self._queue_node_tags([node_id], tags)
+
+    def _queue_node_tags(self, node_ids, tags):
+        """Queue the same tag update for all of `node_ids`."""
+        with self.tag_cache_lock:
+            for node_id in node_ids:
+                self.tag_cache_pending[node_id].update(tags)
+            self._tag_updates_queued += len(node_ids)
+            if self._tag_writer_thread is None:
+                self._tag_writer_thread = threading.Thread(
+                    target=self._tag_writer,
+                    name="AWSNodeProvider-tag-writer",
+                    daemon=True)
+                self._tag_writer_thread.start()
+                atexit.register(self.flush_node_tags)
+            self._tags_changed.notify_all()
+
+    def flush_node_tags(self):
+        """Wait until all tag updates queued so far are written to EC2.
+
+        Raises the error of a failed write since the last flush, if any.
+        """
         with self.tag_cache_lock:
-            if not self.tag_cache_pending:
-                is_batching_thread = True
-                # Wait for threads in the last batch to exit
-                self.ready_for_new_batch.wait()
-                self.ready_for_new_batch.clear()
-                self.batch_update_done.clear()
-            self.tag_cache_pending[node_id].update(tags)
-
-        if is_batching_thread:
-            time.sleep(TAG_BATCH_DELAY)
+            target = self._tag_updates_queued
+            if self._tag_updates_written < target:
+                self._tag_flush_requested.set()
+            while self._tag_updates_written < target:
+                self._tags_changed.wait()
+            error, self._tag_write_error = self._tag_write_error, None
+        if error is not None:
+            raise error
+
+    def _tag_writer(self):
+        while True:
             with self.tag_cache_lock:
-                self._update_node_tags()
-                self.batch_update_done.set()
-
-        with self.count_lock:
-            self.batch_thread_count += 1
-        self.batch_update_done.wait()
-
-        with self.count_lock:
-            self.batch_thread_count -= 1
-            if self.batch_thread_count == 0:
-                self.ready_for_new_batch.set()
-
-    def _update_node_tags(self):
+                while not self.tag_cache_pending:
+                    self._tags_changed.wait()
+            # Let more updates join the batch, unless someone is waiting.
+            self._tag_flush_requested.wait(TAG_BATCH_DELAY)
+            with self.tag_cache_lock:
+                self._tag_flush_requested.clear()
+                pending = self.tag_cache_pending
+                self.tag_cache_pending = defaultdict(dict)
+                queued = self._tag_updates_queued
+                self._tags_in_flight = pending
+                for node_id, tags in pending.items():
+                    # Nodes that were not listed yet get all of their tags
+                    # when they are (see `_update_caches`).
+                    if node_id in self.tag_cache:
+                        self.tag_cache[node_id].update(tags)
+            try:
+                self._update_node_tags(pending)
+                error = None
+            except Exception as e:
+                logger.exception("AWSNodeProvider: Failed to set tags")
+                error = e
+            with self.tag_cache_lock:
+                self._tags_in_flight = {}
+                self._tag_updates_written = queued
+                if error is not None and self._tag_write_error is None:
+                    self._tag_write_error = error
+                self._tags_changed.notify_all()
+
+    def _update_node_tags(self, pending):
+        # Nodes going through the same transition get the same set of tags,
+        # which can then be written with a single request.
         batch_updates = defaultdict(list)
 
-        for node_id, tags in self.tag_cache_pending.items():
-            for x in tags.items():
-                batch_updates[x].append(node_id)
-            self.tag_cache[node_id].update(tags)
-
-        self.tag_cache_pending = defaultdict(dict)
+        for node_id, tags in pending.items():
+            batch_updates[tuple(sorted(tags.items()))].append(node_id)
 
         self._create_tags(batch_updates)
 
     def _create_tags(self, batch_updates):
-        for (k, v), node_ids in batch_updates.items():
-            m = "Set tag {}={} on {}".format(k, v, node_ids)
-            with LogTimer("AWSNodeProvider: {}".format(m)):
-                if k == TAG_NODE_NAME:
-                    k = "Name"
-                self.ec2.meta.client.create_tags(
-                    Resources=node_ids,
-                    Tags=[{
-                        "Key": k,
-                        "Value": v
-                    }],
-                )
+        for tags, node_ids in batch_updates.items():
+            tag_pairs = [{
+                "Key": "Name" if k == TAG_NODE_NAME else k,
+                "Value": v
+            } for k, v in tags]
+            for i in range(0, len(node_ids), CREATE_TAGS_BATCH_SIZE):
+                chunk = node_ids[i:i + CREATE_TAGS_BATCH_SIZE]
+                m = "Set tags {} on {}".format(
+                    ", ".join("{}={}".format(k, v) for k, v in tags), chunk)
+                with LogTimer("AWSNodeProvider: {}".format(m)):
+                    self.ec2.meta.client.create_tags(
+                        Resources=chunk, Tags=tag_pairs)
 
     def create_node(self, node_config, tags, count) -> Dict[str, Any]:
         """Creates instances.
@@ -255,35 +575,20 @@ class AWSNodeProvider(NodeProvider):
         if self.cache_stopped_nodes:
             # TODO(ekl) this is breaking the abstraction boundary a little by
             # peeking into the tag set.
-            filters = [
-                {
-                    "Name": "instance-state-name",
-                    "Values": ["stopped", "stopping"],
-                },
-                {
-                    "Name": "tag:{}".format(TAG_CLUSTER_NAME),
-                    "Values": [self.cluster_name],
-                },
-                {
-                    "Name": "tag:{}".format(TAG_NODE_KIND),
-                    "Values": [tags[TAG_NODE_KIND]],
-                },
-                {
-                    "Name": "tag:{}".format(TAG_LAUNCH_CONFIG),
-                    "Values": [tags[TAG_LAUNCH_CONFIG]],
-                },
-            ]
+            tag_filters = {
+                TAG_NODE_KIND: tags[TAG_NODE_KIND],
+                TAG_LAUNCH_CONFIG: tags[TAG_LAUNCH_CONFIG],
+            }
             # This tag may not always be present.
             if TAG_USER_NODE_TYPE in tags:
-                filters.append({
-                    "Name": "tag:{}".format(TAG_USER_NODE_TYPE),
-                    "Values": [tags[TAG_USER_NODE_TYPE]],
-                })
+                tag_filters[TAG_USER_NODE_TYPE] = tags[TAG_USER_NODE_TYPE]
 
-            reuse_nodes = list(
-                self.ec2.instances.filter(Filters=filters))[:count]
+            reuse_nodes = self._stopped_nodes(tag_filters)[:count]
             reuse_node_ids = [n.id for n in reuse_nodes]
-            reused_nodes_dict = {n.id: n for n in reuse_nodes}
+            reused_nodes_dict = {
+                node_id: self.ec2.Instance(node_id)
+                for node_id in reuse_node_ids
+            }
             if reuse_nodes:
                 cli_logger.print(
                     # todo: handle plural vs singular?
@@ -292,21 +597,7 @@ class AWSNodeProvider(NodeProvider):
                     "under `provider` in the cluster configuration.",
                     cli_logger.render_list(reuse_node_ids))
 
-                # todo: timed?
-                with cli_logger.group("Stopping instances to reuse"):
-                    for node in reuse_nodes:
-                        self.tag_cache[node.id] = from_aws_format(
-                            {x["Key"]: x["Value"]
-                             for x in node.tags})
-                        if node.state["Name"] == "stopping":
-                            cli_logger.print("Waiting for instance {} to stop",
-                                             node.id)
-                            node.wait_until_stopped()
-
-                self.ec2.meta.client.start_instances(
-                    InstanceIds=reuse_node_ids)
-                for node_id in reuse_node_ids:
-                    self.set_node_tags(node_id, tags)
+                self._start_nodes(reuse_nodes, tags)
                 count -= len(reuse_node_ids)
 
         created_nodes_dict = {}
@@ -358,58 +649,213 @@ class AWSNodeProvider(NodeProvider):
         # SubnetIds is not a real config key: we must resolve to a
         # single SubnetId before invoking the AWS API.
         subnet_ids = conf.pop("SubnetIds")
+        # InstanceTypes is not a RunInstances parameter: it lists the instance
+        # types to fall back to when EC2 is out of capacity for InstanceType.
+        instance_types = _instance_types(conf)
+        conf.pop("InstanceTypes", None)
+        conf["InstanceType"] = instance_types[0]
+        conf["TagSpecifications"] = tag_specs
+
+        if self.launch_backend == "fleet":
+            return self._create_node_fleet(conf, subnet_ids, instance_types,
+                                           count)
+
+        # Launch in batches of AUTOSCALER_MAX_LAUNCH_BATCH nodes, spread over
+        # the subnets and issued concurrently. EC2 may launch fewer nodes
+        # than asked for in a subnet short on capacity. That subnet is then
+        # skipped for the instance type, and the shortfall is launched again
+        # in other subnets or with the next instance type.
+        requested = count
+        for _ in range(self.launch_retry_policy.max_attempts):
+            batches = [
+                min(AUTOSCALER_MAX_LAUNCH_BATCH, count - i)
+                for i in range(0, count, AUTOSCALER_MAX_LAUNCH_BATCH)
+            ]
+            with ThreadPoolExecutor(
+                    min(len(batches),
+                        AUTOSCALER_MAX_CONCURRENT_LAUNCHES)) as executor:
+                futures = [
+                    executor.submit(self._launch_batch, conf, subnet_ids,
+                                    instance_types, batch)
+                    for batch in batches
+                ]
+                created = {}
+                errors = []
+                for future in futures:
+                    try:
+                        created.update(future.result())
+                    except Exception as e:
+                        errors.append(e)
+            created_nodes_dict.update(created)
+            count -= len(created)
+            if errors:
+                # Nodes launched by the other batches are tagged, so they
+                # will be picked up by later listings.
+                raise errors[0]
+            if not count or not created:
+                break
+            cli_logger.print(
+                "EC2 launched {} fewer nodes than requested, launching them "
+                "in other subnets.", count)
+        if count:
+            cli_logger.warning(
+                "Launched {} of {} nodes, EC2 is out of capacity for the "
+                "rest.", len(created_nodes_dict), requested)
+        return created_nodes_dict
 
-        for attempt in range(1, BOTO_CREATE_MAX_RETRIES + 1):
+    def _create_node_fleet(self, conf, subnet_ids, instance_types, count):
+        """Launch up to `count` nodes with `conf` in any of `subnet_ids` and
+        `instance_types` with a single instant EC2 Fleet."""
+        start = time.monotonic()
+        with boto_exception_handler(
+                "Failed to launch instances with EC2 Fleet."):
             try:
-                subnet_id = subnet_ids[self.subnet_idx % len(subnet_ids)]
+                launched, errors = create_fleet(
+                    self.ec2_fail_fast.meta.client, conf, subnet_ids,
+                    instance_types, count, "cls-{}".format(self.cluster_name))
+            except ValueError as e:
+                cli_logger.abort(
+                    "Cannot launch this node config with `launch_backend: "
+                    "fleet`: {}. Use `launch_backend: run_instances` "
+                    "instead.", str(e))
+
+        for error in errors:
+            overrides = error.get("LaunchTemplateAndOverrides",
+                                  {}).get("Overrides", {})
+            subnet_id = overrides.get("SubnetId")
+            cli_logger.print(
+                "create_fleet: {}",
+                error.get("ErrorMessage"),
+                _tags=dict(
+                    subnet_id=str(subnet_id), error=str(error.get("ErrorCode"))))
+            if subnet_id and error.get("ErrorCode") in SUBNET_ERROR_CODES:
+                self.subnet_health.record_launch(subnet_id, False)
+        if not launched:
+            self.subnet_health.save()
+            cli_logger.abort("Failed to launch instances.")
+
+        created_nodes_dict = {}
+        with cli_logger.group(
+                "Launched {} nodes", len(launched),
+                _tags=dict(backend="fleet")):
+            for instance_id, subnet_id, instance_type in launched:
+                cli_logger.print(
+                    "Launched instance {}",
+                    instance_id,
+                    _tags=dict(
+                        subnet_id=subnet_id, instance_type=instance_type))
+                # Described lazily, on first access to its attributes.
+                created_nodes_dict[instance_id] = self.ec2_fail_fast.Instance(
+                    instance_id)
+        for subnet_id in {subnet_id for _, subnet_id, _ in launched}:
+            self.subnet_health.record_launch(subnet_id, True)
+        self.subnet_health.save()
+        with self.tag_cache_lock:
+            for instance_id, subnet_id, _ in launched:
+                self._launched_at[instance_id] = (subnet_id, start)
+        if len(launched) < count:
+            cli_logger.warning("EC2 Fleet launched {} of {} nodes.",
+                               len(launched), count)
+        return created_nodes_dict
 
+    def _launch_batch(self, conf, subnet_ids, instance_types, count):
+        """Launch up to `count` nodes with `conf` in one of `subnet_ids`,
+        retrying failures according to the launch retry policy.
+
+        The first of `instance_types` is used until every subnet is out of
+        capacity for it, then the next one and so on.
+        """
+        policy = self.launch_retry_policy
+        conf = dict(conf, MinCount=1, MaxCount=count)
+        type_idx = 0
+        attempt = 0
+        while True:
+            instance_type = instance_types[type_idx]
+            has_fallback = type_idx + 1 < len(instance_types)
+            if has_fallback and not policy.available_subnets(
+                    subnet_ids, instance_type):
+                type_idx += 1
+                attempt = 0
+                cli_logger.print(
+                    "No subnet has capacity for {}, falling back to {}.",
+                    instance_type, instance_types[type_idx])
+                continue
+            attempt += 1
+            with self._subnet_idx_lock:
+                subnet_idx = self.subnet_idx
                 self.subnet_idx += 1
-                conf.update({
-                    "MinCount": 1,
-                    "MaxCount": count,
-                    "SubnetId": subnet_id,
-                    "TagSpecifications": tag_specs
-                })
+            subnet_id = policy.choose_subnet(subnet_ids, subnet_idx,
+                                             instance_type)
+            conf["SubnetId"] = subnet_id
+            conf["InstanceType"] = instance_type
+            start = time.monotonic()
+            try:
                 created = self.ec2_fail_fast.create_instances(**conf)
-                created_nodes_dict = {n.id: n for n in created}
-
-                # todo: timed?
-                # todo: handle plurality?
-                with cli_logger.group(
-                        "Launched {} nodes",
-                        count,
-                        _tags=dict(subnet_id=subnet_id)):
-                    for instance in created:
-                        # NOTE(maximsmol): This is needed for mocking
-                        # boto3 for tests. This is likely a bug in moto
-                        # but AWS docs don't seem to say.
-                        # You can patch moto/ec2/responses/instances.py
-                        # to fix this (add <stateReason> to EC2_RUN_INSTANCES)
-
-                        # The correct value is technically
-                        # {"code": "0", "Message": "pending"}
-                        state_reason = instance.state_reason or {
-                            "Message": "pending"
-                        }
-
-                        cli_logger.print(
-                            "Launched instance {}",
-                            instance.instance_id,
-                            _tags=dict(
-                                state=instance.state["Name"],
-                                info=state_reason["Message"]))
-                break
             except botocore.exceptions.ClientError as exc:
-                if attempt == BOTO_CREATE_MAX_RETRIES:
+                cost = time.monotonic() - start
+                delay = policy.on_failure(attempt, subnet_id, exc,
+                                          instance_type)
+                self.subnet_health.save()
+                tags = dict(
+                    subnet_id=subnet_id,
+                    instance_type=instance_type,
+                    error=policy.classify(exc),
+                    cost="{:.2f}s".format(cost))
+                if (delay is None and has_fallback
+                        and policy.classify(exc) == SUBNET):
+                    # Out of attempts for this instance type.
+                    delay = 0
+                    type_idx += 1
+                    attempt = 0
+                if delay is None:
+                    cli_logger.print(
+                        "create_instances: Attempt {} failed with {}.",
+                        attempt,
+                        exc,
+                        _tags=tags)
                     # todo: err msg
-                    cli_logger.abort(
-                        "Failed to launch instances. Max attempts exceeded.")
+                    cli_logger.abort("Failed to launch instances.")
                     raise exc
-                else:
+                cli_logger.print(
+                    "create_instances: Attempt {} failed with {}, retrying.",
+                    attempt,
+                    exc,
+                    _tags=dict(tags, retry_in="{:.2f}s".format(delay)))
+                time.sleep(delay)
+                continue
+
+            created_nodes_dict = {n.id: n for n in created}
+            policy.on_success(subnet_id, count, len(created), instance_type)
+            self.subnet_health.save()
+            with self.tag_cache_lock:
+                for node_id in created_nodes_dict:
+                    self._launched_at[node_id] = (subnet_id, start)
+
+            # todo: timed?
+            with cli_logger.group(
+                    "Launched {} nodes",
+                    len(created),
+                    _tags=dict(subnet_id=subnet_id)):
+                for instance in created:
+                    # NOTE(maximsmol): This is needed for mocking
+                    # boto3 for tests. This is likely a bug in moto
+                    # but AWS docs don't seem to say.
+                    # You can patch moto/ec2/responses/instances.py
+                    # to fix this (add <stateReason> to EC2_RUN_INSTANCES)
+
+                    # The correct value is technically
+                    # {"code": "0", "Message": "pending"}
+                    state_reason = instance.state_reason or {
+                        "Message": "pending"
+                    }
+
                     cli_logger.print(
-                        "create_instances: Attempt failed with {}, retrying.",
-                        exc)
-        return created_nodes_dict
+                        "Launched instance {}",
+                        instance.instance_id,
+                        _tags=dict(
+                            state=instance.state["Name"],
+                            info=state_reason["Message"]))
+            return created_nodes_dict
 
     def terminate_node(self, node_id):
         node = self._get_cached_node(node_id)
@@ -419,22 +865,20 @@ class AWSNodeProvider(NodeProvider):
                     "Terminating instance {} " +
                     cf.dimmed("(cannot stop spot instances, only terminate)"),
                     node_id)  # todo: show node name?
-                node.terminate()
+                self.ec2.meta.client.terminate_instances(InstanceIds=[node_id])
             else:
                 cli_logger.print("Stopping instance {} " + cf.dimmed(
                     "(to terminate instead, "
                     "set `cache_stopped_nodes: False` "
                     "under `provider` in the cluster configuration)"), node_id)  # todo: show node name?
-                node.stop()
+                self.ec2.meta.client.stop_instances(InstanceIds=[node_id])
         else:
-            node.terminate()
+            self.ec2.meta.client.terminate_instances(InstanceIds=[node_id])
 
-        # TODO (Alex): We are leaking the tag cache here. Naively, we would
-        # want to just remove the cache entry here, but terminating can be
-        # asyncrhonous or error, which would result in a use after free error.
-        # If this leak becomes bad, we can garbage collect the tag cache when
-        # the node cache is updated.
-        pass
+        # The tag cache entry is not removed here, as terminating can be
+        # asynchronous or error, which would result in a use after free error.
+        # It is garbage collected once the node has been missing from
+        # `non_terminated_nodes` for a while (see `_update_caches`).
 
     def terminate_nodes(self, node_ids):
         if not node_ids:
@@ -471,21 +915,88 @@ class AWSNodeProvider(NodeProvider):
 
     def _get_node(self, node_id):
         """Refresh and get info for this node, updating the cache."""
-        self.non_terminated_nodes({})  # Side effect: updates cache
+        if node_id not in self.cached_nodes:
+            # Most likely a new node, look for it in a listing of the whole
+            # cluster (unless there was one just now).
+            self._refresh_inventory()
+            node = self.cached_nodes.get(node_id)
+            if node is not None:
+                return node
+
+        # Not in {pending, running}, which usually means the node was
+        # recently preempted or terminated, or we need fresher details than
+        # the cache has. Describe just this node.
+        nodes = self._refresh_nodes([node_id])
+        assert node_id in nodes, "Invalid instance id {}".format(node_id)
+        return nodes[node_id]
+
+    def _refresh_nodes(self, node_ids):
+        """Describe `node_ids`, updating their entries in the node cache.
+
+        Node IDs requested by concurrent callers within POINT_REFRESH_DELAY
+        are described together, so the number of DescribeInstances calls
+        scales with the number of nodes that need fresh state rather than
+        with the number of callers or the size of the cluster.
+
+        Returns a dict mapping node IDs to nodes, which includes every
+        existing node of `node_ids`.
+        """
+        with self._point_refresh_lock:
+            self._point_refresh_ids.update(node_ids)
+            refresh = self._point_refresh
+            is_leader = refresh is None
+            if is_leader:
+                refresh = self._point_refresh = _InflightCall()
+
+        if is_leader:
+            time.sleep(POINT_REFRESH_DELAY)
+            with self._point_refresh_lock:
+                batch = sorted(self._point_refresh_ids)
+                self._point_refresh_ids = set()
+                self._point_refresh = None
+            try:
+                refresh.result = self._describe_nodes(batch)
+                self._update_caches(refresh.result.values())
+            except Exception as e:
+                refresh.error = e
+            finally:
+                refresh.done.set()
+        else:
+            refresh.done.wait()
 
-        if node_id in self.cached_nodes:
-            return self.cached_nodes[node_id]
+        if refresh.error is not None:
+            raise refresh.error
+        return refresh.result
 
-        # Node not in {pending, running} -- retry with a point query. This
-        # usually means the node was recently preempted or terminated.
-        matches = list(self.ec2.instances.filter(InstanceIds=[node_id]))
-        assert len(matches) == 1, "Invalid instance id {}".format(node_id)
-        return matches[0]
+    def _describe_nodes(self, node_ids):
+        nodes = {}
+        for i in range(0, len(node_ids), POINT_REFRESH_BATCH_SIZE):
+            chunk = node_ids[i:i + POINT_REFRESH_BATCH_SIZE]
+            try:
+                found = self._describe_instances(InstanceIds=chunk)
+            except botocore.exceptions.ClientError as e:
+                if e.response.get("Error", {}).get(
+                        "Code") != "InvalidInstanceID.NotFound":
+                    raise
+                # A single unknown ID fails the whole request, describe the
+                # chunk one by one to still get the others.
+                found = []
+                for node_id in chunk:
+                    try:
+                        found += self._describe_instances(
+                            InstanceIds=[node_id])
+                    except botocore.exceptions.ClientError as e:
+                        if e.response.get("Error", {}).get(
+                                "Code") != "InvalidInstanceID.NotFound":
+                            raise
+            nodes.update((node.id, node) for node in found)
+        return nodes
 
     def _get_cached_node(self, node_id):
         """Return node info from cache if possible, otherwise fetches it."""
-        if node_id in self.cached_nodes:
-            return self.cached_nodes[node_id]
+        node = self.cached_nodes.get(node_id)
+        if node is not None:
+            return node
 
         return self._get_node(node_id)
 
@@ -510,32 +1021,43 @@ class AWSNodeProvider(NodeProvider):
         }
         available_node_types = cluster_config["available_node_types"]
         for node_type in available_node_types:
-            instance_type = available_node_types[node_type]["node_config"][
-                "InstanceType"]
-            if instance_type in instances_dict:
+            autodetected_resources = None
+            for instance_type in _instance_types(
+                    available_node_types[node_type]["node_config"]):
+                if instance_type not in instances_dict:
+                    raise ValueError(
+                        "Instance type " + instance_type +
+                        " is not available in AWS region: " +
+                        cluster_config["provider"]["region"] + ".")
                 cpus = instances_dict[instance_type]["VCpuInfo"][
                     "DefaultVCpus"]
-                autodetected_resources = {"CPU": cpus}
+                resources = {"CPU": cpus}
                 gpus = instances_dict[instance_type].get("GpuInfo",
                                                          {}).get("Gpus")
                 if gpus is not None:
                     # TODO(ameer): currently we support one gpu type per node.
                     assert len(gpus) == 1
                     gpu_name = gpus[0]["Name"]
-                    autodetected_resources.update({
+                    resources.update({
                         "GPU": gpus[0]["Count"],
                         f"accelerator_type:{gpu_name}": 1
                     })
-                autodetected_resources.update(
-                    available_node_types[node_type].get("resources", {}))
-                if autodetected_resources != \
-                        available_node_types[node_type].get("resources", {}):
-                    available_node_types[node_type][
-                        "resources"] = autodetected_resources
-                    logger.debug("Updating the resources of {} to {}.".format(
-                        node_type, autodetected_resources))
-            else:
-                raise ValueError("Instance type " + instance_type +
-                                 " is not available in AWS region: " +
-                                 cluster_config["provider"]["region"] + ".")
+                # Any of the instance types may be launched for this node
+                # type, so it only has the resources they all have.
+                if autodetected_resources is None:
+                    autodetected_resources = resources
+                else:
+                    autodetected_resources = {
+                        k: min(v, resources[k])
+                        for k, v in autodetected_resources.items()
+                        if k in resources
+                    }
+            autodetected_resources.update(
+                available_node_types[node_type].get("resources", {}))
+            if autodetected_resources != \
+                    available_node_types[node_type].get("resources", {}):
+                available_node_types[node_type][
+                    "resources"] = autodetected_resources
+                logger.debug("Updating the resources of {} to {}.".format(
+                    node_type, autodetected_resources))
         return cluster_config
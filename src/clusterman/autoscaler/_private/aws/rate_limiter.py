@@ -0,0 +1,154 @@
+"""Client-side rate limiting of EC2 API requests.
+
+EC2 throttles each account per region and per family of API actions. All
+clients of a region share one AdaptiveRateLimiter, which gives every family
+a token bucket. A bucket starts at the refill rate EC2 documents for the
+family, halves its rate when a request is throttled and then grows it back
+linearly (AIMD), so parallel updaters settle on a rate EC2 accepts instead
+of each thread backing off on its own.
+"""
+import logging
+import threading
+import time
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Families of EC2 actions and their (rate per second, burst) defaults.
+DESCRIBE = "describe"
+MUTATE = "mutate"
+TAGS = "tags"
+DEFAULT_LIMITS = {
+    DESCRIBE: (20, 100),
+    MUTATE: (5, 50),
+    TAGS: (10, 100),
+}
+# Rates never drop below this many requests per second.
+MIN_RATE = 0.5
+# How many requests per second a rate regains for every second without
+# throttling.
+RATE_INCREASE_PER_S = 1
+# Throttling errors within this long of a decrease are responses to requests
+# sent at the old rate and do not decrease it again.
+DECREASE_COOLDOWN_S = 1
+THROTTLING_ERROR_CODES = {
+    "RequestLimitExceeded",
+    "Throttling",
+    "ThrottlingException",
+    "RequestThrottled",
+    "RequestThrottledException",
+}
+
+
+def action_family(operation_name):
+    """Returns the throttling family of an EC2 action, e.g. "describe" for
+    DescribeInstances."""
+    if operation_name in ("CreateTags", "DeleteTags"):
+        return TAGS
+    if operation_name.startswith(("Describe", "Get", "List")):
+        return DESCRIBE
+    return MUTATE
+
+
+class TokenBucket:
+    """Token bucket with an AIMD controlled refill rate.
+
+    Arguments:
+        max_rate: Refill rate in tokens per second, and the most the rate is
+            increased to.
+        burst: Most tokens the bucket holds.
+    """
+
+    def __init__(self, max_rate, burst):
+        self.max_rate = max_rate
+        self.burst = burst
+        self._rate = max_rate
+        self._tokens = burst
+        self._lock = threading.Lock()
+        self._updated_at = time.monotonic()
+        self._decreased_at = float("-inf")
+
+    @property
+    def rate(self):
+        """The current refill rate in tokens per second."""
+        with self._lock:
+            return self._rate
+
+    def _refill(self, now):
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._tokens = min(self.burst, self._tokens + elapsed * self._rate)
+        if now - self._decreased_at >= DECREASE_COOLDOWN_S:
+            self._rate = min(self.max_rate,
+                             self._rate + elapsed * RATE_INCREASE_PER_S)
+
+    def acquire(self):
+        """Take a token, sleeping until one is available.
+
+        Tokens are reserved in order of arrival: a caller that finds the
+        bucket empty takes a token from the future and sleeps until then.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            delay = -self._tokens / self._rate if self._tokens < 0 else 0
+        if delay > 0:
+            time.sleep(delay)
+
+    def on_throttled(self):
+        """Halve the rate, unless it was just decreased."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now - self._decreased_at < DECREASE_COOLDOWN_S:
+                return False
+            self._decreased_at = now
+            self._rate = max(MIN_RATE, self._rate / 2)
+            return True
+
+
+class AdaptiveRateLimiter:
+    """Rate limits the EC2 requests of the clients attached to it."""
+
+    def __init__(self, limits=None):
+        limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.buckets = {
+            family: TokenBucket(rate, burst)
+            for family, (rate, burst) in limits.items()
+        }
+
+    @property
+    def rates(self):
+        """The current rate of each family in requests per second."""
+        return {family: b.rate for family, b in self.buckets.items()}
+
+    def attach(self, client):
+        """Rate limit every attempt of every request `client` makes."""
+        events = client.meta.events
+        events.register("before-send.ec2", self._before_send)
+        events.register("needs-retry.ec2", self._needs_retry)
+
+    def _bucket(self, event_name):
+        return self.buckets[action_family(event_name.rsplit(".", 1)[-1])]
+
+    def _before_send(self, event_name, **kwargs):
+        self._bucket(event_name).acquire()
+
+    def _needs_retry(self, event_name, response=None, **kwargs):
+        # Only observes the response, botocore still decides whether to retry.
+        if response is None:
+            return None
+        code = response[1].get("Error", {}).get("Code")
+        if code in THROTTLING_ERROR_CODES:
+            family = action_family(event_name.rsplit(".", 1)[-1])
+            if self.buckets[family].on_throttled():
+                logger.info("AdaptiveRateLimiter: EC2 throttled {} requests, "
+                            "rate reduced to {:.2f}/s".format(
+                                family, self.buckets[family].rate))
+        return None
+
+
+@lru_cache()
+def get_rate_limiter(region):
+    """Returns the limiter shared by all EC2 clients of `region`."""
+    return AdaptiveRateLimiter()
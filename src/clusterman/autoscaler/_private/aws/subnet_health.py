@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import defaultdict
+
+from clusterman.autoscaler._private.json_store import JSONStore, cache_path
+
+SUBNET_HEALTH_VERSION = 1
+DEFAULT_SUBNET_HEALTH_PATH = cache_path("subnet-health.json")
+# Launch outcomes lose half their weight every this many seconds, so that a
+# subnet that ran out of capacity is tried again eventually.
+HALF_LIFE_S = 60 * 60
+# Typical time for an instance to get from launch to running. Subnets with
+# no measurements are assumed to take this long.
+REFERENCE_TIME_TO_RUNNING_S = 60
+# Weight of the latest time to running in its moving average.
+TIME_TO_RUNNING_ALPHA = 0.3
+# Scores are rounded to this precision when ranking, so that subnets about
+# as healthy as each other are still used round-robin.
+SCORE_PRECISION = 1
+# Subnets not launched in for this long are dropped on save.
+MAX_ENTRY_AGE_S = 30 * 24 * 60 * 60
+
+
+def _time_factor(time_to_running):
+    # From 1 for instant launches down to 0.75 for very slow ones: only
+    # subnets much slower than the others are avoided, failing ones are
+    # much worse.
+    return 1 - 0.25 * time_to_running / (time_to_running +
+                                         REFERENCE_TIME_TO_RUNNING_S)
+
+
+class SubnetHealth:
+    """Launch success rate and time to running of subnets.
+
+    Used to prefer the subnets that recently delivered instances, and
+    persisted so that later CLI invocations know about them too.
+
+    Arguments:
+        path: Location of the JSON file backing the store. If None, it only
+            lives in memory.
+    """
+
+    def __init__(self, path=DEFAULT_SUBNET_HEALTH_PATH):
+        self.path = path
+        self._store = (JSONStore(path, SUBNET_HEALTH_VERSION, "subnet health")
+                       if path is not None else None)
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = self._store.load() if self._store else {}
+
+    def _entry(self, subnet_id, now):
+        entry = self._entries.setdefault(subnet_id, {
+            "success_rate": 1.0,
+            "weight": 0.0,
+            "time_to_running_s": None,
+            "updated": now,
+        })
+        # Decay the weight of past outcomes.
+        entry["weight"] *= 0.5**((now - entry["updated"]) / HALF_LIFE_S)
+        entry["updated"] = now
+        return entry
+
+    def record_launch(self, subnet_id, success):
+        """Record the outcome of a launch attempt in `subnet_id`.
+
+        `success` is whether the attempt succeeded, or the fraction of the
+        requested instances that were launched.
+        """
+        with self._lock:
+            self._load()
+            entry = self._entry(subnet_id, time.time())
+            weight = entry["weight"]
+            entry["success_rate"] = (entry["success_rate"] * weight +
+                                     float(success)) / (weight + 1)
+            entry["weight"] = weight + 1
+
+    def record_time_to_running(self, subnet_id, seconds):
+        """Record how long an instance launched in `subnet_id` took to run."""
+        with self._lock:
+            self._load()
+            entry = self._entry(subnet_id, time.time())
+            previous = entry["time_to_running_s"]
+            entry["time_to_running_s"] = seconds if previous is None else (
+                TIME_TO_RUNNING_ALPHA * seconds +
+                (1 - TIME_TO_RUNNING_ALPHA) * previous)
+
+    def score(self, subnet_id):
+        """Returns the health of `subnet_id` between 0 and 1.
+
+        Subnets with no history score as well as ones that always launch
+        successfully in REFERENCE_TIME_TO_RUNNING_S.
+        """
+        with self._lock:
+            self._load()
+            entry = self._entries.get(subnet_id)
+            if entry is None:
+                return _time_factor(REFERENCE_TIME_TO_RUNNING_S)
+            age = time.time() - entry["updated"]
+            weight = entry["weight"] * 0.5**(age / HALF_LIFE_S)
+            # Start from a prior of one successful launch.
+            success_rate = (entry["success_rate"] * weight + 1) / (weight + 1)
+            time_to_running = (entry["time_to_running_s"]
+                               or REFERENCE_TIME_TO_RUNNING_S)
+        return success_rate * _time_factor(time_to_running)
+
+    def rank(self, subnet_ids, index=0):
+        """Returns `subnet_ids` sorted from most to least healthy.
+
+        Subnets of about the same health are rotated by `index`, so that
+        launches are spread round-robin among the healthiest subnets.
+        """
+        tiers = defaultdict(list)
+        for subnet_id in subnet_ids:
+            tiers[round(self.score(subnet_id), SCORE_PRECISION)].append(
+                subnet_id)
+        ranked = []
+        for _, tier in sorted(tiers.items(), reverse=True):
+            offset = index % len(tier)
+            ranked += tier[offset:] + tier[:offset]
+        return ranked
+
+    def save(self):
+        """Write the store back to disk, dropping long unused subnets."""
+        with self._lock:
+            if self._store is None or self._entries is None:
+                return
+            cutoff = time.time() - MAX_ENTRY_AGE_S
+            self._entries = {
+                subnet_id: entry
+                for subnet_id, entry in self._entries.items()
+                if entry["updated"] > cutoff
+            }
+            self._store.save(self._entries)
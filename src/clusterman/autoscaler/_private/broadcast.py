@@ -0,0 +1,234 @@
+import collections
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from shlex import quote
+
+from clusterman.autoscaler._private.cli_logger import cf, cli_logger
+from clusterman.autoscaler._private.command_runner import SSHCommandRunner, quote_remote_path
+from clusterman.autoscaler._private.constants import FILE_MOUNTS_RELAY_FANOUT
+
+logger = logging.getLogger(__name__)
+
+# Where the relay key is copied to on nodes that relay files.
+RELAY_KEY_PATH = "~/cls_relay_key.pem"
+# How many nodes relay keys are removed from at once.
+CLEANUP_PARALLELISM = 32
+
+
+class FileMountBroadcaster:
+    """Distributes file mounts to many nodes by relaying between the nodes.
+
+    The first node to ask for a path gets it from the launcher. Every other
+    node receives it over the internal network from a node that already has
+    a complete copy, and then becomes a source itself. The copies therefore
+    spread as a tree, and the launcher uploads each path only once.
+
+    If a relay fails, or a node cannot take part in relaying (e.g. it uses a
+    docker command runner), the node falls back to uploading from the
+    launcher.
+
+    Nodes reach each other with a key pair generated for this broadcaster
+    only. Its private key is copied to the nodes that send, its public key
+    is authorized on the nodes that receive, and `close` removes both.
+
+    Arguments:
+        max_relays_per_node: How many nodes a single node sends to at once.
+    """
+
+    def __init__(self, max_relays_per_node=FILE_MOUNTS_RELAY_FANOUT):
+        self.max_relays_per_node = max(1, max_relays_per_node)
+        self._cond = threading.Condition()
+        # (source, target) -> {node_id: updater} of nodes with a full copy.
+        self._holders = collections.defaultdict(dict)
+        # (source, target) keys currently being uploaded by the launcher.
+        self._seeding = set()
+        # node_id -> number of relays the node is currently sending.
+        self._active_relays = collections.defaultdict(int)
+        self._key_comment = "cls-relay-{}".format(uuid.uuid4().hex[:12])
+        self._key_dir = None
+        self._public_key = None
+        # Guards the two below. Nodes are prepared under their own lock, so
+        # that different nodes are prepared in parallel.
+        self._key_lock = threading.Lock()
+        self._node_key_locks = collections.defaultdict(threading.Lock)
+        # "private" (holds the private key) or "authorized" (accepts it) ->
+        # {node_id: updater}.
+        self._prepared_nodes = {"private": {}, "authorized": {}}
+
+    def sync_cmd(self, updater):
+        """Returns a sync function for `NodeUpdater.sync_file_mounts`."""
+        return partial(self.sync, updater)
+
+    def sync(self, updater, source, target, docker_mount_if_possible=False):
+        """Copy local `source` to `target` on the updater's node."""
+        if not self._can_relay(updater):
+            updater.upload_file_mount(
+                source, target,
+                docker_mount_if_possible=docker_mount_if_possible)
+            return
+
+        key = (source, target)
+        holder = self._acquire_source(key)
+        if holder is None:
+            try:
+                updater.upload_file_mount(
+                    source,
+                    target,
+                    docker_mount_if_possible=docker_mount_if_possible)
+            finally:
+                with self._cond:
+                    self._seeding.discard(key)
+                    self._cond.notify_all()
+        else:
+            try:
+                self._relay(holder, updater, target)
+            except Exception as e:
+                cli_logger.warning(
+                    "{}Relaying {} from {} failed ({}), "
+                    "uploading from the launcher instead.",
+                    updater.log_prefix, cf.bold(target), holder.node_id,
+                    str(e))
+                updater.upload_file_mount(
+                    source,
+                    target,
+                    docker_mount_if_possible=docker_mount_if_possible)
+            finally:
+                with self._cond:
+                    self._active_relays[holder.node_id] -= 1
+                    self._cond.notify_all()
+
+        with self._cond:
+            self._holders[key][updater.node_id] = updater
+            self._cond.notify_all()
+
+    def _can_relay(self, updater):
+        return (shutil.which("ssh-keygen") is not None
+                and type(updater.cmd_runner) is SSHCommandRunner)
+
+    def _acquire_source(self, key):
+        """Pick a node to copy `key` from.
+
+        Returns None if the caller should upload from the launcher instead.
+        Blocks while every node with a copy is busy relaying.
+        """
+        with self._cond:
+            while True:
+                holders = self._holders[key]
+                if not holders and key not in self._seeding:
+                    self._seeding.add(key)
+                    return None
+                if holders:
+                    node_id = min(holders, key=self._active_relays.__getitem__)
+                    if (self._active_relays[node_id] <
+                            self.max_relays_per_node):
+                        self._active_relays[node_id] += 1
+                        return holders[node_id]
+                self._cond.wait()
+
+    def _private_key_path(self):
+        """Returns the local path of the relay key, generating it first."""
+        with self._key_lock:
+            if self._key_dir is None:
+                # mkdtemp makes a directory only readable by its owner.
+                key_dir = tempfile.mkdtemp(prefix="cls-relay-")
+                path = os.path.join(key_dir, "key")
+                subprocess.check_call([
+                    "ssh-keygen", "-q", "-t", "ed25519", "-N", "", "-C",
+                    self._key_comment, "-f", path
+                ])
+                with open(path + ".pub") as f:
+                    self._public_key = f.read().strip()
+                self._key_dir = key_dir
+            return os.path.join(self._key_dir, "key")
+
+    def _prepare_node(self, kind, updater, prepare):
+        """Runs `prepare(updater)` once per node and `kind`."""
+        node_id = updater.node_id
+        with self._key_lock:
+            if node_id in self._prepared_nodes[kind]:
+                return
+            node_lock = self._node_key_locks[(kind, node_id)]
+        with node_lock:
+            with self._key_lock:
+                if node_id in self._prepared_nodes[kind]:
+                    return
+            prepare(updater)
+            with self._key_lock:
+                self._prepared_nodes[kind][node_id] = updater
+
+    def _copy_private_key(self, holder):
+        holder.cmd_runner.run_rsync_up(self._private_key_path(),
+                                       RELAY_KEY_PATH)
+        holder.cmd_runner.run(
+            "chmod 600 {}".format(RELAY_KEY_PATH), run_env="host")
+
+    def _authorize_key(self, updater):
+        self._private_key_path()
+        updater.cmd_runner.run(
+            "mkdir -p ~/.ssh && chmod 700 ~/.ssh && "
+            "echo {} >> ~/.ssh/authorized_keys".format(
+                quote(self._public_key)),
+            run_env="host")
+
+    def _ensure_relay_key(self, holder):
+        self._prepare_node("private", holder, self._copy_private_key)
+
+    def _cleanup_node(self, updater, kinds):
+        commands = []
+        if "private" in kinds:
+            commands.append("rm -f {}".format(RELAY_KEY_PATH))
+        if "authorized" in kinds:
+            commands.append("sed -i {} ~/.ssh/authorized_keys".format(
+                quote("/ {}$/d".format(self._key_comment))))
+        try:
+            updater.cmd_runner.run(" && ".join(commands), run_env="host")
+        except Exception as e:
+            cli_logger.warning(
+                "{}Failed to remove the file mount relay key: {}",
+                updater.log_prefix, str(e))
+
+    def close(self):
+        """Remove the relay key from every node it was copied to or
+        authorized on, and from the launcher."""
+        with self._key_lock:
+            prepared = self._prepared_nodes
+            self._prepared_nodes = {"private": {}, "authorized": {}}
+            key_dir, self._key_dir = self._key_dir, None
+        nodes = {}
+        for kind, updaters in prepared.items():
+            for node_id, updater in updaters.items():
+                nodes.setdefault(node_id, (updater, set()))[1].add(kind)
+        if nodes:
+            with ThreadPoolExecutor(
+                    min(len(nodes), CLEANUP_PARALLELISM)) as executor:
+                for updater, kinds in nodes.values():
+                    executor.submit(self._cleanup_node, updater, kinds)
+        if key_dir is not None:
+            shutil.rmtree(key_dir, ignore_errors=True)
+
+    def _relay(self, holder, updater, target):
+        self._ensure_relay_key(holder)
+        self._prepare_node("authorized", updater, self._authorize_key)
+        dest_ip = updater.provider.internal_ip(updater.node_id)
+        # Host keys of the other nodes are not known, like the launcher's own
+        # ssh connections (see SSHOptions) the relay hops do not check them.
+        rsh = " ".join([
+            "ssh", "-i", RELAY_KEY_PATH, "-o", "StrictHostKeyChecking=no",
+            "-o", "UserKnownHostsFile=/dev/null", "-o", "IdentitiesOnly=yes"
+        ])
+        # Relays always use the internal network, where compression only
+        # slows the transfer down.
+        command = "rsync -a --rsh {} {} {}@{}:{}".format(
+            quote(rsh), quote_remote_path(target),
+            updater.cmd_runner.ssh_user, dest_ip,
+            quote_remote_path(target))
+        cli_logger.verbose("{}Relaying {} from {}", updater.log_prefix,
+                           cf.bold(target), holder.node_id)
+        holder.cmd_runner.run(command, run_env="host")
@@ -6,19 +6,34 @@ import os
 import subprocess
 import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from types import ModuleType
 from typing import Any, Dict, List, Optional
 
 import yaml
 
 import clusterman.autoscaler._private.subprocess_output_util as cmd_output_util
+from clusterman.autoscaler._private.async_updater import (
+    MAX_PROVIDER_CALL_THREADS,
+    AsyncNodeUpdater,
+    AsyncNodeUpdaterScheduler
+)
+from clusterman.autoscaler._private.broadcast import FileMountBroadcaster
 from clusterman.autoscaler._private.cli_logger import cf, cli_logger
 from clusterman.autoscaler._private.command_runner import set_rsync_silent, set_using_login_shells
+from clusterman.autoscaler._private.constants import AUTOSCALER_MAX_CONCURRENT_UPDATERS
 from clusterman.autoscaler._private.event_system import CreateClusterEvent, global_event_system
 from clusterman.autoscaler._private.log_timer import LogTimer
 from clusterman.autoscaler._private.providers import _NODE_PROVIDERS, _PROVIDER_PRETTY_NAMES, _get_node_provider
-from clusterman.autoscaler._private.updater import NodeUpdaterThread
-from clusterman.autoscaler._private.util import hash_launch_conf, hash_runtime_conf, prepare_config, validate_config
+from clusterman.autoscaler._private.updater import NodeUpdaterScheduler, NodeUpdaterThread
+from clusterman.autoscaler._private.util import (
+    DEFAULT_HASH_ALGORITHM,
+    hash_launch_conf,
+    hash_runtime_conf,
+    prepare_config,
+    validate_config
+)
 from clusterman.autoscaler.node_provider import NodeProvider
 from clusterman.autoscaler.tags import (
     NODE_KIND_WORKER,
@@ -26,7 +41,8 @@ from clusterman.autoscaler.tags import (
     TAG_LAUNCH_CONFIG,
     TAG_NODE_KIND,
     TAG_NODE_NAME,
-    TAG_NODE_STATUS
+    TAG_NODE_STATUS,
+    TAG_RUNTIME_CONFIG
 )
 from clusterman.util.debug import log_once
 
@@ -34,6 +50,31 @@ logger = logging.getLogger(__name__)
 
 POLL_INTERVAL = 5
 
+# Config keys left out of the runtime hash of workers.
+SCALING_CONFIG_KEYS = ("num_workers", "warm_pool_size")
+
+# Node updater implementations, keyed by the `--updater-engine` choice.
+UPDATER_ENGINES = {
+    "thread": (NodeUpdaterThread, NodeUpdaterScheduler),
+    "asyncio": (AsyncNodeUpdater, AsyncNodeUpdaterScheduler),
+}
+
+
+def set_provider_concurrency(config: Dict[str, Any],
+                             max_concurrent_updaters: int,
+                             updater_engine: str) -> None:
+    """Sizes the provider's connection pools for the concurrent updaters.
+
+    Thread updaters each call the provider from their own thread, while
+    the asyncio engine makes provider calls from a bounded thread pool.
+    """
+    concurrency = max_concurrent_updaters
+    if updater_engine == "asyncio":
+        concurrency = min(concurrency, MAX_PROVIDER_CALL_THREADS)
+    if config["provider"]["type"] == "aws":
+        from clusterman.autoscaler._private.aws.clients import set_max_concurrency
+        set_max_concurrency(concurrency)
+
 
 def try_logging_config(config: Dict[str, Any]) -> None:
     if config["provider"]["type"] == "aws":
@@ -59,43 +100,135 @@ def try_reload_log_state(provider_config: Dict[str, Any],
 
 def create_nodes(config: Dict[str, Any],
                  yes: bool,
+                 pipelined: bool = True,
+                 max_concurrent_updaters: int = AUTOSCALER_MAX_CONCURRENT_UPDATERS,
+                 updater_engine: str = "thread",
                  _provider: Optional[NodeProvider] = None,
                  _runner: ModuleType = subprocess) -> None:
     provider = (_provider or _get_node_provider(config["provider"],
                                                 config["cluster_name"]))
 
     worker_filter = {TAG_NODE_KIND: NODE_KIND_WORKER}
-    launch_config = copy.deepcopy(config["worker_nodes"])
-    launch_hash = hash_launch_conf(launch_config, config["auth"])
     count = int(config["num_workers"])
     cli_logger.print("Launching {} nodes.".format(count))
     node_config = copy.deepcopy(config["worker_nodes"])
-    node_tags = {
+    created = provider.create_node(node_config, _worker_node_tags(config),
+                                   count)
+    if created is not None and len(created) < count:
+        # Only wait for the nodes that were actually launched.
+        cli_logger.warning("Only {} of {} workers could be launched.",
+                           len(created), count)
+        count = len(created)
+
+    with _file_mount_broadcaster(config) as broadcaster:
+        make_updater = _worker_updater_factory(config, provider,
+                                               updater_engine, _runner,
+                                               broadcaster)
+        _, scheduler_cls = UPDATER_ENGINES[updater_engine]
+
+        # When pipelined, submit an updater for each worker as soon as it
+        # shows up, so that waiting for SSH, syncing files and running setup
+        # commands on the early nodes overlaps with the launch of the
+        # stragglers.
+        scheduler = scheduler_cls(max_concurrent_updaters)
+        updaters = {}
+        with cli_logger.group("Fetching the new worker nodes"):
+            while True:
+                nodes = provider.non_terminated_nodes(worker_filter)
+                if not pipelined and len(nodes) < count:
+                    nodes = []
+                for worker in nodes:
+                    if worker in updaters:
+                        continue
+                    updater = make_updater(worker)
+                    scheduler.submit(updater)
+                    updaters[worker] = updater
+                if len(updaters) >= count:
+                    break
+                cli_logger.print(
+                    "{} of {} workers found, polling again in {} seconds.",
+                    cf.bold(len(updaters)),
+                    count,
+                    POLL_INTERVAL,
+                    _tags=dict(
+                        queued=str(scheduler.queue_depth),
+                        in_flight=str(scheduler.in_flight)))
+                time.sleep(POLL_INTERVAL)
+        cli_logger.newline()
+        _wait_for_setup(scheduler)
+    provider.flush_node_tags()
+    provider.non_terminated_nodes(worker_filter)
+    for up in updaters.values():
+        if up.exitcode != 0:
+            cli_logger.abort("Fail to setup worker node. ")
+
+
+def _wait_for_setup(scheduler) -> None:
+    """Wait for all updaters submitted to `scheduler`, then close it."""
+    while not scheduler.wait(timeout=POLL_INTERVAL):
+        cli_logger.print(
+            "Waiting for worker setup to finish.",
+            _tags=dict(
+                queued=str(scheduler.queue_depth),
+                in_flight=str(scheduler.in_flight),
+                done=str(scheduler.completed)))
+    scheduler.close()
+
+
+def _worker_node_tags(config: Dict[str, Any]) -> Dict[str, str]:
+    """Returns the tags of newly launched workers."""
+    launch_hash = hash_launch_conf(config["worker_nodes"], config["auth"])
+    return {
         TAG_NODE_NAME: "cls-{}-worker".format(config["cluster_name"]),
         TAG_NODE_KIND: NODE_KIND_WORKER,
         TAG_NODE_STATUS: STATUS_UNINITIALIZED,
         TAG_LAUNCH_CONFIG: launch_hash,
     }
-    provider.create_node(node_config, node_tags, count)
-    start = time.time()
-    workers = []
-    prev = start
-    with cli_logger.group("Fetching the new worker node"):
-        while True:
-            nodes = provider.non_terminated_nodes(worker_filter)
-            cur = time.time()
-            if cur - prev > 50:
-                prev = cur
-            if len(nodes) >= count:
-                workers = nodes
-                break
-            time.sleep(POLL_INTERVAL)
-    cli_logger.newline()
-    updaters = []
-    (runtime_hash, file_mounts_contents_hash) = hash_runtime_conf(
-        config["file_mounts"], None, config)
-    for worker in workers:
-        updater = NodeUpdaterThread(
+
+
+def _worker_runtime_hashes(config: Dict[str, Any]):
+    """Returns the runtime hash and file mounts contents hash of workers."""
+    hash_algorithm = config.get("file_mounts_hash_algorithm",
+                                DEFAULT_HASH_ALGORITHM)
+    # How many workers there are does not change how they are set up, so
+    # that warm pool workers stay current whatever the cluster size.
+    runtime_config = {
+        k: v
+        for k, v in config.items() if k not in SCALING_CONFIG_KEYS
+    }
+    return hash_runtime_conf(
+        config["file_mounts"],
+        None,
+        runtime_config,
+        hash_algorithm=hash_algorithm)
+
+
+def _rsync_options(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the file mount sync options of node updaters."""
+    return {
+        "rsync_exclude": config.get("rsync_exclude"),
+        "rsync_filter": config.get("rsync_filter"),
+        "incremental_file_mounts": config.get("incremental_file_mounts",
+                                              False),
+        "file_mounts_options": config.get("file_mounts_options"),
+        "hash_algorithm": config.get("file_mounts_hash_algorithm",
+                                     DEFAULT_HASH_ALGORITHM),
+    }
+
+
+def _worker_updater_factory(
+        config: Dict[str, Any],
+        provider: NodeProvider,
+        updater_engine: str,
+        _runner: ModuleType,
+        broadcaster: Optional[FileMountBroadcaster] = None):
+    """Returns a function making the updater that sets up a worker."""
+    (runtime_hash,
+     file_mounts_contents_hash) = _worker_runtime_hashes(config)
+    updater_cls, _ = UPDATER_ENGINES[updater_engine]
+
+    def make_updater(worker):
+        return updater_cls(
             node_id=worker,
             provider_config=config["provider"],
             provider=provider,
@@ -108,18 +241,30 @@ def create_nodes(config: Dict[str, Any],
             runtime_hash=runtime_hash,
             is_head_node=False,
             file_mounts_contents_hash=file_mounts_contents_hash,
-            rsync_options={
-                "rsync_exclude": config.get("rsync_exclude"),
-                "rsync_filter": config.get("rsync_filter")
-            },
+            rsync_options=_rsync_options(config),
+            file_mount_broadcaster=broadcaster,
         )
-        updater.start()
-        updaters.append(updater)
-    for up in updaters:
-        up.join()
-        provider.non_terminated_nodes(worker_filter)
-        if up.exitcode != 0:
-            cli_logger.abort("Fail to setup worker node. ")
+
+    return make_updater
+
+
+def _get_file_mount_broadcaster(config: Dict[str, Any]
+                                ) -> Optional[FileMountBroadcaster]:
+    if config.get("file_mounts_distribution", "direct") == "tree":
+        return FileMountBroadcaster()
+    return None
+
+
+@contextmanager
+def _file_mount_broadcaster(config: Dict[str, Any], enabled: bool = True):
+    """Yields the broadcaster of `config`, if any and `enabled`, and removes
+    its relay keys from the nodes once the file mounts are distributed."""
+    broadcaster = _get_file_mount_broadcaster(config) if enabled else None
+    try:
+        yield broadcaster
+    finally:
+        if broadcaster is not None:
+            broadcaster.close()
 
 
 def create_or_update_cluster(
@@ -130,6 +275,9 @@ def create_or_update_cluster(
     no_config_cache: bool = False,
     redirect_command_output: Optional[bool] = False,
     use_login_shells: bool = True,
+    pipelined: bool = True,
+    max_concurrent_updaters: int = AUTOSCALER_MAX_CONCURRENT_UPDATERS,
+    updater_engine: str = "thread",
 ):
     set_using_login_shells(use_login_shells)
     if not use_login_shells:
@@ -199,10 +347,16 @@ def create_or_update_cluster(
     cli_logger.labeled_value("Cluster", config["cluster_name"])
 
     cli_logger.newline()
+    set_provider_concurrency(config, max_concurrent_updaters, updater_engine)
     config = _bootstrap_config(config, no_config_cache=no_config_cache)
 
     try_logging_config(config)
-    create_nodes(config, yes)
+    create_nodes(
+        config,
+        yes,
+        pipelined=pipelined,
+        max_concurrent_updaters=max_concurrent_updaters,
+        updater_engine=updater_engine)
     return config
 
 
@@ -318,6 +472,153 @@ def teardown_cluster(config_file: str, yes: bool,
                              cf.bold(len(A)), POLL_INTERVAL)
         cli_logger.success("No nodes remaining.")
 
+    warm_pool_size = config.get("warm_pool_size")
+    if warm_pool_size:
+        reason = _warm_pool_unsupported_reason(config)
+        if reason is not None:
+            cli_logger.warning("Not topping up the warm pool: {}.", reason)
+            return
+        with cli_logger.group("Topping up the warm pool"):
+            fill_warm_pool(config, warm_pool_size, provider)
+
+
+def _warm_pool_unsupported_reason(config: Dict[str, Any]) -> Optional[str]:
+    """Returns why the workers of `config` cannot be kept in a warm pool, or
+    None if they can."""
+    provider_config = config["provider"]
+    if provider_config["type"] != "aws":
+        return "only AWS nodes can be stopped"
+    if not provider_config.get("cache_stopped_nodes", True):
+        return "`cache_stopped_nodes` is disabled"
+    from clusterman.autoscaler._private.aws.fleet import is_spot
+    if is_spot(config["worker_nodes"]):
+        return "spot instances cannot be stopped"
+    return None
+
+
+def fill_cluster_warm_pool(
+        config_file: str,
+        yes: bool,
+        size: Optional[int],
+        override_cluster_name: Optional[str] = None,
+        no_config_cache: bool = False,
+        max_concurrent_updaters: int = AUTOSCALER_MAX_CONCURRENT_UPDATERS,
+        updater_engine: str = "thread") -> None:
+    """Fills the warm pool of stopped workers of a cluster.
+
+    Arguments:
+        config_file: path to the cluster yaml
+        yes: whether to skip the confirmation prompt
+        size: how many workers to keep in the pool, `warm_pool_size` of the
+            cluster config if None
+        override_cluster_name: set the name of the cluster
+        no_config_cache: whether to disable the local cluster config cache
+        max_concurrent_updaters: how many workers to set up at the same time
+        updater_engine: how workers are set up, "thread" or "asyncio"
+    """
+    config = yaml.safe_load(open(config_file).read())
+    if override_cluster_name is not None:
+        config["cluster_name"] = override_cluster_name
+    set_provider_concurrency(config, max_concurrent_updaters, updater_engine)
+    config = _bootstrap_config(config, no_config_cache=no_config_cache)
+
+    if size is None:
+        size = config.get("warm_pool_size")
+    if size is None:
+        cli_logger.abort(
+            "No warm pool size given. Pass {} or set {} in the cluster "
+            "configuration.", cf.bold("--size"), cf.bold("warm_pool_size"))
+    reason = _warm_pool_unsupported_reason(config)
+    if reason is not None:
+        cli_logger.abort("Cannot keep a warm pool of workers: {}.", reason)
+
+    cli_logger.confirm(
+        yes,
+        "Starting or launching workers to keep {} stopped workers ready.",
+        size,
+        _abort=True)
+    provider = _get_node_provider(config["provider"], config["cluster_name"])
+    fill_warm_pool(
+        config,
+        size,
+        provider,
+        max_concurrent_updaters=max_concurrent_updaters,
+        updater_engine=updater_engine)
+
+
+def fill_warm_pool(config: Dict[str, Any],
+                   size: int,
+                   provider: NodeProvider,
+                   max_concurrent_updaters: int = AUTOSCALER_MAX_CONCURRENT_UPDATERS,
+                   updater_engine: str = "thread",
+                   _runner: ModuleType = subprocess) -> None:
+    """Makes sure there are `size` stopped workers with the launch config of
+    `config` that are set up with its runtime config.
+
+    `create_node` restarts these workers before launching new ones, and their
+    updaters then only need to check that their config hashes are current.
+    Stale workers are started and set up again, missing ones launched and set
+    up, and the pool is ready once all of them have stopped. Ready workers,
+    and stale ones beyond `size`, are left stopped.
+    """
+    node_tags = _worker_node_tags(config)
+    pool_filter = {
+        TAG_NODE_KIND: NODE_KIND_WORKER,
+        TAG_LAUNCH_CONFIG: node_tags[TAG_LAUNCH_CONFIG],
+    }
+    runtime_hash, _ = _worker_runtime_hashes(config)
+    members = provider.stopped_nodes(pool_filter)
+    ready = []
+    stale = []
+    for node_id in members:
+        if provider.node_tags(node_id).get(TAG_RUNTIME_CONFIG) == runtime_hash:
+            ready.append(node_id)
+        else:
+            stale.append(node_id)
+    stale = stale[:max(0, size - len(ready))]
+    missing = max(0, size - len(ready) - len(stale))
+    cli_logger.print(
+        "{} of {} warm pool workers are ready.",
+        cf.bold(len(ready)),
+        size,
+        _tags=dict(stale=str(len(stale)), missing=str(missing)))
+
+    node_config = copy.deepcopy(config["worker_nodes"])
+    workers = list(stale)
+    if stale:
+        provider.start_nodes(stale, node_tags)
+    if missing:
+        # Launch new workers without restarting the pool.
+        launcher = _get_node_provider(
+            dict(config["provider"], cache_stopped_nodes=False),
+            config["cluster_name"])
+        workers += list(
+            launcher.create_node(node_config, node_tags, missing))
+
+    updaters = {}
+    if workers:
+        with _file_mount_broadcaster(config) as broadcaster:
+            make_updater = _worker_updater_factory(
+                config, provider, updater_engine, _runner, broadcaster)
+            _, scheduler_cls = UPDATER_ENGINES[updater_engine]
+            scheduler = scheduler_cls(max_concurrent_updaters)
+            for worker in workers:
+                updaters[worker] = make_updater(worker)
+                scheduler.submit(updaters[worker])
+            _wait_for_setup(scheduler)
+        provider.flush_node_tags()
+
+    # Ready workers may still be stopping, e.g. right after `down`. Workers
+    # that failed to set up keep a stale runtime hash, and are set up again
+    # next time.
+    provider.stop_nodes(ready + workers)
+    failed = [w for w, up in updaters.items() if up.exitcode != 0]
+    if failed:
+        cli_logger.abort("Failed to set up warm pool workers {}.",
+                         cli_logger.render_list(failed))
+    cli_logger.success("Warm pool has {} ready workers.",
+                       len(ready) + len(workers))
+
 
 def rsync(config_file: str,
           source: Optional[str],
@@ -328,6 +629,7 @@ def rsync(config_file: str,
           use_internal_ip: bool = False,
           no_config_cache: bool = False,
           all_nodes: bool = False,
+          parallelism: int = 1,
           _runner: ModuleType = subprocess) -> None:
     """Rsyncs files.
 
@@ -342,6 +644,7 @@ def rsync(config_file: str,
         use_internal_ip (bool): Whether the provided ip_address is
             public or private.
         all_nodes: whether to sync worker nodes in addition to the head node
+        parallelism: how many nodes to sync at the same time
     """
     if bool(source) != bool(target):
         cli_logger.abort(
@@ -382,15 +685,13 @@ def rsync(config_file: str,
             process_runner=_runner,
             file_mounts_contents_hash="",
             is_head_node=is_head_node,
-            rsync_options={
-                "rsync_exclude": config.get("rsync_exclude"),
-                "rsync_filter": config.get("rsync_filter")
-            },
-            docker_config=config.get("docker"))
+            rsync_options=_rsync_options(config),
+            docker_config=config.get("docker"),
+            file_mount_broadcaster=broadcaster)
         if down:
             rsync = updater.rsync_down
         else:
-            rsync = updater.rsync_up
+            rsync = updater.file_mount_sync_cmd()
 
         if source and target:
             # print rsync progress for single file rsync
@@ -403,8 +704,42 @@ def rsync(config_file: str,
 
     nodes = _get_worker_nodes(config, override_cluster_name)
 
-    for node_id in nodes:
-        rsync_to_node(node_id, is_head_node=False)
+    # Keep going when a node fails so that one unreachable node does not
+    # prevent the rest of the cluster from being synced.
+    failures = {}
+    start = last_report = time.time()
+    with _file_mount_broadcaster(config, enabled=not down) as broadcaster, \
+            ThreadPoolExecutor(max_workers=max(1, parallelism)) as executor:
+        futures = {
+            executor.submit(rsync_to_node, node_id, is_head_node=False):
+            node_id
+            for node_id in nodes
+        }
+        for i, future in enumerate(as_completed(futures), start=1):
+            node_id = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                failures[node_id] = e
+            if time.time() - last_report > POLL_INTERVAL and i < len(nodes):
+                last_report = time.time()
+                cli_logger.print(
+                    "Synced {}/{} nodes.",
+                    i,
+                    len(nodes),
+                    _tags=dict(failed=str(len(failures))))
+    cli_logger.print(
+        "Synced {} nodes in {:.1f} seconds.",
+        len(nodes) - len(failures),
+        time.time() - start,
+        _tags=dict(failed=str(len(failures))))
+
+    if failures:
+        with cli_logger.group("Failed to sync {} of {} nodes", len(failures),
+                              len(nodes)):
+            for node_id, e in failures.items():
+                cli_logger.error("{}: {}", cf.bold(node_id), str(e))
+        cli_logger.abort()
 
 
 def get_worker_node_ips(config_file: str,
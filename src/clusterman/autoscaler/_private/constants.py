@@ -40,6 +40,25 @@ AUTOSCALER_MAX_LAUNCH_BATCH = env_integer("AUTOSCALER_MAX_LAUNCH_BATCH", 5)
 AUTOSCALER_MAX_CONCURRENT_LAUNCHES = env_integer(
     "AUTOSCALER_MAX_CONCURRENT_LAUNCHES", 10)
 
+
+def _default_max_concurrent_updaters():
+    # Setting up a worker keeps an ssh process and its pipes open, so stay
+    # well below the open file limit.
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (ImportError, OSError, ValueError):
+        return 128
+    if soft == resource.RLIM_INFINITY:
+        return 512
+    return max(AUTOSCALER_MAX_CONCURRENT_LAUNCHES, min(512, soft // 8))
+
+
+# Max number of workers that are set up at a time. Setting up a worker is
+# mostly waiting on the network, so this is much higher than the launch limit.
+AUTOSCALER_MAX_CONCURRENT_UPDATERS = env_integer(
+    "AUTOSCALER_MAX_CONCURRENT_UPDATERS", _default_max_concurrent_updaters())
+
 # Interval at which to perform autoscaling updates.
 AUTOSCALER_UPDATE_INTERVAL_S = env_integer("AUTOSCALER_UPDATE_INTERVAL_S", 5)
 
@@ -57,3 +76,39 @@ AUTOSCALER_MAX_RESOURCE_DEMAND_VECTOR_SIZE = 1000
 BOTO_MAX_RETRIES = env_integer("BOTO_MAX_RETRIES", 12)
 # Max number of retries to create an EC2 node (retry different subnet)
 BOTO_CREATE_MAX_RETRIES = env_integer("BOTO_CREATE_MAX_RETRIES", 5)
+# How old the AWS instance inventory may be before a lookup of a node that
+# is missing details (e.g. an IP) describes the cluster again.
+AWS_INVENTORY_MAX_STALENESS_S = env_integer("AWS_INVENTORY_MAX_STALENESS_S",
+                                            5)
+# HTTP connections kept open per AWS client. Clients are shared by all
+# threads, so by default (0) this is one connection per thread making
+# provider calls (see aws/clients.py set_max_concurrency), plus
+# AWS_POOL_CONNECTIONS_HEADROOM for the provider's own background threads.
+AWS_MAX_POOL_CONNECTIONS = env_integer("AWS_MAX_POOL_CONNECTIONS", 0)
+AWS_POOL_CONNECTIONS_HEADROOM = env_integer("AWS_POOL_CONNECTIONS_HEADROOM",
+                                            10)
+# Whether EC2 requests are rate limited client-side, adapting to throttling
+# (see aws/rate_limiter.py).
+AWS_RATE_LIMIT = env_integer("AWS_RATE_LIMIT", 1)
+# Whether the launch success rate and time to running of AWS subnets are
+# persisted across CLI invocations to prefer healthy subnets. Set to 0 to
+# only track them for the lifetime of the process.
+AWS_SUBNET_HEALTH = env_integer("AWS_SUBNET_HEALTH", 1)
+# How long the AWS provider keeps the cached tags and state of a node after
+# it stops showing up in listings of pending and running nodes.
+AWS_NODE_CACHE_GRACE_S = env_integer("AWS_NODE_CACHE_GRACE_S", 600)
+
+# How many other nodes a single node relays file mounts to at the same time
+# when `file_mounts_distribution` is "tree".
+FILE_MOUNTS_RELAY_FANOUT = env_integer("FILE_MOUNTS_RELAY_FANOUT", 2)
+
+# Whether file mount content digests are persisted across CLI invocations.
+# Set to 0 to only cache them for the lifetime of the process.
+FILE_HASH_CACHE = env_integer("FILE_HASH_CACHE", 1)
+# With `incremental_file_mounts`, mounts with more changed subtrees than this
+# are synced in full.
+FILE_MOUNTS_MAX_INCREMENTAL_PATHS = env_integer(
+    "FILE_MOUNTS_MAX_INCREMENTAL_PATHS", 1000)
+# Number of threads used to hash file mount contents.
+FILE_HASH_THREADS = env_integer("FILE_HASH_THREADS",
+                                min(32, (os.cpu_count() or 1) + 4))
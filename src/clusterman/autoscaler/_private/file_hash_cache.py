@@ -0,0 +1,103 @@
+import hashlib
+import os
+import threading
+import time
+
+from clusterman.autoscaler._private.json_store import JSONStore, cache_path
+
+FILE_HASH_CACHE_VERSION = 1
+DEFAULT_FILE_HASH_CACHE_PATH = cache_path("file-hash-cache.json")
+# Files modified this recently are hashed but not cached: they could still be
+# written to within the same mtime tick without the mtime changing.
+RACY_MTIME_WINDOW_S = 2
+# Entries that have not been used for this long are dropped on save.
+MAX_ENTRY_AGE_S = 30 * 24 * 60 * 60
+# The last use of an entry is only recorded again after this long, so that
+# runs only hitting the cache do not rewrite it.
+LAST_USED_RESOLUTION_S = 24 * 60 * 60
+READ_CHUNK_SIZE = 2**20
+
+
+def hash_file(path, algorithm="sha1"):
+    """Returns the hex digest of the contents of the file at `path`."""
+    hasher = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class FileHashCache:
+    """Persistent cache of file content digests.
+
+    An entry is keyed by the file's absolute path and is only valid while
+    the file's size, mtime (in ns) and inode are unchanged, so unchanged
+    files are never read again across CLI invocations.
+
+    Arguments:
+        path: Location of the JSON file backing the cache. If None, the
+            cache only lives in memory.
+    """
+
+    def __init__(self, path=DEFAULT_FILE_HASH_CACHE_PATH):
+        self.path = path
+        self._store = (JSONStore(path, FILE_HASH_CACHE_VERSION,
+                                 "file hash cache")
+                       if path is not None else None)
+        self._lock = threading.Lock()
+        self._entries = None
+        self._dirty = False
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = self._store.load() if self._store else {}
+
+    def lookup(self, path, algorithm="sha1"):
+        """Returns the cached digest of the file at `path`, or None if the
+        file changed since it was last hashed."""
+        st = os.stat(path)
+        key = "{}:{}".format(algorithm, os.path.abspath(path))
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None or entry[:3] != [
+                    st.st_size, st.st_mtime_ns, st.st_ino
+            ]:
+                return None
+            now = time.time()
+            if now - entry[4] >= LAST_USED_RESOLUTION_S:
+                entry[4] = now
+                self._dirty = True
+            return entry[3]
+
+    def digest(self, path, algorithm="sha1"):
+        """Returns the hex digest of the file at `path`, reading it only if
+        it changed since it was last hashed."""
+        cached = self.lookup(path, algorithm)
+        if cached is not None:
+            return cached
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        digest = hash_file(path, algorithm)
+        now = time.time()
+        if now - st.st_mtime >= RACY_MTIME_WINDOW_S:
+            with self._lock:
+                self._load()
+                self._entries["{}:{}".format(algorithm, path)] = [
+                    st.st_size, st.st_mtime_ns, st.st_ino, digest, now
+                ]
+                self._dirty = True
+        return digest
+
+    def save(self):
+        """Write the cache back to disk, dropping long unused entries."""
+        with self._lock:
+            if self._store is None or not self._dirty:
+                return
+            cutoff = time.time() - MAX_ENTRY_AGE_S
+            self._entries = {
+                key: entry
+                for key, entry in self._entries.items() if entry[4] > cutoff
+            }
+            if self._store.save(self._entries):
+                self._dirty = False
@@ -0,0 +1,65 @@
+"""Small versioned JSON files persisting state across CLI invocations."""
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Per-user directory holding the stores, only accessible by its owner.
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "clusterman")
+
+
+def cache_path(name):
+    """Returns the default location of the store called `name`."""
+    return os.path.join(CACHE_DIR, name)
+
+
+class JSONStore:
+    """A dict of entries stored as JSON along with a format version.
+
+    Arguments:
+        path: Location of the JSON file.
+        version: Format version. Files of other versions are ignored.
+        description: What is stored, for log messages.
+    """
+
+    def __init__(self, path, version, description):
+        self.path = path
+        self.version = version
+        self.description = description
+
+    def load(self):
+        """Returns the stored entries, or an empty dict if the file is
+        missing, unreadable or of another version."""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable {} {}: {}".format(
+                self.description, self.path, e))
+            return {}
+        if not isinstance(data, dict) or data.get("_version") != self.version:
+            return {}
+        return data["entries"]
+
+    def save(self, entries):
+        """Atomically replace the stored entries. Returns whether they were
+        written."""
+        data = {"_version": self.version, "entries": entries}
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+            return True
+        except OSError as e:
+            logger.warning("Failed to write {} {}: {}".format(
+                self.description, self.path, e))
+            return False
@@ -0,0 +1,269 @@
+"""Merkle manifests of file mounts.
+
+A manifest records a digest for every file and directory under a mount. A
+directory's digest covers the names, kinds and digests of its children, so
+two manifests can be compared top-down and only the subtrees whose digests
+differ need to be sent to a node.
+"""
+import fnmatch
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from clusterman.autoscaler._private.util import DEFAULT_HASH_ALGORITHM, hash_files
+
+MANIFEST_VERSION = 1
+# Where manifests of synced mounts are kept on the nodes.
+REMOTE_MANIFEST_DIR = "~/.cls_manifests"
+# Where the manifests last built for each mount are written locally.
+LOCAL_MANIFEST_DIR = os.path.join(tempfile.gettempdir(), "cls-manifests")
+# Manifests are shared by all updaters syncing the same mount for this long
+# instead of being rebuilt for each node.
+MANIFEST_REUSE_S = 30
+# Local manifests older than this are removed.
+LOCAL_MANIFEST_MAX_AGE_S = 24 * 60 * 60
+# Printed around a manifest read from a node, so that login shell banners
+# and other output are not parsed as part of it.
+MANIFEST_BEGIN = "==cls-manifest-begin=="
+MANIFEST_END = "==cls-manifest-end=="
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+def _dir_digest(children, algorithm):
+    hasher = hashlib.new(algorithm)
+    for name in sorted(children):
+        child = children[name]
+        kind = "d" if "children" in child else "f"
+        hasher.update("{}\0{}\0{}\n".format(name, kind,
+                                            child["digest"]).encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def _matches(pattern, relpath, is_dir):
+    """Whether an rsync exclude `pattern` matches `relpath`.
+
+    As with rsync, a pattern starting with "/" is anchored to the root of
+    the transfer, one containing another "/" is matched against the end of
+    the path, and any other pattern against the last path component. A
+    pattern ending with "/" only matches directories.
+    """
+    if pattern.endswith("/"):
+        if not is_dir:
+            return False
+        pattern = pattern.rstrip("/")
+    if pattern.startswith("/"):
+        return fnmatch.fnmatchcase(relpath, pattern.lstrip("/"))
+    if "/" not in pattern:
+        return fnmatch.fnmatchcase(os.path.basename(relpath), pattern)
+    parts = relpath.split("/")
+    return any(
+        fnmatch.fnmatchcase("/".join(parts[i:]), pattern)
+        for i in range(len(parts)))
+
+
+def _read_filter_patterns(path):
+    """Returns the exclude patterns of an `rsync_filter` merge file."""
+    try:
+        with open(path) as f:
+            lines = [line.strip() for line in f]
+    except OSError:
+        return []
+    return [
+        line for line in lines
+        if line and not line.startswith(("#", ";", "!"))
+    ]
+
+
+def build_manifest(local_path,
+                   algorithm=DEFAULT_HASH_ALGORITHM,
+                   rsync_exclude=None,
+                   rsync_filter=None):
+    """Returns the manifest of the file or directory at `local_path`.
+
+    Symlinks are recorded by their target, like `rsync -a` copies them.
+    Entries matching `rsync_exclude`, or the patterns of the per-directory
+    `rsync_filter` files (e.g. ".gitignore"), are left out, as rsync does
+    not send them either.
+    """
+    local_path = os.path.expanduser(local_path)
+    rsync_exclude = list(rsync_exclude or [])
+    rsync_filter = list(rsync_filter or [])
+    files = []
+    links = []
+
+    def excluded(relpath, is_dir, dir_patterns):
+        if any(_matches(p, relpath, is_dir) for p in rsync_exclude):
+            return True
+        # Merge file patterns are relative to the directory holding them.
+        for base, patterns in dir_patterns:
+            subpath = relpath[len(base):].lstrip("/")
+            if any(_matches(p, subpath, is_dir) for p in patterns):
+                return True
+        return False
+
+    def scan(path, relpath="", dir_patterns=()):
+        if os.path.islink(path):
+            node = {}
+            links.append((node, os.readlink(path)))
+            return node
+        if not os.path.isdir(path):
+            node = {}
+            files.append((node, path))
+            return node
+        dir_patterns = list(dir_patterns)
+        for name in rsync_filter:
+            patterns = _read_filter_patterns(os.path.join(path, name))
+            if patterns:
+                dir_patterns.append((relpath, patterns))
+        children = {}
+        with os.scandir(path) as entries:
+            for entry in entries:
+                child_path = "/".join(filter(None, [relpath, entry.name]))
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if not excluded(child_path, is_dir, dir_patterns):
+                    children[entry.name] = scan(entry.path, child_path,
+                                                dir_patterns)
+        return {"children": children}
+
+    root = scan(local_path)
+    digests = hash_files([path for _, path in files], algorithm)
+    for (node, _), digest in zip(files, digests):
+        node["digest"] = digest
+    for node, target in links:
+        node["digest"] = hashlib.new(algorithm,
+                                     target.encode("utf-8")).hexdigest()
+
+    def fill_dir_digests(node):
+        if "children" in node:
+            for child in node["children"].values():
+                fill_dir_digests(child)
+            node["digest"] = _dir_digest(node["children"], algorithm)
+
+    fill_dir_digests(root)
+    return {"version": MANIFEST_VERSION, "algorithm": algorithm, "root": root}
+
+
+def get_manifest(local_path,
+                 remote_path,
+                 algorithm=DEFAULT_HASH_ALGORITHM,
+                 rsync_exclude=None,
+                 rsync_filter=None):
+    """Returns the manifest of `local_path` and the local file it is stored
+    in for upload to `remote_path`.
+
+    A manifest built in the last MANIFEST_REUSE_S seconds is reused, so that
+    concurrent updaters share one build.
+    """
+    rsync_exclude = tuple(rsync_exclude or [])
+    rsync_filter = tuple(rsync_filter or [])
+    key = (os.path.expanduser(local_path), remote_path, algorithm,
+           rsync_exclude, rsync_filter)
+    with _manifests_lock:
+        cached = _manifests.get(key)
+        if cached is not None and time.time() - cached[0] < MANIFEST_REUSE_S:
+            return cached[1], cached[2]
+        manifest = build_manifest(local_path, algorithm, rsync_exclude,
+                                  rsync_filter)
+        manifest_file = _write_local_manifest(remote_path, manifest)
+        _manifests[key] = (time.time(), manifest, manifest_file)
+        return manifest, manifest_file
+
+
+def diff_manifests(old, new):
+    """Returns the relative paths of the topmost entries that differ.
+
+    Paths present in `new` but changed or missing in `old` are returned in
+    sorted order; "" means the whole mount. Entries only present in `old`
+    are ignored, as file mount syncs never delete files.
+    """
+    if (old is None or old.get("version") != MANIFEST_VERSION
+            or old.get("algorithm") != new["algorithm"]):
+        return [""]
+
+    changed = []
+
+    def walk(old_node, new_node, relpath):
+        if old_node.get("digest") == new_node["digest"]:
+            return
+        if "children" not in new_node or "children" not in old_node:
+            changed.append(relpath)
+            return
+        old_children = old_node["children"]
+        for name, child in sorted(new_node["children"].items()):
+            child_path = os.path.join(relpath, name)
+            if name not in old_children:
+                changed.append(child_path)
+            else:
+                walk(old_children[name], child, child_path)
+
+    walk(old["root"], new["root"], "")
+    return changed
+
+
+def manifest_name(remote_path):
+    """File name under which the manifest of `remote_path` is stored."""
+    return "{}.json".format(
+        hashlib.sha1(remote_path.rstrip("/").encode("utf-8")).hexdigest())
+
+
+def remote_manifest_path(remote_path):
+    """Where the manifest of `remote_path` is stored on the node."""
+    return "{}/{}".format(REMOTE_MANIFEST_DIR, manifest_name(remote_path))
+
+
+def read_manifest_command(remote_path):
+    """Returns the command printing the manifest of `remote_path` on the
+    node between MANIFEST_BEGIN and MANIFEST_END."""
+    return ("mkdir -p {dir} && echo {begin}; "
+            "cat {path} 2>/dev/null; echo; echo {end}").format(
+                dir=REMOTE_MANIFEST_DIR,
+                path=remote_manifest_path(remote_path),
+                begin=MANIFEST_BEGIN,
+                end=MANIFEST_END)
+
+
+def _write_local_manifest(remote_path, manifest):
+    # The file name includes the root digest, so a file being uploaded by
+    # one updater is never replaced by a newer manifest built for another.
+    os.makedirs(LOCAL_MANIFEST_DIR, exist_ok=True)
+    path = os.path.join(
+        LOCAL_MANIFEST_DIR, "{}-{}".format(manifest["root"]["digest"][:16],
+                                           manifest_name(remote_path)))
+    if not os.path.exists(path):
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    _prune_local_manifests()
+    return path
+
+
+def _prune_local_manifests():
+    cutoff = time.time() - LOCAL_MANIFEST_MAX_AGE_S
+    for entry in os.scandir(LOCAL_MANIFEST_DIR):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def parse_manifest(output):
+    """Parses the output of `read_manifest_command`, returning None if it
+    holds no valid manifest."""
+    begin = output.rfind(MANIFEST_BEGIN)
+    end = output.find(MANIFEST_END, begin)
+    if begin < 0 or end < 0:
+        return None
+    try:
+        manifest = json.loads(output[begin + len(MANIFEST_BEGIN):end])
+    except ValueError:
+        return None
+    if not isinstance(manifest, dict) or "root" not in manifest:
+        return None
+    return manifest
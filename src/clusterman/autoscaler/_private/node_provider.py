@@ -46,6 +46,23 @@ class NodeProvider:
         """
         raise NotImplementedError
 
+    def stopped_nodes(self, tag_filters: Dict[str, str]) -> List[str]:
+        """Return a list of stopped node ids filtered by the specified tags
+        dict.
+
+        These are nodes that `create_node` may restart instead of launching
+        new ones. Providers that never stop nodes return an empty list.
+        """
+        return []
+
+    def start_nodes(self, node_ids: List[str], tags: Dict[str, str]) -> None:
+        """Starts the given stopped nodes and sets `tags` on them."""
+        raise NotImplementedError
+
+    def stop_nodes(self, node_ids: List[str]) -> None:
+        """Stops the given nodes and waits until they are stopped."""
+        raise NotImplementedError
+
     def is_running(self, node_id: str) -> bool:
         """Return whether the specified node is running."""
         raise NotImplementedError
@@ -120,6 +137,13 @@ class NodeProvider:
         """Sets the tag values (string dict) for the specified node."""
         raise NotImplementedError
 
+    def flush_node_tags(self) -> None:
+        """Waits until tags set so far are visible to other processes.
+
+        Only needed by providers that write tags asynchronously.
+        """
+        pass
+
     def terminate_node(self, node_id: str) -> None:
         """Terminates the specified node."""
         raise NotImplementedError
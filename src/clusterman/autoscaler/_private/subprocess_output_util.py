@@ -273,8 +273,9 @@ def _run_and_process_output(cmd,
             # Wait for completion.
             executor.shutdown()
 
-            # Update `p.returncode`
-            p.poll()
+            # Update `p.returncode`. The streams may reach EOF slightly
+            # before the process exits, so wait instead of polling.
+            p.wait()
 
             detected_special_case = stdout_future.result()
             if stderr_future.result() is not None:
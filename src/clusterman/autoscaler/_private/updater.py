@@ -1,16 +1,30 @@
+import collections
+import functools
 import logging
 import os
 import subprocess
+import tempfile
+import threading
 import time
 from threading import Thread
 
 import click
 
 import clusterman.autoscaler._private.subprocess_output_util as cmd_output_util
+from clusterman.autoscaler._private import merkle
 from clusterman.autoscaler._private.cli_logger import cf, cli_logger
-from clusterman.autoscaler._private.command_runner import AUTOSCALER_NODE_START_WAIT_S, ProcessRunnerError
+from clusterman.autoscaler._private.command_runner import (
+    AUTOSCALER_NODE_START_WAIT_S,
+    ProcessRunnerError,
+    SSHCommandRunner
+)
+from clusterman.autoscaler._private.constants import (
+    AUTOSCALER_MAX_CONCURRENT_UPDATERS,
+    FILE_MOUNTS_MAX_INCREMENTAL_PATHS
+)
 from clusterman.autoscaler._private.event_system import CreateClusterEvent, global_event_system
 from clusterman.autoscaler._private.log_timer import LogTimer
+from clusterman.autoscaler._private.util import DEFAULT_HASH_ALGORITHM
 from clusterman.autoscaler.tags import (
     STATUS_SETTING_UP,
     STATUS_SYNCING_FILES,
@@ -21,6 +35,7 @@ from clusterman.autoscaler.tags import (
     TAG_NODE_STATUS,
     TAG_RUNTIME_CONFIG
 )
+from clusterman.util.debug import log_once
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +43,44 @@ NUM_SETUP_STEPS = 7
 READY_CHECK_INTERVAL = 5
 
 
+@functools.lru_cache(maxsize=None)
+def _tree_size(path):
+    # Computed once per path and process, not again for every node synced.
+    if not os.path.isdir(path):
+        return os.path.getsize(path) if os.path.exists(path) else 0
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def sync_throughput(local_path, sent_paths, elapsed):
+    """Describes how fast a file mount sync went.
+
+    Only incremental syncs know what they sent. For other syncs, rsync may
+    have sent much less than the mount, so only the mount's size is given.
+
+    Arguments:
+        local_path: The synced local file or directory.
+        sent_paths: Paths sent, relative to `local_path`, or None if all of
+            it was synced.
+        elapsed: Duration of the sync in seconds.
+    """
+    if sent_paths is None:
+        return "{:.1f} MiB mount synced in {:.1f}s".format(
+            _tree_size(local_path) / 2**20, elapsed)
+    size = sum(
+        _tree_size(os.path.join(local_path, path)) for path in sent_paths)
+    if not size:
+        return "nothing sent"
+    return "{:.1f} MiB sent in {:.1f}s, {:.1f} MiB/s".format(
+        size / 2**20, elapsed, size / 2**20 / max(elapsed, 1e-3))
+
+
 class NodeUpdater:
     """A process for syncing files and running init commands on a node.
 
@@ -43,13 +96,19 @@ class NodeUpdater:
         runtime_hash: Used to check for config changes
         file_mounts_contents_hash: Used to check for changes to file mounts
         is_head_node: Whether to use head start/setup commands
-        rsync_options: Extra options related to the rsync command.
+        rsync_options: Extra options related to the rsync command. If
+            `incremental_file_mounts` is set, only the subtrees of each mount
+            that changed since the last sync are sent, using manifests
+            hashed with `hash_algorithm`. `file_mounts_options` maps remote
+            paths to per-mount transfer options.
         process_runner: the module to use to run the commands
             in the CommandRunner. E.g., subprocess.
         use_internal_ip: Wwhether the node_id belongs to an internal ip
             or external ip.
         docker_config: Docker section of autoscaler yaml
         restart_only: Whether to skip setup commands & just restart ray
+        file_mount_broadcaster: If set, a FileMountBroadcaster shared by all
+            updaters that file mounts are synced through.
     """
 
     def __init__(self,
@@ -70,7 +129,8 @@ class NodeUpdater:
                  process_runner=subprocess,
                  use_internal_ip=False,
                  docker_config=None,
-                 restart_only=False):
+                 restart_only=False,
+                 file_mount_broadcaster=None):
 
         self.log_prefix = "NodeUpdater: {}: ".format(node_id)
         use_internal_ip = (use_internal_ip
@@ -108,8 +168,10 @@ class NodeUpdater:
         self.is_head_node = is_head_node
         self.docker_config = docker_config
         self.restart_only = restart_only
+        self.file_mount_broadcaster = file_mount_broadcaster
 
-    def run(self):
+    def check_output_settings(self):
+        """Abort if command output cannot be redirected as requested."""
         if cmd_output_util.does_allow_interactive(
         ) and cmd_output_util.is_output_redirected():
             # this is most probably a bug since the user has no control
@@ -120,6 +182,9 @@ class NodeUpdater:
             cli_logger.abort(msg)
             raise click.ClickException(msg)
 
+    def run(self):
+        self.check_output_settings()
+
         try:
             with LogTimer(self.log_prefix +
                           "Applied config {}".format(self.runtime_hash)):
@@ -160,6 +225,40 @@ class NodeUpdater:
 
         self.exitcode = 0
 
+    def plan_update(self, node_tags):
+        """Decide what updating the node with `node_tags` takes.
+
+        Returns whether file mounts need to be synced, and whether
+        initialization and setup commands need to run after that. May
+        initialize the command runner (e.g. start the docker container).
+        """
+        if node_tags.get(TAG_RUNTIME_CONFIG) == self.runtime_hash:
+            # When resuming from a stopped instance the runtime_hash may be the
+            # same, but the container will not be started.
+            init_required = self.cmd_runner.run_init(
+                as_head=self.is_head_node,
+                file_mounts=self.file_mounts,
+                sync_run_yet=False)
+            if init_required:
+                node_tags[TAG_RUNTIME_CONFIG] += "-invalidate"
+                # This ensures that `setup_commands` are not removed
+                self.restart_only = False
+
+        if self.restart_only:
+            self.setup_commands = []
+
+        # runtime_hash will only change whenever the user restarts
+        # or updates their cluster with `get_or_create_head_node`
+        up_to_date = node_tags.get(TAG_RUNTIME_CONFIG) == self.runtime_hash
+        needs_sync = not up_to_date or bool(
+            self.file_mounts_contents_hash
+            and node_tags.get(TAG_FILE_MOUNTS_CONTENTS) !=
+            self.file_mounts_contents_hash)
+        # Only run setup commands if runtime_hash has changed because
+        # we don't want to run setup_commands every time the head node
+        # file_mounts folders have changed.
+        return needs_sync, not up_to_date
+
     def sync_file_mounts(self, sync_cmd, step_numbers=(0, 2)):
         # step_numbers is (# of previous steps, total steps)
         previous_steps, total_steps = step_numbers
@@ -196,13 +295,17 @@ class NodeUpdater:
                     self.cmd_runner.run(
                         "mkdir -p {}".format(os.path.dirname(remote_path)),
                         run_env="host")
-                sync_cmd(
-                    local_path, remote_path, docker_mount_if_possible=True)
+                start = time.time()
+                sent = self.sync_file_mount(sync_cmd, local_path, remote_path)
+                throughput = sync_throughput(local_path, sent,
+                                             time.time() - start)
 
                 if remote_path not in nolog_paths:
-                    # todo: timed here?
-                    cli_logger.print("{} from {}", cf.bold(remote_path),
-                                     cf.bold(local_path))
+                    cli_logger.print(
+                        "{} from {}",
+                        cf.bold(remote_path),
+                        cf.bold(local_path),
+                        _tags=dict(throughput=throughput))
 
         # Rsync file mounts
         with cli_logger.group(
@@ -291,27 +394,8 @@ class NodeUpdater:
         node_tags = self.provider.node_tags(self.node_id)
         logger.debug("Node tags: {}".format(str(node_tags)))
 
-        if node_tags.get(TAG_RUNTIME_CONFIG) == self.runtime_hash:
-            # When resuming from a stopped instance the runtime_hash may be the
-            # same, but the container will not be started.
-            init_required = self.cmd_runner.run_init(
-                as_head=self.is_head_node,
-                file_mounts=self.file_mounts,
-                sync_run_yet=False)
-            if init_required:
-                node_tags[TAG_RUNTIME_CONFIG] += "-invalidate"
-                # This ensures that `setup_commands` are not removed
-                self.restart_only = False
-
-        if self.restart_only:
-            self.setup_commands = []
-
-        # runtime_hash will only change whenever the user restarts
-        # or updates their cluster with `get_or_create_head_node`
-        if node_tags.get(TAG_RUNTIME_CONFIG) == self.runtime_hash and (
-                not self.file_mounts_contents_hash
-                or node_tags.get(TAG_FILE_MOUNTS_CONTENTS) ==
-                self.file_mounts_contents_hash):
+        needs_sync, needs_setup = self.plan_update(node_tags)
+        if not needs_sync:
             # todo: we lie in the confirmation message since
             # full setup might be cancelled here
             cli_logger.print(
@@ -328,12 +412,9 @@ class NodeUpdater:
                 self.node_id, {TAG_NODE_STATUS: STATUS_SYNCING_FILES})
             cli_logger.labeled_value("New status", STATUS_SYNCING_FILES)
             self.sync_file_mounts(
-                self.rsync_up, step_numbers=(1, NUM_SETUP_STEPS))
+                self.file_mount_sync_cmd(), step_numbers=(1, NUM_SETUP_STEPS))
 
-            # Only run setup commands if runtime_hash has changed because
-            # we don't want to run setup_commands every time the head node
-            # file_mounts folders have changed.
-            if node_tags.get(TAG_RUNTIME_CONFIG) != self.runtime_hash:
+            if needs_setup:
                 # Run init commands
                 self.provider.set_node_tags(
                     self.node_id, {TAG_NODE_STATUS: STATUS_SETTING_UP})
@@ -425,6 +506,111 @@ class NodeUpdater:
                         "No setup commands to run.",
                         _numbered=("[]", 6, NUM_SETUP_STEPS))
 
+    def sync_file_mount(self, sync_cmd, local_path, remote_path):
+        """Sync one file mount to the node with `sync_cmd`.
+
+        With incremental file mounts, the mount's manifest is compared to the
+        one left on the node by the previous sync, and only the changed
+        subtrees are sent.
+
+        Returns the paths sent, relative to `local_path`, or None if the
+        whole mount was sent.
+        """
+        if not (self.rsync_options.get("incremental_file_mounts")
+                and type(self.cmd_runner) is SSHCommandRunner):
+            sync_cmd(local_path, remote_path, docker_mount_if_possible=True)
+            return None
+
+        manifest, manifest_file = merkle.get_manifest(
+            local_path, remote_path,
+            self.rsync_options.get("hash_algorithm", DEFAULT_HASH_ALGORITHM),
+            self.rsync_options.get("rsync_exclude"),
+            self.rsync_options.get("rsync_filter"))
+        remote_manifest = merkle.remote_manifest_path(remote_path)
+        output = self.cmd_runner.run(
+            merkle.read_manifest_command(remote_path),
+            with_output=True,
+            run_env="host")
+        changed = merkle.diff_manifests(
+            merkle.parse_manifest(output.decode("utf-8")), manifest)
+
+        if not changed:
+            cli_logger.verbose("{}{} is unchanged, skipping.",
+                               self.log_prefix, cf.bold(remote_path))
+            return []
+        if changed == [""] or len(changed) > FILE_MOUNTS_MAX_INCREMENTAL_PATHS:
+            sync_cmd(local_path, remote_path, docker_mount_if_possible=True)
+            changed = None
+        else:
+            cli_logger.verbose("{}Sending {} changed paths of {}",
+                               self.log_prefix, str(len(changed)),
+                               cf.bold(remote_path))
+            self.rsync_up_paths(local_path, remote_path, changed)
+        self.cmd_runner.run_rsync_up(manifest_file, remote_manifest)
+        return changed
+
+    def rsync_up_paths(self, source, target, paths):
+        """Sync only `paths`, relative to the directory `source`."""
+        with tempfile.NamedTemporaryFile(
+                "w", prefix="cls-files-from-", suffix=".txt") as files_from:
+            files_from.write("".join(path + "\n" for path in paths))
+            files_from.flush()
+            self._upload(source, target, {"files_from": files_from.name})
+
+    def file_mount_options(self, remote_path):
+        """Returns the `file_mounts_options` entry of a file mount."""
+        options = self.rsync_options.get("file_mounts_options") or {}
+        return options.get(remote_path.rstrip("/")) or {}
+
+    def upload_file_mount(self, source, target,
+                          docker_mount_if_possible=False):
+        """Upload a file mount with the transfer configured for `target`."""
+        self._upload(source, target,
+                     {"docker_mount_if_possible": docker_mount_if_possible})
+
+    def transfer_options(self, target, options=None):
+        """Returns the command runner options for uploading to `target`."""
+        mount_options = self.file_mount_options(target)
+        options = dict(
+            options or {},
+            rsync_exclude=self.rsync_options.get("rsync_exclude"),
+            rsync_filter=self.rsync_options.get("rsync_filter"))
+        for key in ["compression", "compression_level"]:
+            if key in mount_options:
+                options[key] = mount_options[key]
+        return options
+
+    def _upload(self, source, target, options):
+        mount_options = self.file_mount_options(target)
+        options = self.transfer_options(target, options)
+        if self._use_tar(source, mount_options):
+            self.cmd_runner.run_tar_up(source, target, options=options)
+            cli_logger.verbose("Streamed {} (local) to {} (remote) with tar",
+                               cf.bold(source), cf.bold(target))
+        else:
+            self.cmd_runner.run_rsync_up(source, target, options=options)
+            cli_logger.verbose("`rsync`ed {} (local) to {} (remote)",
+                               cf.bold(source), cf.bold(target))
+
+    def _use_tar(self, source, mount_options):
+        if mount_options.get("transfer", "rsync") != "tar":
+            return False
+        if type(self.cmd_runner) is not SSHCommandRunner:
+            return False
+        if self.rsync_options.get("rsync_filter"):
+            if log_once("file_mounts_tar_rsync_filter"):
+                cli_logger.warning(
+                    "`rsync_filter` is not supported by the tar transfer, "
+                    "using rsync instead.")
+            return False
+        return os.path.isdir(source)
+
+    def file_mount_sync_cmd(self):
+        """Returns the function used to upload file mounts to the node."""
+        if self.file_mount_broadcaster is not None:
+            return self.file_mount_broadcaster.sync_cmd(self)
+        return self.upload_file_mount
+
     def rsync_up(self, source, target, docker_mount_if_possible=False):
         options = {}
         options["docker_mount_if_possible"] = docker_mount_if_possible
@@ -449,3 +635,90 @@ class NodeUpdaterThread(NodeUpdater, Thread):
         Thread.__init__(self)
         NodeUpdater.__init__(self, *args, **kwargs)
         self.exitcode = -1
+
+
+class NodeUpdaterScheduler:
+    """Runs NodeUpdaters from a FIFO work queue on a bounded pool of threads.
+
+    Every updater spawns ssh/rsync subprocesses (plus reader threads for
+    their output), so running one thread per node does not scale to large
+    clusters. Updaters are started in submission order and at most
+    `max_concurrency` of them run at the same time.
+
+    Arguments:
+        max_concurrency: Maximum number of updaters running at once.
+    """
+
+    def __init__(self, max_concurrency=AUTOSCALER_MAX_CONCURRENT_UPDATERS):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._workers = []
+        self._in_flight = 0
+        self._completed = 0
+        self._closed = False
+
+    @property
+    def queue_depth(self):
+        """Number of updaters waiting for a free slot."""
+        with self._cond:
+            return len(self._queue)
+
+    @property
+    def in_flight(self):
+        """Number of updaters currently running."""
+        with self._cond:
+            return self._in_flight
+
+    @property
+    def completed(self):
+        """Number of updaters that finished, successfully or not."""
+        with self._cond:
+            return self._completed
+
+    def submit(self, updater):
+        with self._cond:
+            assert not self._closed, "Scheduler is already closed."
+            self._queue.append(updater)
+            busy = self._in_flight + len(self._queue)
+            if len(self._workers) < min(busy, self.max_concurrency):
+                worker = Thread(target=self._work, daemon=True)
+                worker.start()
+                self._workers.append(worker)
+            self._cond.notify()
+
+    def wait(self, timeout=None):
+        """Wait until all submitted updaters have finished.
+
+        Returns whether the scheduler is idle once `timeout` has elapsed.
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._queue and self._in_flight == 0, timeout)
+
+    def close(self):
+        """Wait for all updaters to finish and stop the worker threads."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                updater = self._queue.popleft()
+                self._in_flight += 1
+            try:
+                updater.run()
+            except Exception:
+                logger.exception("{}Updater failed.".format(
+                    updater.log_prefix))
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._completed += 1
+                    self._cond.notify_all()
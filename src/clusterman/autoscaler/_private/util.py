@@ -5,6 +5,7 @@ import json
 import logging
 import os
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Any, Dict, List
 
@@ -13,6 +14,7 @@ import jsonschema
 import clusterman
 from clusterman.autoscaler._private import constants
 from clusterman.autoscaler._private.docker import validate_docker_config
+from clusterman.autoscaler._private.file_hash_cache import FileHashCache
 from clusterman.autoscaler._private.providers import _get_default_config
 from clusterman.autoscaler.tags import NODE_TYPE_LEGACY_WORKER
 
@@ -190,14 +192,50 @@ def hash_launch_conf(node_conf, auth):
     return hasher.hexdigest()
 
 
+DEFAULT_HASH_ALGORITHM = "sha1"
+
 # Cache the file hashes to avoid rescanning it each time.
 _hash_cache = {}
+# Per-file digests, persisted so that unchanged files are not read again by
+# later invocations.
+_file_hash_cache = (FileHashCache()
+                    if constants.FILE_HASH_CACHE else FileHashCache(path=None))
+
+
+def hash_files(paths, algorithm):
+    """Returns the digests of `paths`, in order.
+
+    Cached digests are looked up inline, the remaining files are read and
+    hashed concurrently (hashlib releases the GIL while hashing).
+    """
+    digests = [_file_hash_cache.lookup(path, algorithm) for path in paths]
+    missing = [i for i, digest in enumerate(digests) if digest is None]
+    if len(missing) <= 1 or constants.FILE_HASH_THREADS <= 1:
+        for i in missing:
+            digests[i] = _file_hash_cache.digest(paths[i], algorithm)
+    else:
+        with ThreadPoolExecutor(constants.FILE_HASH_THREADS) as executor:
+            hashed = executor.map(
+                lambda i: _file_hash_cache.digest(paths[i], algorithm),
+                missing)
+            for i, digest in zip(missing, hashed):
+                digests[i] = digest
+    return digests
+
+
+def _tag_hash(hasher, algorithm):
+    """Hex digest of `hasher`, prefixed with the algorithm unless it is sha1
+    so that hashes computed with different algorithms never compare equal."""
+    if algorithm == DEFAULT_HASH_ALGORITHM:
+        return hasher.hexdigest()
+    return "{}:{}".format(algorithm, hasher.hexdigest())
 
 
 def hash_runtime_conf(file_mounts,
                       cluster_synced_files,
                       extra_objs,
-                      generate_file_mounts_contents_hash=False):
+                      generate_file_mounts_contents_hash=False,
+                      hash_algorithm=DEFAULT_HASH_ALGORITHM):
     """Returns two hashes, a runtime hash and file_mounts_content hash.
 
     The runtime hash is used to determine if the configuration or file_mounts
@@ -207,65 +245,89 @@ def hash_runtime_conf(file_mounts,
     The file_mounts_content hash is used to determine if the file_mounts or
     cluster_synced_files contents have changed. It is used at monitor time to
     determine if additional file syncing is needed.
-    """
-    runtime_hasher = hashlib.sha1()
-    contents_hasher = hashlib.sha1()
 
-    def add_content_hashes(path, allow_non_existing_paths: bool = False):
-        def add_hash_of_file(fpath):
-            with open(fpath, "rb") as f:
-                for chunk in iter(lambda: f.read(2**20), b""):
-                    contents_hasher.update(chunk)
+    With the default sha1, the contents of all files are hashed as one
+    stream, so that hashes match those of nodes set up by earlier versions.
+    With other algorithms, files are hashed in parallel and their digests
+    cached across invocations, and the hashes are prefixed with the
+    algorithm name.
+    """
+    runtime_hasher = hashlib.new(hash_algorithm)
+    contents_hasher = hashlib.new(hash_algorithm)
 
+    def content_parts(path, allow_non_existing_paths: bool = False):
+        """Returns the names (as bytes) and file paths (as str) that make up
+        the contents hash of `path`, in hashing order."""
         path = os.path.expanduser(path)
         if allow_non_existing_paths and not os.path.exists(path):
+            return []
+        if not os.path.isdir(path):
+            return [path]
+        parts = []
+        dirs = []
+        for dirpath, _, filenames in os.walk(path):
+            dirs.append((dirpath, sorted(filenames)))
+        for dirpath, filenames in sorted(dirs):
+            parts.append(dirpath.encode("utf-8"))
+            for name in filenames:
+                parts.append(name.encode("utf-8"))
+                parts.append(os.path.join(dirpath, name))
+        return parts
+
+    def add_content_hashes(paths, allow_non_existing_paths: bool = False):
+        parts = []
+        for path in paths:
+            parts.extend(content_parts(path, allow_non_existing_paths))
+        if hash_algorithm == DEFAULT_HASH_ALGORITHM:
+            for part in parts:
+                if isinstance(part, str):
+                    with open(part, "rb") as f:
+                        for chunk in iter(lambda: f.read(2**20), b""):
+                            contents_hasher.update(chunk)
+                else:
+                    contents_hasher.update(part)
             return
-        if os.path.isdir(path):
-            dirs = []
-            for dirpath, _, filenames in os.walk(path):
-                dirs.append((dirpath, sorted(filenames)))
-            for dirpath, filenames in sorted(dirs):
-                contents_hasher.update(dirpath.encode("utf-8"))
-                for name in filenames:
-                    contents_hasher.update(name.encode("utf-8"))
-                    fpath = os.path.join(dirpath, name)
-                    add_hash_of_file(fpath)
-        else:
-            add_hash_of_file(path)
+        file_paths = [part for part in parts if isinstance(part, str)]
+        digests = iter(hash_files(file_paths, hash_algorithm))
+        for part in parts:
+            if isinstance(part, str):
+                part = next(digests).encode("utf-8")
+            contents_hasher.update(part)
 
     conf_str = (json.dumps(file_mounts, sort_keys=True).encode("utf-8") +
                 json.dumps(extra_objs, sort_keys=True).encode("utf-8"))
+    cache_key = (conf_str, hash_algorithm)
 
     # Only generate a contents hash if generate_contents_hash is true or
     # if we need to generate the runtime_hash
-    if conf_str not in _hash_cache or generate_file_mounts_contents_hash:
-        for local_path in sorted(file_mounts.values()):
-            add_content_hashes(local_path)
+    if cache_key not in _hash_cache or generate_file_mounts_contents_hash:
+        add_content_hashes(sorted(file_mounts.values()))
         head_node_contents_hash = contents_hasher.hexdigest()
 
         # Generate a new runtime_hash if its not cached
         # The runtime hash does not depend on the cluster_synced_files hash
         # because we do not want to restart nodes only if cluster_synced_files
         # contents have changed.
-        if conf_str not in _hash_cache:
+        if cache_key not in _hash_cache:
             runtime_hasher.update(conf_str)
             runtime_hasher.update(head_node_contents_hash.encode("utf-8"))
-            _hash_cache[conf_str] = runtime_hasher.hexdigest()
+            _hash_cache[cache_key] = _tag_hash(runtime_hasher, hash_algorithm)
 
         # Add cluster_synced_files to the file_mounts_content hash
         if cluster_synced_files is not None:
-            for local_path in sorted(cluster_synced_files):
-                # For cluster_synced_files, we let the path be non-existant
-                # because its possible that the source directory gets set up
-                # anytime over the life of the head node.
-                add_content_hashes(local_path, allow_non_existing_paths=True)
+            # For cluster_synced_files, we let the path be non-existant
+            # because its possible that the source directory gets set up
+            # anytime over the life of the head node.
+            add_content_hashes(
+                sorted(cluster_synced_files), allow_non_existing_paths=True)
 
-        file_mounts_contents_hash = contents_hasher.hexdigest()
+        file_mounts_contents_hash = _tag_hash(contents_hasher, hash_algorithm)
+        _file_hash_cache.save()
 
     else:
         file_mounts_contents_hash = None
 
-    return (_hash_cache[conf_str], file_mounts_contents_hash)
+    return (_hash_cache[cache_key], file_mounts_contents_hash)
 
 
 def add_resources(dict1: Dict[str, float],
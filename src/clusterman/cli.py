@@ -20,18 +20,30 @@ import urllib
 
 import click
 
+from clusterman.autoscaler._private.async_updater import ASYNC_ENGINE_SUPPORTED
 from clusterman.autoscaler._private.cli_logger import cli_logger
 from clusterman.autoscaler._private.commands import (
     create_or_update_cluster,
+    fill_cluster_warm_pool,
     get_worker_node_ips,
     rsync,
     teardown_cluster
 )
-from clusterman.autoscaler._private.constants import LOGGER_FORMAT, LOGGER_FORMAT_HELP, LOGGER_LEVEL, LOGGER_LEVEL_HELP
+from clusterman.autoscaler._private.constants import (
+    AUTOSCALER_MAX_CONCURRENT_UPDATERS,
+    LOGGER_FORMAT,
+    LOGGER_FORMAT_HELP,
+    LOGGER_LEVEL,
+    LOGGER_LEVEL_HELP
+)
 from clusterman.cluster_logging import setup_logger
 
 logger = logging.getLogger(__name__)
 
+# The asyncio engine needs Python 3.8, it is not offered on older versions.
+UPDATER_ENGINE_CHOICES = ["thread"] + (["asyncio"]
+                                       if ASYNC_ENGINE_SUPPORTED else [])
+
 logging_options = [
     click.option(
         "--log-style",
@@ -124,10 +136,34 @@ def add_command_alias(command, name, hidden):
     help=("Clusterman uses login shells (bash --login -i) to run cluster commands "
           "by default. If your workflow is compatible with normal shells, "
           "this can be disabled for a better user experience."))
+@click.option(
+    "--pipelined-setup/--wait-for-all-workers",
+    is_flag=True,
+    default=True,
+    help=("Start setting up each worker as soon as it is launched instead of "
+          "waiting for all workers to be launched first."))
+@click.option(
+    "--max-concurrent-updaters",
+    required=False,
+    type=int,
+    default=AUTOSCALER_MAX_CONCURRENT_UPDATERS,
+    show_default=True,
+    help="Maximum number of workers that are set up at the same time.")
+@click.option(
+    "--updater-engine",
+    required=False,
+    type=click.Choice(UPDATER_ENGINE_CHOICES, case_sensitive=False),
+    default="thread",
+    help=("How workers are set up. 'thread' uses one thread per worker being "
+          "set up. 'asyncio' drives all workers from a single event loop, "
+          "which allows a much higher --max-concurrent-updaters "
+          "(Python 3.8+ only).")
+)
 @add_click_options(logging_options)
 def up(cluster_config_file, num_workers,
        yes, cluster_name, no_config_cache, redirect_command_output,
-       use_login_shells, log_style, log_color, verbose):
+       use_login_shells, pipelined_setup, max_concurrent_updaters,
+       updater_engine, log_style, log_color, verbose):
     """Create or update a cluster."""
     cli_logger.configure(log_style, log_color, verbose)
 
@@ -150,7 +186,10 @@ def up(cluster_config_file, num_workers,
         override_cluster_name=cluster_name,
         no_config_cache=no_config_cache,
         redirect_command_output=redirect_command_output,
-        use_login_shells=use_login_shells)
+        use_login_shells=use_login_shells,
+        pipelined=pipelined_setup,
+        max_concurrent_updaters=max_concurrent_updaters,
+        updater_engine=updater_engine.lower())
 
 
 @cli.command()
@@ -176,6 +215,65 @@ def down(cluster_config_file, yes, cluster_name,
     teardown_cluster(cluster_config_file, yes, cluster_name)
 
 
+@cli.command()
+@click.argument("cluster_config_file", required=True, type=str)
+@click.option(
+    "--size",
+    required=False,
+    type=int,
+    help="Number of workers to keep in the pool. Defaults to the configured "
+    "warm_pool_size.")
+@click.option(
+    "--yes",
+    "-y",
+    is_flag=True,
+    default=False,
+    help="Don't ask for confirmation.")
+@click.option(
+    "--cluster-name",
+    "-n",
+    required=False,
+    type=str,
+    help="Override the configured cluster name.")
+@click.option(
+    "--no-config-cache",
+    is_flag=True,
+    default=False,
+    help="Disable the local cluster config cache.")
+@click.option(
+    "--max-concurrent-updaters",
+    required=False,
+    type=int,
+    default=AUTOSCALER_MAX_CONCURRENT_UPDATERS,
+    show_default=True,
+    help="Maximum number of workers that are set up at the same time.")
+@click.option(
+    "--updater-engine",
+    required=False,
+    type=click.Choice(UPDATER_ENGINE_CHOICES, case_sensitive=False),
+    default="thread",
+    help="How workers are set up, see `up --help`.")
+@add_click_options(logging_options)
+def warm_pool(cluster_config_file, size, yes, cluster_name, no_config_cache,
+              max_concurrent_updaters, updater_engine, log_style, log_color,
+              verbose):
+    """Keep set up, stopped workers ready for `up`.
+
+    Stopped workers with the current worker config are restarted by `up`
+    instead of launching and setting up new ones.
+    """
+    cli_logger.configure(log_style, log_color, verbose)
+
+    fill_cluster_warm_pool(
+        cluster_config_file,
+        yes,
+        size,
+        override_cluster_name=cluster_name,
+        no_config_cache=no_config_cache,
+        max_concurrent_updaters=max_concurrent_updaters,
+        updater_engine=updater_engine.lower())
+
+
 @cli.command()
 @click.argument("cluster_config_file", required=True, type=str)
 @click.argument("source", required=False, type=str)
@@ -219,9 +317,17 @@ def rsync_down(cluster_config_file, source, target, cluster_name, ip_address,
     is_flag=True,
     required=False,
     help="Upload to all nodes (workers and head).")
+@click.option(
+    "--parallelism",
+    "-p",
+    required=False,
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of nodes to upload to at the same time.")
 @add_click_options(logging_options)
 def rsync_up(cluster_config_file, source, target, cluster_name, all_nodes,
-             log_style, log_color, verbose):
+             parallelism, log_style, log_color, verbose):
     """Upload specific files to a cluster."""
     cli_logger.configure(log_style, log_color, verbose)
 
@@ -231,7 +337,8 @@ def rsync_up(cluster_config_file, source, target, cluster_name, all_nodes,
         target,
         cluster_name,
         down=False,
-        all_nodes=all_nodes)
+        all_nodes=all_nodes,
+        parallelism=parallelism)
 
 
 @cli.command()
@@ -254,6 +361,7 @@ add_command_alias(down, name="teardown", hidden=True)
 add_command_alias(rsync_down, name="rsync_down", hidden=True)
 add_command_alias(rsync_up, name="rsync_up", hidden=True)
 cli.add_command(get_worker_ips)
+cli.add_command(warm_pool)
 
 
 def main():
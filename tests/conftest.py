@@ -0,0 +1,19 @@
+import pytest
+
+from clusterman.autoscaler._private.aws import node_provider
+from clusterman.autoscaler._private.aws.node_provider import AWSNodeProvider
+from clusterman.autoscaler._private.aws.subnet_health import SubnetHealth
+
+
+@pytest.fixture
+def make_aws_provider(monkeypatch):
+    """Returns a function making AWS node providers whose subnet health is
+    kept in memory instead of written to disk."""
+    monkeypatch.setattr(node_provider, "SubnetHealth",
+                        lambda path=None: SubnetHealth(path=None))
+
+    def make(**provider_config):
+        return AWSNodeProvider(dict({"region": "us-west-2"}, **provider_config),
+                               "test")
+
+    return make
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import pytest
+
+from clusterman.autoscaler._private.async_updater import AsyncNodeUpdater
+from clusterman.autoscaler._private.command_runner import ProcessRunnerError
+from clusterman.autoscaler._private.updater import NodeUpdater
+from clusterman.autoscaler.tags import TAG_FILE_MOUNTS_CONTENTS, TAG_RUNTIME_CONFIG
+
+
+class FakeCommandRunner:
+    def __init__(self, init_required):
+        self.init_required = init_required
+        self.init_calls = 0
+
+    def run_init(self, *, as_head, file_mounts, sync_run_yet):
+        self.init_calls += 1
+        return self.init_required
+
+
+def make_updater(cls=NodeUpdater, init_required=False):
+    updater = cls.__new__(cls)
+    updater.runtime_hash = "runtime"
+    updater.file_mounts_contents_hash = "contents"
+    updater.restart_only = False
+    updater.setup_commands = ["echo setup"]
+    updater.is_head_node = False
+    updater.file_mounts = {}
+    updater.cmd_runner = FakeCommandRunner(init_required)
+    return updater
+
+
+@pytest.mark.parametrize("node_tags,plan", [
+    ({}, (True, True)),
+    ({
+        TAG_RUNTIME_CONFIG: "runtime",
+        TAG_FILE_MOUNTS_CONTENTS: "contents"
+    }, (False, False)),
+    ({
+        TAG_RUNTIME_CONFIG: "runtime",
+        TAG_FILE_MOUNTS_CONTENTS: "old"
+    }, (True, False)),
+])
+def test_plan_update(node_tags, plan):
+    assert make_updater().plan_update(dict(node_tags)) == plan
+
+
+def test_plan_update_reinitializes_resumed_nodes():
+    updater = make_updater(init_required=True)
+    node_tags = {
+        TAG_RUNTIME_CONFIG: "runtime",
+        TAG_FILE_MOUNTS_CONTENTS: "contents"
+    }
+
+    # A resumed node whose container had to be started again is set up
+    # again, by either engine.
+    assert updater.plan_update(node_tags) == (True, True)
+    assert updater.cmd_runner.init_calls == 1
+
+
+def test_exec_kills_hung_commands():
+    updater = make_updater(AsyncNodeUpdater)
+    loop = asyncio.new_event_loop()
+    try:
+        start = time.monotonic()
+        with pytest.raises(ProcessRunnerError) as exc_info:
+            loop.run_until_complete(
+                updater._exec(["sleep", "10"], timeout=0.2, silent=True))
+    finally:
+        loop.close()
+    assert exc_info.value.special_case == "ssh_timeout"
+    assert time.monotonic() - start < 5
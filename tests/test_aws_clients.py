@@ -0,0 +1,34 @@
+import pytest
+
+from clusterman.autoscaler._private.aws import clients
+from clusterman.autoscaler._private.constants import AUTOSCALER_MAX_CONCURRENT_LAUNCHES
+
+
+@pytest.fixture(autouse=True)
+def reset_concurrency():
+    yield
+    clients.set_max_concurrency(AUTOSCALER_MAX_CONCURRENT_LAUNCHES)
+
+
+def pool_size(manager):
+    return manager.client.meta.config.max_pool_connections
+
+
+def test_pool_sized_for_concurrency(monkeypatch):
+    monkeypatch.setattr(clients, "AWS_RATE_LIMIT", 0)
+    clients.set_max_concurrency(100)
+    manager = clients.get_client_manager("ec2", "us-west-2")
+    assert pool_size(manager) == (100 +
+                                  clients.AWS_POOL_CONNECTIONS_HEADROOM)
+    # The same client is shared until the concurrency changes.
+    assert clients.get_client_manager("ec2", "us-west-2") is manager
+
+    clients.set_max_concurrency(4)
+    assert pool_size(clients.get_client_manager(
+        "ec2", "us-west-2")) == 4 + clients.AWS_POOL_CONNECTIONS_HEADROOM
+
+
+def test_pool_size_override(monkeypatch):
+    monkeypatch.setattr(clients, "AWS_MAX_POOL_CONNECTIONS", 7)
+    clients.set_max_concurrency(100)
+    assert clients.get_max_pool_connections() == 7
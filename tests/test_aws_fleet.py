@@ -0,0 +1,242 @@
+import base64
+
+import pytest
+
+from clusterman.autoscaler._private.aws.fleet import create_fleet, launch_template_data
+
+
+class FakeEC2Client:
+    """Stands in for the EC2 API calls of instant fleets.
+
+    Every subnet has capacity for a number of instances, and a fleet fills
+    its target capacity from the subnets in order.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = dict(capacity)
+        self.templates = {}
+        self.fleets = []
+
+    def create_launch_template(self, LaunchTemplateName, LaunchTemplateData):
+        template_id = "lt-{}".format(len(self.templates))
+        self.templates[template_id] = LaunchTemplateData
+        return {"LaunchTemplate": {"LaunchTemplateId": template_id}}
+
+    def delete_launch_template(self, LaunchTemplateId):
+        del self.templates[LaunchTemplateId]
+
+    def create_fleet(self, **kwargs):
+        assert kwargs["Type"] == "instant"
+        config, = kwargs["LaunchTemplateConfigs"]
+        template_id = config["LaunchTemplateSpecification"]["LaunchTemplateId"]
+        assert template_id in self.templates
+        self.fleets.append(kwargs)
+        remaining = kwargs["TargetCapacitySpecification"]["TotalTargetCapacity"]
+        instances = []
+        errors = []
+        for overrides in config["Overrides"]:
+            subnet_id = overrides["SubnetId"]
+            count = min(remaining, self.capacity.get(subnet_id, 0))
+            if count:
+                start = sum(len(g["InstanceIds"]) for g in instances)
+                instances.append({
+                    "InstanceIds": [
+                        "i-{}".format(start + i) for i in range(count)
+                    ],
+                    "InstanceType": overrides["InstanceType"],
+                    "LaunchTemplateAndOverrides": {
+                        "Overrides": overrides
+                    },
+                })
+                self.capacity[subnet_id] -= count
+                remaining -= count
+            elif remaining:
+                errors.append({
+                    "LaunchTemplateAndOverrides": {
+                        "Overrides": overrides
+                    },
+                    "ErrorCode": "InsufficientInstanceCapacity",
+                    "ErrorMessage": "No capacity in {}".format(subnet_id),
+                })
+        return {"FleetId": "fleet-0", "Instances": instances, "Errors": errors}
+
+
+class FakeEC2:
+    def __init__(self, client):
+        self.meta = type("Meta", (), {"client": client})
+
+    def Instance(self, instance_id):
+        return ("Instance", instance_id)
+
+
+CONF = {
+    "ImageId": "ami-0",
+    "InstanceType": "m5.large",
+    "KeyName": "key",
+    "MinCount": 1,
+    "MaxCount": 3,
+    "SubnetId": "subnet-a",
+    "TagSpecifications": [{
+        "ResourceType": "instance",
+        "Tags": [{
+            "Key": "cls-cluster-name",
+            "Value": "test"
+        }]
+    }],
+}
+
+
+def test_create_fleet_spreads_over_subnets():
+    client = FakeEC2Client({"subnet-a": 2, "subnet-b": 5})
+    launched, errors = create_fleet(client, CONF, ["subnet-a", "subnet-b"],
+                                    ["m5.large"], 4, "cls-test")
+
+    assert [subnet for _, subnet, _ in launched] == [
+        "subnet-a", "subnet-a", "subnet-b", "subnet-b"
+    ]
+    assert errors == []
+    # The template is deleted once the fleet returns.
+    assert client.templates == {}
+    fleet, = client.fleets
+    assert fleet["TargetCapacitySpecification"] == {
+        "TotalTargetCapacity": 4,
+        "DefaultTargetCapacityType": "on-demand"
+    }
+
+
+def test_create_fleet_template_matches_run_instances_conf():
+    client = FakeEC2Client({"subnet-a": 1})
+    templates = []
+    create_template = client.create_launch_template
+
+    def record_template(**kwargs):
+        templates.append(kwargs["LaunchTemplateData"])
+        return create_template(**kwargs)
+
+    client.create_launch_template = record_template
+    spot_conf = dict(CONF, InstanceMarketOptions={"MarketType": "spot"})
+    create_fleet(client, spot_conf, ["subnet-a"], ["m5.large"], 1, "cls-test")
+
+    template, = templates
+    assert template == {
+        "ImageId": "ami-0",
+        "InstanceType": "m5.large",
+        "KeyName": "key",
+        "TagSpecifications": CONF["TagSpecifications"],
+    }
+    spec = client.fleets[0]["TargetCapacitySpecification"]
+    assert spec["DefaultTargetCapacityType"] == "spot"
+
+
+def test_create_fleet_deletes_template_on_error():
+    client = FakeEC2Client({})
+
+    def fail(**kwargs):
+        raise RuntimeError("CreateFleet failed")
+
+    client.create_fleet = fail
+    with pytest.raises(RuntimeError):
+        create_fleet(client, CONF, ["subnet-a"], ["m5.large"], 1, "cls-test")
+    assert client.templates == {}
+
+
+@pytest.fixture
+def make_fleet_provider(make_aws_provider):
+    def make(client):
+        provider = make_aws_provider(launch_backend="fleet")
+        provider.ec2_fail_fast = FakeEC2(client)
+        return provider
+
+    return make
+
+
+def test_launch_template_data_encodes_user_data():
+    data = launch_template_data(dict(CONF, UserData="#!/bin/sh\necho hi\n"))
+
+    assert base64.b64decode(data["UserData"]) == b"#!/bin/sh\necho hi\n"
+    assert "MinCount" not in data and "SubnetId" not in data
+
+
+def test_create_fleet_maps_spot_options():
+    client = FakeEC2Client({"subnet-a": 1})
+    spot_conf = dict(
+        CONF,
+        InstanceMarketOptions={
+            "MarketType": "spot",
+            "SpotOptions": {
+                "MaxPrice": "0.05",
+                "SpotInstanceType": "one-time",
+                "InstanceInterruptionBehavior": "terminate",
+            }
+        })
+    create_fleet(client, spot_conf, ["subnet-a"], ["m5.large"], 1, "cls-test")
+
+    fleet, = client.fleets
+    assert fleet["SpotOptions"] == {
+        "AllocationStrategy": "capacity-optimized-prioritized",
+        "InstanceInterruptionBehavior": "terminate",
+    }
+    override, = fleet["LaunchTemplateConfigs"][0]["Overrides"]
+    assert override["MaxPrice"] == "0.05"
+
+
+@pytest.mark.parametrize("spot_options", [
+    {"SpotInstanceType": "persistent"},
+    {"BlockDurationMinutes": 60},
+])
+def test_create_fleet_refuses_unsupported_spot_options(spot_options):
+    client = FakeEC2Client({"subnet-a": 1})
+    spot_conf = dict(
+        CONF,
+        InstanceMarketOptions={
+            "MarketType": "spot",
+            "SpotOptions": spot_options
+        })
+    with pytest.raises(ValueError):
+        create_fleet(client, spot_conf, ["subnet-a"], ["m5.large"], 1,
+                     "cls-test")
+    assert client.fleets == [] and client.templates == {}
+
+
+def test_provider_fleet_backend(make_fleet_provider):
+    client = FakeEC2Client({"subnet-a": 0, "subnet-b": 10})
+    provider = make_fleet_provider(client)
+
+    node_config = {
+        "ImageId": "ami-0",
+        "InstanceType": "m5.large",
+        "SubnetIds": ["subnet-a", "subnet-b"],
+    }
+    created = provider._create_node(node_config, {"cls-node-type": "worker"},
+                                    3)
+
+    assert created == {
+        "i-{}".format(i): ("Instance", "i-{}".format(i))
+        for i in range(3)
+    }
+    fleet, = client.fleets
+    overrides = fleet["LaunchTemplateConfigs"][0]["Overrides"]
+    assert [o["SubnetId"] for o in overrides] == ["subnet-a", "subnet-b"]
+    assert provider.subnet_health.score("subnet-a") < \
+        provider.subnet_health.score("subnet-b")
+
+
+def test_provider_fleet_backend_prefers_earlier_instance_types(
+        make_fleet_provider):
+    client = FakeEC2Client({"subnet-a": 10})
+    provider = make_fleet_provider(client)
+
+    node_config = {
+        "ImageId": "ami-0",
+        "InstanceType": "m5.large",
+        "InstanceTypes": ["m5a.large", "m5.large", "m4.large"],
+        "SubnetIds": ["subnet-a"],
+    }
+    provider._create_node(node_config, {"cls-node-type": "worker"}, 1)
+
+    fleet, = client.fleets
+    overrides = fleet["LaunchTemplateConfigs"][0]["Overrides"]
+    assert [(o["InstanceType"], o["Priority"]) for o in overrides] == [
+        ("m5.large", 0.0), ("m5a.large", 1.0), ("m4.large", 2.0)
+    ]
+    assert fleet["OnDemandOptions"] == {"AllocationStrategy": "prioritized"}
@@ -0,0 +1,186 @@
+import threading
+
+import botocore
+import pytest
+
+from clusterman.autoscaler._private import commands
+from clusterman.autoscaler._private.aws.launch_retry import LaunchRetryPolicy
+from clusterman.autoscaler._private.constants import AUTOSCALER_MAX_LAUNCH_BATCH
+from clusterman.autoscaler.tags import NODE_KIND_WORKER, TAG_NODE_KIND
+
+NODE_CONFIG = {
+    "InstanceType": "m5.large",
+    "ImageId": "ami-0",
+    "SubnetIds": ["subnet-a", "subnet-b"],
+}
+
+
+def capacity_error():
+    return botocore.exceptions.ClientError({
+        "Error": {
+            "Code": "InsufficientInstanceCapacity"
+        }
+    }, "RunInstances")
+
+
+class FakeInstance:
+    def __init__(self, instance_id):
+        self.id = self.instance_id = instance_id
+        self.state = {"Name": "pending"}
+        self.state_reason = None
+
+
+class FakeEC2:
+    """Launches at most `per_call[(subnet, instance type)]` instances per
+    request, failing with InsufficientInstanceCapacity if that is 0."""
+
+    def __init__(self, per_call):
+        self.per_call = per_call
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def create_instances(self, **conf):
+        key = (conf["SubnetId"], conf["InstanceType"])
+        with self._lock:
+            self.calls.append(key + (conf["MaxCount"], ))
+            launched = min(conf["MaxCount"], self.per_call.get(key, 0))
+            if not launched:
+                raise capacity_error()
+            start = len(self.calls) * 100
+        return [FakeInstance("i-{}".format(start + i)) for i in range(launched)]
+
+
+@pytest.fixture
+def make_launcher(make_aws_provider, monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+
+    def make(per_call):
+        provider = make_aws_provider(cache_stopped_nodes=False)
+        provider.ec2_fail_fast = FakeEC2(per_call)
+        return provider
+
+    return make
+
+
+def test_create_node_launches_in_batches(make_launcher):
+    provider = make_launcher({
+        ("subnet-a", "m5.large"): 100,
+        ("subnet-b", "m5.large"): 100
+    })
+    count = 2 * AUTOSCALER_MAX_LAUNCH_BATCH + 1
+    created = provider._create_node(NODE_CONFIG, {}, count)
+
+    assert len(created) == count
+    assert sorted(call[2] for call in provider.ec2_fail_fast.calls) == [
+        1, AUTOSCALER_MAX_LAUNCH_BATCH, AUTOSCALER_MAX_LAUNCH_BATCH
+    ]
+
+
+def test_partial_fill_moves_to_next_instance_type(make_launcher):
+    provider = make_launcher({
+        ("subnet-a", "m5.large"): 3,
+        ("subnet-a", "m5a.large"): 100,
+        ("subnet-b", "m5a.large"): 100,
+    })
+    node_config = dict(NODE_CONFIG, InstanceTypes=["m5a.large"])
+    created = provider._create_node(node_config, {}, 12)
+
+    assert len(created) == 12
+    calls = provider.ec2_fail_fast.calls
+    # subnet-a under-delivered once and was not asked for m5.large again.
+    partial_fills = [
+        call for call in calls if call[:2] == ("subnet-a", "m5.large")
+        and call[2] > 3
+    ]
+    assert len(partial_fills) <= 1
+    assert any(call[1] == "m5a.large" for call in calls)
+
+
+def test_shortfall_is_returned(make_launcher):
+    provider = make_launcher({
+        ("subnet-a", "m5.large"): 1,
+        ("subnet-b", "m5.large"): 1,
+    })
+    provider.launch_retry_policy.max_attempts = 2
+
+    created = provider._create_node(NODE_CONFIG, {}, 5)
+
+    # Bounded by max_attempts instead of retrying the same subnets forever.
+    assert len(created) == 2
+    assert len(provider.ec2_fail_fast.calls) == 2
+
+
+def test_partial_fill_skips_subnet_for_instance_type():
+    policy = LaunchRetryPolicy({})
+    policy.on_success("subnet-a", 5, 5, "m5.large")
+    assert policy.available_subnets(["subnet-a"], "m5.large") == ["subnet-a"]
+
+    policy.on_success("subnet-a", 5, 3, "m5.large")
+    assert policy.available_subnets(["subnet-a", "subnet-b"],
+                                    "m5.large") == ["subnet-b"]
+    assert policy.available_subnets(["subnet-a"], "m5a.large") == ["subnet-a"]
+    assert policy.choose_subnet(["subnet-a", "subnet-b"], 0,
+                                "m5.large") == "subnet-b"
+
+
+class FakeUpdater:
+    def __init__(self, node_id, **kwargs):
+        self.node_id = node_id
+        self.exitcode = 0
+
+    def run(self):
+        pass
+
+
+class FakeScheduler:
+    def __init__(self, max_concurrent):
+        self.queue_depth = self.in_flight = self.completed = 0
+
+    def submit(self, updater):
+        updater.run()
+
+    def wait(self, timeout=None):
+        return True
+
+    def close(self):
+        pass
+
+
+class ShortProvider:
+    """Launches only half of the requested workers."""
+
+    def __init__(self):
+        self.nodes = []
+
+    def create_node(self, node_config, tags, count):
+        self.nodes = ["i-{}".format(i) for i in range(count // 2)]
+        return {node_id: None for node_id in self.nodes}
+
+    def non_terminated_nodes(self, tag_filters):
+        assert tag_filters == {TAG_NODE_KIND: NODE_KIND_WORKER}
+        return list(self.nodes)
+
+    def flush_node_tags(self):
+        pass
+
+
+def test_create_nodes_waits_only_for_launched_workers(monkeypatch):
+    monkeypatch.setitem(commands.UPDATER_ENGINES, "thread",
+                        (FakeUpdater, FakeScheduler))
+    monkeypatch.setattr(commands.time, "sleep", pytest.fail)
+    config = {
+        "cluster_name": "test",
+        "provider": {
+            "type": "aws",
+            "region": "us-west-2"
+        },
+        "auth": {},
+        "worker_nodes": {
+            "InstanceType": "m5.large"
+        },
+        "file_mounts": {},
+        "initialization_commands": [],
+        "worker_setup_commands": [],
+        "num_workers": 4,
+    }
+    commands.create_nodes(config, yes=True, _provider=ShortProvider())
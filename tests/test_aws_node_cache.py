@@ -0,0 +1,301 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import botocore
+import pytest
+
+from clusterman.autoscaler._private.aws import node_provider
+from clusterman.autoscaler._private.constants import AWS_NODE_CACHE_GRACE_S
+from clusterman.autoscaler.tags import NODE_KIND_WORKER, TAG_CLUSTER_NAME, TAG_NODE_KIND, TAG_NODE_STATUS
+
+
+def not_found_error():
+    return botocore.exceptions.ClientError({
+        "Error": {
+            "Code": "InvalidInstanceID.NotFound"
+        }
+    }, "DescribeInstances")
+
+
+class FakeDescribeClient:
+    """Answers DescribeInstances from `instances`, a dict mapping instance
+    IDs to their state, `public_ips` and `tags`. Calls block until
+    `release` is set."""
+
+    def __init__(self, instances, cluster_name="test"):
+        self.instances = instances
+        self.public_ips = {}
+        self.tags = {}
+        self.tags_created = []
+        self.cluster_name = cluster_name
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self._lock = threading.Lock()
+
+    def get_paginator(self, operation):
+        assert operation == "describe_instances"
+        return self
+
+    def _describe(self, instance_id):
+        tags = dict(self.tags.get(instance_id, {}))
+        tags[TAG_CLUSTER_NAME] = self.cluster_name
+        instance = {
+            "InstanceId": instance_id,
+            "State": {
+                "Name": self.instances[instance_id]
+            },
+            "PrivateIpAddress": "10.0.0.1",
+            "Tags": [{
+                "Key": k,
+                "Value": v
+            } for k, v in tags.items()],
+        }
+        if instance_id in self.public_ips:
+            instance["PublicIpAddress"] = self.public_ips[instance_id]
+        return instance
+
+    def _matches(self, instance_id, name, values):
+        if name == "instance-state-name":
+            return self.instances[instance_id] in values
+        key = name[len("tag:"):]
+        if key == TAG_CLUSTER_NAME:
+            return self.cluster_name in values
+        return self.tags.get(instance_id, {}).get(key) in values
+
+    def create_tags(self, Resources, Tags):
+        self.tags_created.append(Resources)
+
+    def paginate(self, InstanceIds=None, Filters=None):
+        with self._lock:
+            self.calls.append(InstanceIds)
+        self.started.set()
+        self.release.wait()
+        if InstanceIds is not None:
+            if any(i not in self.instances for i in InstanceIds):
+                raise not_found_error()
+            ids = InstanceIds
+        else:
+            ids = [
+                i for i in self.instances if all(
+                    self._matches(i, f["Name"], f["Values"]) for f in Filters)
+            ]
+        yield {
+            "Reservations": [{
+                "Instances": [self._describe(i) for i in ids]
+            }]
+        }
+
+
+@pytest.fixture
+def make_provider(make_aws_provider):
+    def make(instances, **provider_config):
+        provider = make_aws_provider(**provider_config)
+        provider.ec2 = SimpleNamespace(
+            meta=SimpleNamespace(client=FakeDescribeClient(instances)))
+        return provider
+
+    return make
+
+
+def run_concurrently(count, fn):
+    threads = [threading.Thread(target=fn) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_concurrent_inventory_refreshes_share_one_call(make_provider):
+    provider = make_provider({"i-1": "running", "i-2": "pending"})
+    client = provider.ec2.meta.client
+    client.release.clear()
+    threads = run_concurrently(8, provider._refresh_inventory)
+    assert client.started.wait(5)
+    # Let the other callers queue up behind the first one.
+    time.sleep(0.1)
+    client.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert client.calls == [None]
+    assert sorted(provider.cached_nodes) == ["i-1", "i-2"]
+
+
+def test_inventory_refresh_error_reaches_waiting_callers(make_provider):
+    provider = make_provider({})
+    client = provider.ec2.meta.client
+    client.release.clear()
+    client.instances = None  # Fails the listing.
+    errors = []
+
+    def refresh():
+        try:
+            provider._refresh_inventory()
+        except Exception as e:
+            errors.append(e)
+
+    threads = run_concurrently(4, refresh)
+    assert client.started.wait(5)
+    time.sleep(0.1)
+    client.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(client.calls) == 1
+    assert len(errors) == 4
+    # Failed refreshes are not cached.
+    client.instances = {"i-1": "running"}
+    provider._refresh_inventory()
+    assert len(client.calls) == 2
+
+
+def test_inventory_is_reloaded_once_stale(make_provider):
+    provider = make_provider({"i-1": "running"},
+                             inventory_max_staleness_s=30)
+    client = provider.ec2.meta.client
+    provider._refresh_inventory()
+    client.instances["i-2"] = "pending"
+    provider._refresh_inventory()
+    assert len(client.calls) == 1
+    assert "i-2" not in provider.cached_nodes
+
+    provider._inventory_refreshed_at -= 30
+    provider._refresh_inventory()
+    assert len(client.calls) == 2
+    assert sorted(provider.cached_nodes) == ["i-1", "i-2"]
+
+
+def test_concurrent_ip_misses_share_one_describe_call(make_provider):
+    instances = {"i-{}".format(i): "running" for i in range(6)}
+    provider = make_provider(instances)
+    client = provider.ec2.meta.client
+    provider._refresh_inventory()
+    client.public_ips = {node_id: "1.2.3.4" for node_id in instances}
+    ips = {}
+
+    def lookup(node_id):
+        ips[node_id] = provider.external_ip(node_id)
+
+    threads = [
+        threading.Thread(target=lookup, args=(node_id, ))
+        for node_id in instances
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert ips == client.public_ips
+    assert client.calls == [None, sorted(instances)]
+    # Cached from now on.
+    assert provider.internal_ip("i-0") == "10.0.0.1"
+    assert provider.external_ip("i-0") == "1.2.3.4"
+    assert len(client.calls) == 2
+
+
+def test_point_refresh_is_split_in_batches(make_provider, monkeypatch):
+    monkeypatch.setattr(node_provider, "POINT_REFRESH_BATCH_SIZE", 2)
+    instances = {"i-{}".format(i): "running" for i in range(5)}
+    provider = make_provider(instances)
+    nodes = provider._refresh_nodes(sorted(instances))
+
+    assert sorted(nodes) == sorted(instances)
+    assert provider.ec2.meta.client.calls == [["i-0", "i-1"], ["i-2", "i-3"],
+                                              ["i-4"]]
+
+
+def test_point_refresh_skips_missing_nodes(make_provider):
+    provider = make_provider({"i-1": "running", "i-2": "stopped"})
+    nodes = provider._refresh_nodes(["i-1", "i-2", "i-gone"])
+
+    assert sorted(nodes) == ["i-1", "i-2"]
+    # The unknown ID fails the batch, which is described one by one.
+    assert provider.ec2.meta.client.calls == [["i-1", "i-2", "i-gone"],
+                                              ["i-1"], ["i-2"], ["i-gone"]]
+    assert provider.is_terminated("i-2")
+    with pytest.raises(AssertionError, match="i-gone"):
+        provider._get_node("i-gone")
+
+
+def age(provider, node_id, seconds):
+    provider._last_seen[node_id] -= seconds
+
+
+def test_terminated_nodes_are_dropped_after_grace_period(make_provider):
+    provider = make_provider({"i-1": "running", "i-2": "running"})
+    client = provider.ec2.meta.client
+    provider.non_terminated_nodes({})
+    client.instances["i-1"] = "terminated"
+
+    assert provider.non_terminated_nodes({}) == ["i-2"]
+    assert "i-1" not in provider.cached_nodes
+    # Callers still holding the ID can look up its tags for a while.
+    assert provider.node_tags("i-1") == {TAG_CLUSTER_NAME: "test"}
+
+    age(provider, "i-1", AWS_NODE_CACHE_GRACE_S - 1)
+    provider.non_terminated_nodes({})
+    assert "i-1" in provider.tag_cache
+
+    age(provider, "i-1", 2)
+    provider.non_terminated_nodes({})
+    assert "i-1" not in provider.tag_cache
+    assert "i-1" not in provider._last_seen
+    assert sorted(provider.tag_cache) == ["i-2"]
+
+
+def test_nodes_missing_from_a_listing_keep_their_launch(make_provider):
+    provider = make_provider({"i-1": "pending"})
+    client = provider.ec2.meta.client
+    provider._launched_at["i-1"] = ("subnet-a", time.monotonic())
+    provider._refresh_nodes(["i-1"])
+    # Listings can lag behind the launch of a node.
+    del client.instances["i-1"]
+    provider.non_terminated_nodes({})
+
+    assert "i-1" in provider.tag_cache
+    assert "i-1" in provider._launched_at
+    client.instances["i-1"] = "running"
+    provider.non_terminated_nodes({})
+    assert provider.is_running("i-1")
+    assert "i-1" not in provider._launched_at
+
+
+def test_nodes_with_pending_tags_are_kept(make_provider, monkeypatch):
+    monkeypatch.setattr(node_provider, "TAG_BATCH_DELAY", 60)
+    provider = make_provider({"i-1": "running"})
+    client = provider.ec2.meta.client
+    provider.non_terminated_nodes({})
+    provider.set_node_tags("i-1", {TAG_NODE_STATUS: "setting-up"})
+    client.instances["i-1"] = "terminated"
+    provider.non_terminated_nodes({})
+    age(provider, "i-1", AWS_NODE_CACHE_GRACE_S + 1)
+    provider.non_terminated_nodes({})
+
+    assert provider.node_tags("i-1")[TAG_NODE_STATUS] == "setting-up"
+    provider.flush_node_tags()
+    assert client.tags_created == [["i-1"]]
+    provider.non_terminated_nodes({})
+    assert "i-1" not in provider.tag_cache
+
+
+def test_filtered_listing_only_drops_matching_nodes(make_provider):
+    provider = make_provider({"i-other": "running", "i-worker": "running"})
+    client = provider.ec2.meta.client
+    client.tags = {
+        "i-other": {
+            TAG_NODE_KIND: "other"
+        },
+        "i-worker": {
+            TAG_NODE_KIND: NODE_KIND_WORKER
+        },
+    }
+    provider.non_terminated_nodes({})
+    client.instances["i-other"] = "terminated"
+    age(provider, "i-other", AWS_NODE_CACHE_GRACE_S + 1)
+
+    workers = provider.non_terminated_nodes({TAG_NODE_KIND: NODE_KIND_WORKER})
+    assert workers == ["i-worker"]
+    assert "i-other" in provider.cached_nodes
+    assert "i-other" in provider.tag_cache
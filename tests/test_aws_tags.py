@@ -0,0 +1,121 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from clusterman.autoscaler._private.aws.node_provider import NodeRecord
+from clusterman.autoscaler.tags import TAG_NODE_KIND, TAG_NODE_NAME, TAG_NODE_STATUS
+
+
+class FakeEC2Client:
+    """Records CreateTags calls, blocking them until `release` is set."""
+
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def create_tags(self, Resources, Tags):
+        self.started.set()
+        self.release.wait()
+        if self.error is not None:
+            raise self.error
+        self.calls.append((sorted(Resources),
+                           sorted((t["Key"], t["Value"]) for t in Tags)))
+
+
+@pytest.fixture
+def provider(make_aws_provider):
+    provider = make_aws_provider()
+    provider.ec2 = SimpleNamespace(
+        meta=SimpleNamespace(client=FakeEC2Client()))
+    return provider
+
+
+def listed(node_id, **tags):
+    return NodeRecord(node_id, "running", None, "10.0.0.1", None, tags)
+
+
+def test_flush_writes_queued_tags(provider):
+    provider._update_caches([listed("i-1", Name="head")])
+    provider.set_node_tags("i-1", {TAG_NODE_STATUS: "up-to-date"})
+    # Visible right away, before being written.
+    assert provider.node_tags("i-1")[TAG_NODE_STATUS] == "up-to-date"
+
+    provider.flush_node_tags()
+    assert provider.ec2.meta.client.calls == [(["i-1"], [(TAG_NODE_STATUS,
+                                                          "up-to-date")])]
+    assert provider.node_tags("i-1") == {
+        TAG_NODE_NAME: "head",
+        TAG_NODE_STATUS: "up-to-date"
+    }
+
+
+def test_flush_raises_write_error(provider):
+    provider.ec2.meta.client.error = RuntimeError("throttled")
+    provider.set_node_tags("i-1", {TAG_NODE_STATUS: "up-to-date"})
+    with pytest.raises(RuntimeError, match="throttled"):
+        provider.flush_node_tags()
+    # The error is only reported once.
+    provider.flush_node_tags()
+
+
+def test_same_tags_share_a_create_tags_call(provider):
+    client = provider.ec2.meta.client
+    client.release.clear()
+    # Hold the writer on a first update so that the next ones are batched.
+    provider.set_node_tags("i-0", {TAG_NODE_STATUS: "syncing-files"})
+    provider._tag_flush_requested.set()
+    assert client.started.wait(5)
+    for node_id in ["i-1", "i-2"]:
+        provider.set_node_tags(node_id, {TAG_NODE_STATUS: "up-to-date"})
+    provider.set_node_tags("i-3", {TAG_NODE_NAME: "worker"})
+    client.release.set()
+    provider.flush_node_tags()
+
+    assert sorted(client.calls) == [
+        (["i-0"], [(TAG_NODE_STATUS, "syncing-files")]),
+        (["i-1", "i-2"], [(TAG_NODE_STATUS, "up-to-date")]),
+        (["i-3"], [("Name", "worker")]),
+    ]
+
+
+def test_tags_written_before_listing_keep_ec2_tags(provider):
+    provider.set_node_tags("i-1", {TAG_NODE_STATUS: "up-to-date"})
+    provider.flush_node_tags()
+
+    provider._update_caches([
+        listed("i-1", Name="worker", **{
+            TAG_NODE_KIND: "worker",
+            TAG_NODE_STATUS: "up-to-date"
+        })
+    ])
+    assert provider.node_tags("i-1") == {
+        TAG_NODE_NAME: "worker",
+        TAG_NODE_KIND: "worker",
+        TAG_NODE_STATUS: "up-to-date"
+    }
+
+
+def test_listing_during_write_keeps_tags_being_written(provider):
+    client = provider.ec2.meta.client
+    client.release.clear()
+    provider.set_node_tags("i-1", {TAG_NODE_STATUS: "up-to-date"})
+    provider._tag_flush_requested.set()
+    assert client.started.wait(5)
+
+    # Described before the write reached EC2.
+    provider._update_caches([
+        listed("i-1", **{
+            TAG_NODE_KIND: "worker",
+            TAG_NODE_STATUS: "waiting-for-ssh"
+        })
+    ])
+    client.release.set()
+    provider.flush_node_tags()
+    assert provider.node_tags("i-1") == {
+        TAG_NODE_KIND: "worker",
+        TAG_NODE_STATUS: "up-to-date"
+    }
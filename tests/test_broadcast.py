@@ -0,0 +1,93 @@
+import os
+import threading
+
+from clusterman.autoscaler._private.broadcast import RELAY_KEY_PATH, FileMountBroadcaster
+
+
+class SlowCommandRunner:
+    """Blocks key uploads until released, counting the concurrent ones."""
+
+    def __init__(self, release, uploads):
+        self.release = release
+        self.uploads = uploads
+
+    def run_rsync_up(self, source, target, options=None):
+        with self.uploads["lock"]:
+            self.uploads["now"] += 1
+            self.uploads["max"] = max(self.uploads["max"],
+                                      self.uploads["now"])
+            self.uploads["total"] += 1
+        self.release.wait(5)
+        with self.uploads["lock"]:
+            self.uploads["now"] -= 1
+
+    def run(self, cmd, run_env="auto"):
+        pass
+
+
+class FakeUpdater:
+    def __init__(self, node_id, cmd_runner):
+        self.node_id = node_id
+        self.cmd_runner = cmd_runner
+
+
+def test_relay_key_copied_once_per_node_in_parallel():
+    broadcaster = FileMountBroadcaster()
+    release = threading.Event()
+    uploads = {"lock": threading.Lock(), "now": 0, "max": 0, "total": 0}
+    holders = [
+        FakeUpdater(node_id, SlowCommandRunner(release, uploads))
+        for node_id in ["i-0", "i-1", "i-0", "i-1"]
+    ]
+    threads = [
+        threading.Thread(target=broadcaster._ensure_relay_key, args=(h, ))
+        for h in holders
+    ]
+    for thread in threads:
+        thread.start()
+
+    # Both nodes get the key at the same time, each of them only once.
+    while uploads["max"] < 2 and all(t.is_alive() for t in threads):
+        release.wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert uploads["max"] == 2
+    assert uploads["total"] == 2
+
+
+class RecordingCommandRunner:
+    def __init__(self):
+        self.uploads = []
+        self.commands = []
+
+    def run_rsync_up(self, source, target, options=None):
+        with open(source) as f:
+            self.uploads.append((f.read(), target))
+
+    def run(self, cmd, run_env="auto"):
+        self.commands.append(cmd)
+
+
+def test_relay_key_is_ephemeral_and_removed_on_close():
+    broadcaster = FileMountBroadcaster()
+    holder = FakeUpdater("i-0", RecordingCommandRunner())
+    receiver = FakeUpdater("i-1", RecordingCommandRunner())
+    holder.log_prefix = receiver.log_prefix = ""
+
+    broadcaster._ensure_relay_key(holder)
+    broadcaster._prepare_node("authorized", receiver,
+                              broadcaster._authorize_key)
+    (private_key, target), = holder.cmd_runner.uploads
+    assert "PRIVATE KEY" in private_key and target == RELAY_KEY_PATH
+    key_dir = os.path.dirname(broadcaster._private_key_path())
+    assert os.stat(key_dir).st_mode & 0o077 == 0
+    comment = broadcaster._key_comment
+    assert comment in receiver.cmd_runner.commands[0]
+    assert "authorized_keys" in receiver.cmd_runner.commands[0]
+
+    broadcaster.close()
+    assert holder.cmd_runner.commands[-1] == "rm -f {}".format(RELAY_KEY_PATH)
+    assert "sed -i" in receiver.cmd_runner.commands[-1]
+    assert comment in receiver.cmd_runner.commands[-1]
+    assert not os.path.exists(key_dir)
@@ -0,0 +1,58 @@
+import pytest
+
+from clusterman.autoscaler._private import command_runner
+from clusterman.autoscaler._private.command_runner import SSHCommandRunner
+
+
+class FakeProvider:
+    def __init__(self, provider_config):
+        self.provider_config = provider_config
+
+
+def make_runner(provider_config, use_internal_ip=False):
+    runner = SSHCommandRunner.__new__(SSHCommandRunner)
+    runner.provider = FakeProvider(provider_config)
+    runner.use_internal_ip = use_internal_ip
+    runner.log_prefix = ""
+    runner._remote_check = lambda test: True
+    return runner
+
+
+@pytest.mark.parametrize("provider_config,options,use_internal_ip,expected", [
+    ({}, {}, False, "zstd"),
+    ({}, {}, True, "none"),
+    ({"rsync_compression": "auto"}, {}, False, "zstd"),
+    ({"rsync_compression": "zlib"}, {}, False, "gzip"),
+    ({"rsync_compression": "gzip"}, {}, False, "gzip"),
+    ({"rsync_compression": "none"}, {}, False, "none"),
+    ({"rsync_compression": "zlib"}, {"compression": "auto"}, False, "zstd"),
+    ({"rsync_compression": "none"}, {"compression": "zstd"}, True, "zstd"),
+])
+def test_tar_compression_keeps_explicit_choice(monkeypatch, provider_config,
+                                               options, use_internal_ip,
+                                               expected):
+    monkeypatch.setattr(command_runner.shutil, "which", lambda cmd: cmd)
+    runner = make_runner(provider_config, use_internal_ip)
+    compression, _ = runner._tar_compression(options)
+    assert compression == expected
+
+
+@pytest.mark.parametrize("provider_config,rsync_version,expected", [
+    ({}, b"Compress list:\n    zstd lz4 zlibx zlib none", ["-z"]),
+    ({"rsync_compression": "zlib"}, b"Compress list:\n    zstd zlib",
+     ["-z", "--compress-choice=zlib"]),
+    ({"rsync_compression": "gzip", "rsync_compression_level": 3},
+     b"Compress list:\n    zstd zlib",
+     ["-z", "--compress-choice=zlib", "--compress-level=3"]),
+    ({"rsync_compression": "zlib"}, b"rsync  version 3.1.3", ["-z"]),
+    ({"rsync_compression": "zstd"}, b"Compress list:\n    zstd zlib",
+     ["-z", "--compress-choice=zstd"]),
+    ({"rsync_compression": "zstd"}, b"rsync  version 3.1.3", ["-z"]),
+    ({"rsync_compression": "none"}, b"Compress list:\n    zstd zlib", []),
+])
+def test_rsync_compression_args(monkeypatch, provider_config, rsync_version,
+                                expected):
+    monkeypatch.setattr(command_runner, "_local_rsync_version",
+                        lambda: rsync_version)
+    runner = make_runner(provider_config)
+    assert runner._rsync_compression_args({}) == expected
@@ -0,0 +1,89 @@
+import os
+import stat
+import time
+
+from clusterman.autoscaler._private import file_hash_cache
+from clusterman.autoscaler._private.file_hash_cache import FileHashCache, hash_file
+
+
+def make_file(tmp_path, contents="data"):
+    path = tmp_path / "file.txt"
+    path.write_text(contents)
+    old = time.time() - 60
+    os.utime(str(path), (old, old))
+    return str(path)
+
+
+def test_cache_saved_to_private_dir(tmp_path):
+    path = make_file(tmp_path)
+    cache_file = tmp_path / "cache" / "clusterman" / "hashes.json"
+    cache = FileHashCache(str(cache_file))
+    assert cache.digest(path) == hash_file(path)
+    cache.save()
+
+    assert stat.S_IMODE(os.stat(str(cache_file.parent)).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(str(cache_file)).st_mode) == 0o600
+    assert FileHashCache(str(cache_file)).lookup(path) == hash_file(path)
+
+
+def test_hits_do_not_rewrite_cache(tmp_path, monkeypatch):
+    path = make_file(tmp_path)
+    cache_file = str(tmp_path / "hashes.json")
+    cache = FileHashCache(cache_file)
+    cache.digest(path)
+    cache.save()
+
+    cache = FileHashCache(cache_file)
+    assert cache.digest(path) == hash_file(path)
+    assert not cache._dirty
+
+    # Only a use long after the last recorded one is written back.
+    now = time.time() + file_hash_cache.LAST_USED_RESOLUTION_S
+    monkeypatch.setattr(file_hash_cache.time, "time", lambda: now)
+    assert cache.lookup(path) == hash_file(path)
+    assert cache._dirty
+
+
+def test_changed_files_are_rehashed(tmp_path, monkeypatch):
+    path = make_file(tmp_path)
+    cache = FileHashCache(str(tmp_path / "hashes.json"))
+    hashed = []
+
+    def counting_hash_file(path, algorithm="sha1"):
+        hashed.append(path)
+        return hash_file(path, algorithm)
+
+    monkeypatch.setattr(file_hash_cache, "hash_file", counting_hash_file)
+    cache.digest(path)
+    cache.digest(path)
+    assert len(hashed) == 1
+
+    # Same contents, different mtime.
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    assert cache.lookup(path) is None
+    assert cache.digest(path) == hash_file(path)
+    assert len(hashed) == 2
+
+    # Different size, same mtime.
+    with open(path, "a") as f:
+        f.write("more")
+    os.utime(path, (old, old))
+    assert cache.lookup(path) is None
+    assert cache.digest(path) == hash_file(path)
+    assert len(hashed) == 3
+
+
+def test_unchanged_cache_is_not_written_back(tmp_path, monkeypatch):
+    path = make_file(tmp_path)
+    cache_file = str(tmp_path / "hashes.json")
+    cache = FileHashCache(cache_file)
+    cache.digest(path)
+    cache.save()
+
+    cache = FileHashCache(cache_file)
+    saved = []
+    monkeypatch.setattr(cache._store, "save", saved.append)
+    cache.digest(path)
+    cache.save()
+    assert saved == []
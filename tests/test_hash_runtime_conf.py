@@ -0,0 +1,54 @@
+import pytest
+
+from clusterman.autoscaler._private import constants, util
+from clusterman.autoscaler._private.file_hash_cache import FileHashCache
+
+FILE_MOUNTS = {"/remote/tree": "tree", "/remote/x": "single.txt"}
+SYNCED_FILES = ["sub_missing", "tree/sub"]
+EXTRA_OBJS = {"setup": ["echo hi"]}
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    """A known tree, at paths relative to the working directory so that the
+    hashes do not depend on where it is."""
+    (tmp_path / "tree" / "sub").mkdir(parents=True)
+    (tmp_path / "tree" / "a.txt").write_text("hello\n")
+    (tmp_path / "tree" / "sub" / "b.bin").write_text("world")
+    (tmp_path / "single.txt").write_text("x")
+    for i in range(20):
+        (tmp_path / "tree" / "sub" / "f{}.txt".format(i)).write_text(str(i))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(util, "_hash_cache", {})
+    monkeypatch.setattr(util, "_file_hash_cache", FileHashCache(path=None))
+    return tmp_path
+
+
+def hashes(algorithm=util.DEFAULT_HASH_ALGORITHM):
+    util._hash_cache.clear()
+    return util.hash_runtime_conf(
+        FILE_MOUNTS,
+        SYNCED_FILES,
+        EXTRA_OBJS,
+        generate_file_mounts_contents_hash=True,
+        hash_algorithm=algorithm)
+
+
+def test_default_hash_unchanged(tree):
+    # Computed by the byte stream hashing of earlier versions, so that the
+    # runtime hashes of existing nodes still match after an upgrade.
+    assert hashes() == ("2ee449e18adb7849afeaac313569f9950bb7d47b",
+                        "4a2c5c9b80c2e98a3169da5e07fe7634918ae078")
+
+
+def test_parallel_hashing_matches_sequential(tree, monkeypatch):
+    monkeypatch.setattr(constants, "FILE_HASH_THREADS", 1)
+    sequential = hashes("blake2b")
+    monkeypatch.setattr(util, "_file_hash_cache", FileHashCache(path=None))
+    monkeypatch.setattr(constants, "FILE_HASH_THREADS", 8)
+    parallel = hashes("blake2b")
+
+    assert parallel == sequential
+    assert all(h.startswith("blake2b:") for h in parallel)
+    # Cached digests give the same result too.
+    assert hashes("blake2b") == sequential
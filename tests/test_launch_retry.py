@@ -0,0 +1,79 @@
+import botocore
+import pytest
+
+from clusterman.autoscaler._private.aws import launch_retry
+from clusterman.autoscaler._private.aws.launch_retry import FATAL, SUBNET, THROTTLED, TRANSIENT, LaunchRetryPolicy
+from clusterman.autoscaler._private.aws.subnet_health import SubnetHealth
+
+
+def client_error(code):
+    return botocore.exceptions.ClientError({"Error": {"Code": code}},
+                                           "RunInstances")
+
+
+@pytest.mark.parametrize("code,kind", [
+    ("InsufficientInstanceCapacity", SUBNET),
+    ("InsufficientFreeAddressesInSubnet", SUBNET),
+    ("RequestLimitExceeded", THROTTLED),
+    ("InternalError", TRANSIENT),
+    ("InvalidParameterValue", FATAL),
+    ("UnauthorizedOperation", FATAL),
+])
+def test_classify(code, kind):
+    assert LaunchRetryPolicy({}).classify(client_error(code)) == kind
+
+
+def test_classify_non_client_error():
+    assert LaunchRetryPolicy({}).classify(RuntimeError("boom")) == FATAL
+
+
+def test_throttling_backs_off_exponentially(monkeypatch):
+    monkeypatch.setattr(launch_retry.random, "uniform", lambda low, high: high)
+    policy = LaunchRetryPolicy({})
+    exc = client_error("RequestLimitExceeded")
+    delays = [
+        policy.on_failure(attempt, "subnet-a", exc)
+        for attempt in range(1, policy.max_attempts)
+    ]
+    assert delays == [
+        min(policy.max_delay_s, policy.base_delay_s * 2**i)
+        for i in range(policy.max_attempts - 1)
+    ]
+    # Throttling says nothing about the subnet.
+    assert policy.available_subnets(["subnet-a"]) == ["subnet-a"]
+    assert policy.on_failure(policy.max_attempts, "subnet-a", exc) is None
+
+
+def test_backoff_is_jittered():
+    policy = LaunchRetryPolicy({})
+    exc = client_error("InternalError")
+    delays = {policy.on_failure(3, "subnet-a", exc) for _ in range(20)}
+    assert len(delays) > 1
+    assert all(0 <= d <= policy.base_delay_s * 4 for d in delays)
+
+
+def test_capacity_error_retries_now_in_other_subnet():
+    health = SubnetHealth(path=None)
+    policy = LaunchRetryPolicy({}, health)
+    exc = client_error("InsufficientInstanceCapacity")
+
+    assert policy.on_failure(1, "subnet-a", exc, "m5.large") == 0
+    assert policy.available_subnets(["subnet-a", "subnet-b"],
+                                    "m5.large") == ["subnet-b"]
+    # Capacity errors only skip the subnet for the failed instance type.
+    assert policy.available_subnets(["subnet-a"], "m5a.large") == ["subnet-a"]
+    assert health.score("subnet-a") < health.score("subnet-b")
+
+
+def test_subnet_error_skips_subnet_for_all_types():
+    policy = LaunchRetryPolicy({})
+    exc = client_error("InsufficientFreeAddressesInSubnet")
+    assert policy.on_failure(1, "subnet-a", exc, "m5.large") == 0
+    assert policy.available_subnets(["subnet-a"], "m5a.large") == []
+
+
+def test_fatal_error_is_not_retried():
+    policy = LaunchRetryPolicy({})
+    exc = client_error("InvalidParameterValue")
+    assert policy.on_failure(1, "subnet-a", exc) is None
+    assert policy.available_subnets(["subnet-a"]) == ["subnet-a"]
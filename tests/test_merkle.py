@@ -0,0 +1,117 @@
+import json
+
+import pytest
+
+from clusterman.autoscaler._private import merkle, updater
+
+
+def write_tree(root, files):
+    for relpath, contents in files.items():
+        path = root.joinpath(*relpath.split("/"))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(contents)
+
+
+def names(node, prefix=""):
+    paths = []
+    for name, child in node.get("children", {}).items():
+        path = prefix + name
+        paths.append(path)
+        paths += names(child, path + "/")
+    return sorted(paths)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    write_tree(tmp_path, {
+        "a.txt": "a",
+        "pkg/b.py": "b",
+        "pkg/c.py": "c",
+        "pkg/sub/d.py": "d",
+    })
+    return tmp_path
+
+
+def test_diff_manifests(tree):
+    old = merkle.build_manifest(str(tree))
+    assert merkle.diff_manifests(old, old) == []
+
+    write_tree(tree, {"pkg/c.py": "changed", "pkg/sub/e.py": "e"})
+    (tree / "a.txt").unlink()
+    new = merkle.build_manifest(str(tree))
+    # Removed files are ignored, only the topmost changes are returned.
+    assert merkle.diff_manifests(old, new) == ["pkg/c.py", "pkg/sub/e.py"]
+
+    write_tree(tree, {"new/f.py": "f"})
+    newer = merkle.build_manifest(str(tree))
+    assert merkle.diff_manifests(new, newer) == ["new"]
+
+
+@pytest.mark.parametrize("old", [
+    None,
+    {
+        "version": merkle.MANIFEST_VERSION + 1,
+        "algorithm": "md5",
+        "root": {}
+    },
+    {
+        "version": merkle.MANIFEST_VERSION,
+        "algorithm": "sha256",
+        "root": {}
+    },
+])
+def test_diff_manifests_resends_whole_mount(tree, old):
+    new = merkle.build_manifest(str(tree), "md5")
+    assert merkle.diff_manifests(old, new) == [""]
+
+
+def test_build_manifest_applies_rsync_rules(tree):
+    write_tree(
+        tree, {
+            "a.pyc": "",
+            "pkg/.gitignore": "# comment\nsub/\n*.log\n",
+            "pkg/x.log": "",
+            "sub/kept.py": "",
+            "build/out": "",
+        })
+    manifest = merkle.build_manifest(str(tree),
+                                     rsync_exclude=["*.pyc", "/build"],
+                                     rsync_filter=[".gitignore"])
+    assert names(manifest["root"]) == [
+        "a.txt", "pkg", "pkg/.gitignore", "pkg/b.py", "pkg/c.py", "sub",
+        "sub/kept.py"
+    ]
+
+
+def test_parse_manifest_between_delimiters(tree):
+    manifest = merkle.build_manifest(str(tree))
+    output = "\r\n".join([
+        "Welcome to the node!",
+        merkle.MANIFEST_BEGIN,
+        json.dumps(manifest),
+        "",
+        merkle.MANIFEST_END,
+        "logout",
+    ])
+    assert merkle.parse_manifest(output) == manifest
+    assert merkle.parse_manifest("{}\n{}\n".format(
+        merkle.MANIFEST_BEGIN, merkle.MANIFEST_END)) is None
+    assert merkle.parse_manifest(json.dumps(manifest)) is None
+
+
+def test_sync_throughput_counts_sent_paths(tree, monkeypatch):
+    updater._tree_size.cache_clear()
+    write_tree(tree, {"pkg/big.bin": "x" * 2**20})
+
+    assert updater.sync_throughput(str(tree), [], 1) == "nothing sent"
+    assert updater.sync_throughput(str(tree), ["pkg/big.bin"], 2) == (
+        "1.0 MiB sent in 2.0s, 0.5 MiB/s")
+    assert updater.sync_throughput(str(tree), None, 2).startswith(
+        "1.0 MiB mount synced")
+
+    # The mount is walked only once, not again for every node.
+    walks = []
+    monkeypatch.setattr(updater.os, "walk",
+                        lambda path: walks.append(path) or iter(()))
+    updater.sync_throughput(str(tree), None, 2)
+    assert walks == []
@@ -0,0 +1,100 @@
+import pytest
+
+from clusterman.autoscaler._private.aws import rate_limiter
+from clusterman.autoscaler._private.aws.rate_limiter import AdaptiveRateLimiter, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    return clock
+
+
+def test_bucket_bursts_then_waits_in_order(clock):
+    bucket = TokenBucket(max_rate=2, burst=3)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.sleeps == []
+
+    # Callers finding the bucket empty reserve later tokens.
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == [0.5, 1.0]
+
+    clock.now += 10
+    bucket.acquire()
+    assert clock.sleeps == [0.5, 1.0]
+
+
+def test_bucket_aimd(clock):
+    bucket = TokenBucket(max_rate=8, burst=10)
+    assert bucket.on_throttled()
+    assert bucket.rate == 4
+    # Throttling right after a decrease answers requests sent at the old
+    # rate and is ignored.
+    assert not bucket.on_throttled()
+    assert bucket.rate == 4
+
+    # The rate grows back linearly once the cooldown is over, and is halved
+    # again by the next throttling.
+    clock.now += rate_limiter.DECREASE_COOLDOWN_S
+    assert bucket.on_throttled()
+    rate = (4 + rate_limiter.DECREASE_COOLDOWN_S *
+            rate_limiter.RATE_INCREASE_PER_S) / 2
+    assert bucket.rate == rate
+
+    clock.now += rate_limiter.DECREASE_COOLDOWN_S
+    bucket.acquire()
+    assert bucket.rate == rate + (rate_limiter.DECREASE_COOLDOWN_S *
+                                  rate_limiter.RATE_INCREASE_PER_S)
+    clock.now += 100
+    bucket.acquire()
+    assert bucket.rate == 8
+
+
+def test_bucket_rate_floor(clock):
+    bucket = TokenBucket(max_rate=1, burst=1)
+    for _ in range(5):
+        clock.now += rate_limiter.DECREASE_COOLDOWN_S
+        # No time passes between refills, so the rate only decreases.
+        bucket._decreased_at = float("-inf")
+        bucket.on_throttled()
+    assert bucket.rate == rate_limiter.MIN_RATE
+
+
+@pytest.mark.parametrize("operation,family", [
+    ("DescribeInstances", rate_limiter.DESCRIBE),
+    ("GetConsoleOutput", rate_limiter.DESCRIBE),
+    ("CreateTags", rate_limiter.TAGS),
+    ("DeleteTags", rate_limiter.TAGS),
+    ("RunInstances", rate_limiter.MUTATE),
+])
+def test_action_family(operation, family):
+    assert rate_limiter.action_family(operation) == family
+
+
+def test_limiter_only_slows_throttled_family(clock):
+    limiter = AdaptiveRateLimiter()
+    throttled = ({}, {"Error": {"Code": "RequestLimitExceeded"}})
+    limiter._needs_retry("needs-retry.ec2.RunInstances", response=throttled)
+    limiter._needs_retry(
+        "needs-retry.ec2.DescribeInstances",
+        response=({}, {"Error": {"Code": "InvalidInstanceID.NotFound"}}))
+    rates = limiter.rates
+    assert rates[rate_limiter.MUTATE] == (
+        rate_limiter.DEFAULT_LIMITS[rate_limiter.MUTATE][0] / 2)
+    assert rates[rate_limiter.DESCRIBE] == (
+        rate_limiter.DEFAULT_LIMITS[rate_limiter.DESCRIBE][0])
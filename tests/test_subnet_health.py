@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from clusterman.autoscaler._private.aws import subnet_health
+from clusterman.autoscaler._private.aws.subnet_health import SubnetHealth
+
+
+def test_rank_after_failures():
+    health = SubnetHealth(path=None)
+    subnets = ["subnet-a", "subnet-b", "subnet-c"]
+    for _ in range(3):
+        health.record_launch("subnet-a", False)
+    health.record_launch("subnet-b", 0.5)
+
+    assert health.rank(subnets) == ["subnet-c", "subnet-b", "subnet-a"]
+    assert health.score("subnet-a") < health.score("subnet-b")
+
+
+def test_rank_rotates_equally_healthy_subnets():
+    health = SubnetHealth(path=None)
+    subnets = ["subnet-a", "subnet-b", "subnet-c"]
+    assert health.rank(subnets, 0) == subnets
+    assert health.rank(subnets, 1) == ["subnet-b", "subnet-c", "subnet-a"]
+
+
+def test_slow_subnets_rank_last():
+    health = SubnetHealth(path=None)
+    health.record_time_to_running("subnet-a", 600)
+    health.record_time_to_running("subnet-b", 10)
+    assert health.rank(["subnet-a", "subnet-b"]) == ["subnet-b", "subnet-a"]
+
+
+def test_state_loaded_back_from_store(tmp_path):
+    path = str(tmp_path / "subnet-health.json")
+    health = SubnetHealth(path)
+    health.record_launch("subnet-a", False)
+    health.record_time_to_running("subnet-b", 30)
+    health.save()
+
+    with open(path) as f:
+        assert json.load(f)["_version"] == subnet_health.SUBNET_HEALTH_VERSION
+    loaded = SubnetHealth(path)
+    for subnet_id in ["subnet-a", "subnet-b", "subnet-c"]:
+        assert loaded.score(subnet_id) == pytest.approx(
+            health.score(subnet_id), rel=1e-3)
+    assert loaded.rank(["subnet-a", "subnet-b"]) == ["subnet-b", "subnet-a"]
+
+
+def test_store_of_other_version_ignored(tmp_path):
+    path = tmp_path / "subnet-health.json"
+    path.write_text(
+        json.dumps({
+            "_version": subnet_health.SUBNET_HEALTH_VERSION + 1,
+            "entries": {
+                "subnet-a": {}
+            }
+        }))
+    health = SubnetHealth(str(path))
+    assert health.score("subnet-a") == health.score("subnet-b")
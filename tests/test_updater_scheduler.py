@@ -0,0 +1,125 @@
+import threading
+
+import pytest
+
+from clusterman.autoscaler._private import async_updater
+from clusterman.autoscaler._private.async_updater import AsyncNodeUpdater, AsyncNodeUpdaterScheduler
+from clusterman.autoscaler._private.updater import NodeUpdaterScheduler
+
+
+class BlockingUpdater:
+    """Runs until released, recording how many updaters ran at once."""
+
+    def __init__(self, release, running, log_prefix="", fail=False):
+        self.release = release
+        self.running = running
+        self.log_prefix = log_prefix
+        self.fail = fail
+        self.started = threading.Event()
+
+    def run(self):
+        with self.running["lock"]:
+            self.running["now"] += 1
+            self.running["max"] = max(self.running["max"],
+                                      self.running["now"])
+        self.started.set()
+        self.release.wait()
+        with self.running["lock"]:
+            self.running["now"] -= 1
+        if self.fail:
+            raise RuntimeError("setup failed")
+
+
+def make_updaters(count, release, fail=False):
+    running = {"lock": threading.Lock(), "now": 0, "max": 0}
+    return running, [
+        BlockingUpdater(release, running, fail=fail) for _ in range(count)
+    ]
+
+
+def test_scheduler_accounting():
+    release = threading.Event()
+    running, updaters = make_updaters(5, release)
+    scheduler = NodeUpdaterScheduler(max_concurrency=2)
+    for updater in updaters:
+        scheduler.submit(updater)
+
+    # Updaters start in submission order, two at a time.
+    assert updaters[0].started.wait(5) and updaters[1].started.wait(5)
+    assert scheduler.in_flight == 2
+    assert scheduler.queue_depth == 3
+    assert scheduler.completed == 0
+    assert not scheduler.wait(timeout=0.05)
+
+    release.set()
+    assert scheduler.wait(timeout=5)
+    scheduler.close()
+    assert scheduler.in_flight == 0
+    assert scheduler.queue_depth == 0
+    assert scheduler.completed == 5
+    assert running["max"] == 2
+    assert len(scheduler._workers) == 2
+
+
+def test_scheduler_counts_failed_updaters():
+    release = threading.Event()
+    release.set()
+    _, updaters = make_updaters(3, release, fail=True)
+    scheduler = NodeUpdaterScheduler(max_concurrency=4)
+    for updater in updaters:
+        scheduler.submit(updater)
+
+    assert scheduler.wait(timeout=5)
+    scheduler.close()
+    assert scheduler.completed == 3
+    assert scheduler.in_flight == 0
+    # No more threads than submitted updaters are started.
+    assert len(scheduler._workers) <= 3
+
+
+class AsyncStepUpdater(AsyncNodeUpdater):
+    """Runs `step` as a transfer or a provider call."""
+
+    def __init__(self, step, transfer):
+        self.step = step
+        self.transfer = transfer
+        self.log_prefix = ""
+        self.done = threading.Event()
+
+    async def run_async(self, executor=None, transfer_executor=None):
+        self._executor = executor
+        self._transfer_executor = transfer_executor
+        if self.transfer:
+            await self._transfer(self.step)
+        else:
+            await self._call(self.step)
+        self.done.set()
+
+
+@pytest.mark.skipif(
+    not async_updater.ASYNC_ENGINE_SUPPORTED, reason="Requires Python 3.8+")
+def test_async_transfers_do_not_starve_provider_calls(monkeypatch):
+    monkeypatch.setattr(async_updater, "MAX_PROVIDER_CALL_THREADS", 2)
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def transfer():
+        started.release()
+        release.wait()
+
+    scheduler = AsyncNodeUpdaterScheduler(max_concurrency=4)
+    transfers = [AsyncStepUpdater(transfer, True) for _ in range(2)]
+    call = AsyncStepUpdater(lambda: None, False)
+    for updater in transfers:
+        scheduler.submit(updater)
+    assert started.acquire(timeout=5) and started.acquire(timeout=5)
+    scheduler.submit(call)
+
+    # Both provider call threads would be taken by the transfers if they
+    # shared a pool.
+    assert call.done.wait(5)
+    assert not any(updater.done.is_set() for updater in transfers)
+
+    release.set()
+    scheduler.close()
+    assert scheduler.completed == 3
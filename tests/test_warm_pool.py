@@ -0,0 +1,279 @@
+import pytest
+
+from clusterman.autoscaler._private import commands
+from clusterman.autoscaler._private.aws.node_provider import NodeRecord
+from clusterman.autoscaler.tags import NODE_KIND_WORKER, TAG_LAUNCH_CONFIG, TAG_NODE_KIND, TAG_RUNTIME_CONFIG
+
+CONFIG = {
+    "cluster_name": "test",
+    "provider": {
+        "type": "aws",
+        "region": "us-west-2"
+    },
+    "auth": {},
+    "worker_nodes": {
+        "InstanceType": "m5.large"
+    },
+    "file_mounts": {},
+    "initialization_commands": [],
+    "worker_setup_commands": ["echo setup"],
+    "num_workers": 2,
+}
+
+
+class FakeUpdater:
+    def __init__(self, node_id, provider, runtime_hash, **kwargs):
+        self.node_id = node_id
+        self.provider = provider
+        self.runtime_hash = runtime_hash
+        self.exitcode = None
+
+    def run(self):
+        self.provider.set_node_tags(self.node_id,
+                                    {TAG_RUNTIME_CONFIG: self.runtime_hash})
+        self.exitcode = 0
+
+
+class FakeScheduler:
+    def __init__(self, max_concurrent):
+        self.updaters = []
+        self.queue_depth = self.in_flight = self.completed = 0
+
+    def submit(self, updater):
+        self.updaters.append(updater)
+
+    def wait(self, timeout=None):
+        for updater in self.updaters:
+            updater.run()
+        return True
+
+    def close(self):
+        pass
+
+
+class FakeProvider:
+    """Nodes are either stopped or running, and keep their tags."""
+
+    def __init__(self, tags=None, stopped=()):
+        self.tags = tags if tags is not None else {}
+        self.stopped = list(stopped)
+        self.started = []
+        self.launched = []
+        self.stop_calls = []
+
+    def stopped_nodes(self, tag_filters):
+        return [
+            node_id for node_id in self.stopped
+            if all(self.tags[node_id].get(k) == v
+                   for k, v in tag_filters.items())
+        ]
+
+    def node_tags(self, node_id):
+        return self.tags[node_id]
+
+    def set_node_tags(self, node_id, tags):
+        self.tags[node_id].update(tags)
+
+    def flush_node_tags(self):
+        pass
+
+    def start_nodes(self, node_ids, tags):
+        for node_id in node_ids:
+            self.stopped.remove(node_id)
+            self.tags[node_id].update(tags)
+        self.started += node_ids
+
+    def create_node(self, node_config, tags, count):
+        node_ids = [
+            "i-new-{}".format(len(self.launched) + i) for i in range(count)
+        ]
+        for node_id in node_ids:
+            self.tags[node_id] = dict(tags)
+        self.launched += node_ids
+        return {node_id: None for node_id in node_ids}
+
+    def stop_nodes(self, node_ids):
+        self.stop_calls.append(list(node_ids))
+        self.stopped += [n for n in node_ids if n not in self.stopped]
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Returns a provider with one ready and one stale pool worker, and the
+    provider launching new workers."""
+    monkeypatch.setitem(commands.UPDATER_ENGINES, "thread",
+                        (FakeUpdater, FakeScheduler))
+    node_tags = commands._worker_node_tags(CONFIG)
+    runtime_hash, _ = commands._worker_runtime_hashes(CONFIG)
+    provider = FakeProvider(
+        tags={
+            "i-ready": dict(node_tags, **{TAG_RUNTIME_CONFIG: runtime_hash}),
+            "i-stale": dict(node_tags, **{TAG_RUNTIME_CONFIG: "old"}),
+        },
+        stopped=["i-ready", "i-stale"])
+    launcher = FakeProvider(tags=provider.tags)
+
+    def get_node_provider(provider_config, cluster_name):
+        assert provider_config["cache_stopped_nodes"] is False
+        return launcher
+
+    monkeypatch.setattr(commands, "_get_node_provider", get_node_provider)
+    return provider, launcher
+
+
+def test_fill_warm_pool_refreshes_stale_and_launches_missing(pool):
+    provider, launcher = pool
+    runtime_hash, _ = commands._worker_runtime_hashes(CONFIG)
+
+    commands.fill_warm_pool(CONFIG, 4, provider)
+
+    # The ready worker is left alone.
+    assert provider.started == ["i-stale"]
+    assert launcher.launched == ["i-new-0", "i-new-1"]
+    assert provider.stop_calls == [["i-ready", "i-stale", "i-new-0", "i-new-1"]]
+    for node_id in provider.stop_calls[0]:
+        assert provider.tags[node_id][TAG_RUNTIME_CONFIG] == runtime_hash
+
+
+def test_fill_warm_pool_when_full_only_waits_for_stop(pool):
+    provider, launcher = pool
+
+    commands.fill_warm_pool(dict(CONFIG, worker_setup_commands=[]), 1,
+                            provider)
+
+    # Both workers are stale with the new setup commands, only as many as
+    # the pool needs are started.
+    assert provider.started == ["i-ready"]
+    assert launcher.launched == []
+    assert provider.stop_calls == [["i-ready"]]
+
+    provider.started = []
+    provider.stop_calls = []
+    commands.fill_warm_pool(dict(CONFIG, worker_setup_commands=[]), 1,
+                            provider)
+    assert provider.started == []
+    assert provider.stop_calls == [["i-ready"]]
+
+
+def test_runtime_hash_ignores_cluster_size():
+    assert (commands._worker_runtime_hashes(CONFIG) ==
+            commands._worker_runtime_hashes(
+                dict(CONFIG, num_workers=10, warm_pool_size=3)))
+
+
+@pytest.mark.parametrize("config,supported", [
+    (CONFIG, True),
+    (dict(CONFIG, provider={"type": "gcp"}), False),
+    (dict(CONFIG, provider={
+        "type": "aws",
+        "cache_stopped_nodes": False
+    }), False),
+    (dict(
+        CONFIG,
+        worker_nodes={"InstanceMarketOptions": {
+            "MarketType": "spot"
+        }}), False),
+])
+def test_warm_pool_unsupported_reason(config, supported):
+    reason = commands._warm_pool_unsupported_reason(config)
+    assert (reason is None) == supported
+
+
+@pytest.fixture
+def aws_provider(make_aws_provider):
+    return make_aws_provider()
+
+
+def test_aws_stopped_nodes(aws_provider):
+    calls = []
+
+    def describe_instances(**kwargs):
+        calls.append(kwargs)
+        return [
+            NodeRecord("i-0", "stopping", None, None, None, {
+                "Name": "worker-0",
+                TAG_NODE_KIND: NODE_KIND_WORKER,
+            })
+        ]
+
+    aws_provider._describe_instances = describe_instances
+    assert aws_provider.stopped_nodes({
+        TAG_NODE_KIND: NODE_KIND_WORKER,
+        TAG_LAUNCH_CONFIG: "abc"
+    }) == ["i-0"]
+
+    filters = {f["Name"]: f["Values"] for f in calls[0]["Filters"]}
+    assert filters == {
+        "instance-state-name": ["stopped", "stopping"],
+        "tag:cls-cluster-name": ["test"],
+        "tag:" + TAG_NODE_KIND: [NODE_KIND_WORKER],
+        "tag:" + TAG_LAUNCH_CONFIG: ["abc"],
+    }
+    assert aws_provider.node_tags("i-0")[TAG_NODE_KIND] == NODE_KIND_WORKER
+
+    aws_provider.cache_stopped_nodes = False
+    assert aws_provider.stopped_nodes({}) == []
+
+
+class FakeWaiter:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def wait(self, InstanceIds):
+        self.calls.append(("wait", list(InstanceIds)))
+
+
+class FakeEC2Client:
+    def __init__(self):
+        self.calls = []
+
+    def get_waiter(self, name):
+        assert name == "instance_stopped"
+        return FakeWaiter(self.calls)
+
+    def start_instances(self, InstanceIds):
+        self.calls.append(("start", list(InstanceIds)))
+
+    def stop_instances(self, InstanceIds):
+        self.calls.append(("stop", list(InstanceIds)))
+
+
+def test_aws_start_and_stop_nodes(aws_provider):
+    client = FakeEC2Client()
+    aws_provider.ec2 = type("EC2", (), {
+        "meta": type("Meta", (), {"client": client})
+    })
+    aws_provider._describe_instances = lambda **kwargs: [
+        NodeRecord(node_id, state, None, None, None, {})
+        for node_id, state in [("i-0", "stopped"), ("i-1", "stopping")]
+    ]
+    aws_provider._update_node_tags = lambda pending: None
+
+    aws_provider.start_nodes(["i-0", "i-1"], {TAG_NODE_KIND: "worker"})
+    # Only the stopping node is waited for, and all start at once.
+    assert client.calls == [("wait", ["i-1"]), ("start", ["i-0", "i-1"])]
+    assert aws_provider.node_tags("i-1")[TAG_NODE_KIND] == "worker"
+
+    client.calls = []
+    aws_provider.stop_nodes(["i-0", "i-1"])
+    assert client.calls == [("stop", ["i-0", "i-1"]),
+                            ("wait", ["i-0", "i-1"])]
+
+
+def test_fill_warm_pool_starts_at_most_size_stale_workers(monkeypatch):
+    monkeypatch.setitem(commands.UPDATER_ENGINES, "thread",
+                        (FakeUpdater, FakeScheduler))
+    node_tags = commands._worker_node_tags(CONFIG)
+    stale = ["i-stale-{}".format(i) for i in range(10)]
+    provider = FakeProvider(
+        tags={
+            node_id: dict(node_tags, **{TAG_RUNTIME_CONFIG: "old"})
+            for node_id in stale
+        },
+        stopped=stale)
+
+    commands.fill_warm_pool(CONFIG, 2, provider)
+
+    assert provider.started == stale[:2]
+    assert provider.stop_calls == [stale[:2]]
+    assert sorted(provider.stopped) == sorted(stale)